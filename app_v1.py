@@ -1,8 +1,9 @@
 # Import necessary modules from the Flask framework and its extensions
 import os
+import secrets
 
 from flask_cors import CORS
-from flask import Flask, request, render_template, jsonify, redirect, url_for, flash
+from flask import Flask, request, render_template, jsonify, redirect, url_for, flash, session
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 from flask_wtf.csrf import CSRFProtect
@@ -11,6 +12,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import ValidationError, DataRequired, Email, EqualTo
 
+from workout_store import DEFAULT_ANON_TTL, DEFAULT_MAX_ANON, open_store
+
 # Create a Flask application instance
 # '__name__' is a special variable that gets as value the name of the Python script
 app = Flask(__name__, static_folder='static')
@@ -21,6 +24,11 @@ app.config['SECRET_KEY'] = 'poopy123megan'  # Make sure to set a secure secret k
 # Configure the maximum upload size (e.g., 16MB) and upload folder
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = 'static/uploads/'
+# Where the workout sessions live (see workout_store.py); unset means this app's database
+app.config['WORKOUT_STORE_URL'] = os.environ.get('WORKOUT_STORE_URL')
+app.config['WORKOUT_STORE_ANON_TTL'] = int(os.environ.get('WORKOUT_STORE_ANON_TTL', DEFAULT_ANON_TTL))
+app.config['WORKOUT_STORE_MAX_ANON'] = int(os.environ.get('WORKOUT_STORE_MAX_ANON', DEFAULT_MAX_ANON))
+app.config['PERMANENT_SESSION_LIFETIME'] = app.config['WORKOUT_STORE_ANON_TTL']
 
 # Ensure the upload folder exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -33,8 +41,22 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi'}
 #initialize the database
 db = SQLAlchemy(app)
 CORS(app)
-# Initialize an empty list to store workout data
-workout_sessions = {}
+
+# Workout sessions are kept in a shared store rather than in this process, so every worker sees them
+def workout_store():
+    if 'workout_store' not in app.extensions:
+        app.extensions['workout_store'] = open_store(app.config['WORKOUT_STORE_URL'], engine=db.engine,
+                                                     anon_ttl=app.config['WORKOUT_STORE_ANON_TTL'],
+                                                     max_anon=app.config['WORKOUT_STORE_MAX_ANON'])
+    return app.extensions['workout_store']
+
+# Whose workouts this request sees: the visitor's cookie session. This app has no
+# working login, so every owner is anonymous and expires with WORKOUT_STORE_ANON_TTL.
+def workout_owner():
+    if 'anon_id' not in session:
+        session['anon_id'] = secrets.token_urlsafe(16)
+        session.permanent = True  # keep the cookie as long as the store keeps their workouts
+    return f"anon:{session['anon_id']}"
 
 # login page
 class User(db.Model):
@@ -130,6 +152,9 @@ def upload_file():
 # Define a route for the homepage, which can handle both GET and POST requests
 @app.route('/', methods=['GET', 'POST'])
 def home():
+    store = workout_store()
+    owner = workout_owner()
+    store.touch(owner)
     if request.method == 'POST':
         session_title = request.form['session_title'].strip()
         workout = {
@@ -138,13 +163,9 @@ def home():
             'reps': int(request.form['reps']),
             'rest': int(request.form['rest'])
         }
-        if session_title not in workout_sessions:
-            workout_sessions[session_title] = []
-        workout_sessions[session_title].append(workout)
-        
-        print("Added workout:", workout)  # Print workout to verify data
+        store.add_exercise(owner, session_title, workout)
 
-    return render_template('home.html', workout_sessions=workout_sessions)
+    return render_template('home.html', workout_sessions=store.sessions(owner))
 
 
 @app.route('/start-workout/<session_title>', methods=['GET'])
@@ -154,10 +175,11 @@ def start_workout(session_title):
     return redirect(url_for('workout_session', session_title=session_title))
 
 
-@app.route('/workout-session/<session_title>', methods=['GET', 'POST'])
 @app.route('/workout-session/<session_title>', methods=['GET', 'POST'])
 def workout_session(session_title):
-    workouts = workout_sessions.get(session_title, [])
+    owner = workout_owner()
+    workout_store().touch(owner)
+    workouts = workout_store().session(owner, session_title)
     # Check for additional POST handling if needed
     if request.method == 'POST' and 'file' in request.files:
         file = request.files['file']
@@ -173,19 +195,23 @@ def workout_session(session_title):
 
 @app.route('/delete-session/<session_title>', methods=['POST'])
 def delete_session(session_title):
-    if session_title in workout_sessions:
-        del workout_sessions[session_title]  # Delete the entire session
+    if workout_store().delete_session(workout_owner(), session_title):
         flash('Session deleted successfully')
     else:
         flash('Session not found', 'error')
     return redirect(url_for('home'))  # Redirect back to the home page after deletion
 
 
+# Old bookmarkable delete link. Positions no longer identify exercises (and a GET
+# shouldn't delete anything), so it just opens the session to delete from there.
 @app.route('/delete-workout/<session_title>/<int:workout_index>')
-@app.route('/delete-exercise/<session_title>/<int:exercise_index>', methods=['POST'])
-def delete_exercise(session_title, exercise_index):
-    if session_title in workout_sessions and 0 <= exercise_index < len(workout_sessions[session_title]):
-        del workout_sessions[session_title][exercise_index]
+def delete_workout(session_title, workout_index):
+    return redirect(url_for('workout_session', session_title=session_title))
+
+
+@app.route('/delete-exercise/<session_title>/<int:exercise_id>', methods=['POST'])
+def delete_exercise(session_title, exercise_id):
+    if workout_store().delete_exercise(workout_owner(), session_title, exercise_id):
         # Optionally, flash a message to confirm deletion
         flash('Exercise deleted successfully', 'success')
     else:
@@ -0,0 +1,219 @@
+"""ASGI entry point: connections live on an event loop, views borrow threads.
+
+    uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 5001
+
+Under a WSGI server each open connection owns a worker thread until it
+closes, so a few hundred slow uploads or idle change streams use up every
+thread a worker has. This serves the same Flask app (routes, hooks, models and
+config all unchanged) from an asyncio loop instead, and only takes a thread
+from a pool of ASGI_THREADS while application code actually runs:
+
+* Request bodies are received on the loop and spooled (to disk past
+  ASGI_SPOOL_SIZE bytes) before the view is called, so a slow upload or
+  import costs a socket while it trickles in, not a thread.
+* Response bodies are produced in the pool a chunk at a time and written from
+  the loop, so a slow reader doesn't hold a thread while its socket drains.
+* A view can hand the loop an async body to send once it has returned, via
+  ``request.environ[ASGI_ENVIRON_KEY]`` (an ``AsgiRequest``). The SSE change
+  stream does, so an idle stream holds no thread at all between polls.
+
+The views themselves stay synchronous Flask views; only the change stream
+has an async part. Check-session, the workout lists, uploads and imports each
+take a pool thread for the length of the view call, once their body is in.
+A slow client still costs no thread, since what held one under WSGI was
+waiting on the socket, and async versions of these views would need an async
+database layer and auth that Flask-SQLAlchemy and flask-jwt-extended don't
+have.
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+
+ASGI_ENVIRON_KEY = 'workout_api.asgi'
+
+
+class Disconnected(Exception):
+    pass
+
+
+class AsgiRequest:
+    """What a view finds at ``request.environ[ASGI_ENVIRON_KEY]`` when served by this module."""
+
+    def __init__(self, app, pool):
+        self.app = app
+        self.pool = pool
+        self.body = None
+
+    def stream(self, body):
+        """Send ``body``, an async iterable of str or bytes, from the event loop after the view returns.
+
+        The view's own response then only supplies the status and headers.
+        """
+        self.body = body
+
+    async def run_sync(self, fn, *args):
+        """Run ``fn(*args)`` in the view pool inside an app context, e.g. a query for an async body."""
+        def call():
+            with self.app.app_context():
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, call)
+
+
+def wsgi_environ(scope, body, length):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(length),  # also set for chunked bodies, which are spooled whole
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        if b'_' in name:
+            continue  # would be indistinguishable from a dash once in the environ, as gunicorn does
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key == 'CONTENT_LENGTH':
+            continue
+        if key != 'CONTENT_TYPE':
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    def __init__(self, app):
+        self.app = app
+        self.pool = ThreadPoolExecutor(app.config['ASGI_THREADS'], thread_name_prefix='asgi-view')
+        self.spool_size = app.config['ASGI_SPOOL_SIZE']
+        # Nothing the app accepts is larger; each view still applies its own, lower limit
+        self.max_body = max(app.config['MAX_CONTENT_LENGTH'], app.config['IMPORT_MAX_LENGTH'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        # Websockets aren't served; the server refuses them when the app returns
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, scope, receive):
+        body = tempfile.SpooledTemporaryFile(self.spool_size)
+        declared = dict(scope['headers']).get(b'content-length')
+        if declared and declared.isdigit() and int(declared) > self.max_body:
+            return body, int(declared)  # not read at all: the view's limit check answers 413
+        length = 0
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise Disconnected()
+            chunk = message.get('body', b'')
+            length += len(chunk)
+            if length > self.max_body:
+                break  # the length passed on is over every limit, so the view rejects it unread
+            body.write(chunk)
+            more = message.get('more_body', False)
+        body.seek(0)
+        return body, length
+
+    def start(self, environ):
+        """Call the WSGI app; returns the status, headers, iterable and its first chunk."""
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        iterable = self.app(environ, start_response)
+        chunks = iter(iterable)
+        first = next(chunks, None)  # start_response may wait for the first chunk
+        return started[0], started[1], iterable, chunks, first
+
+    async def http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        try:
+            body, length = await self.read_body(scope, receive)
+        except Disconnected:
+            return
+        with body:
+            request = AsgiRequest(self.app, self.pool)
+            environ = wsgi_environ(scope, body, length)
+            environ[ASGI_ENVIRON_KEY] = request
+            # Every call for this request runs in one context, so stream_with_context
+            # can push a request context in one pool thread and pop it in another
+            context = contextvars.copy_context()
+            status, headers, iterable, chunks, first = await loop.run_in_executor(
+                self.pool, context.run, self.start, environ)
+            if request.body is not None:
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+            await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in headers]})
+            disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+            try:
+                if request.body is None:
+                    chunk = first
+                    while chunk is not None and not disconnected.done():
+                        if chunk:
+                            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                        chunk = await loop.run_in_executor(self.pool, context.run, next, chunks, None)
+                else:
+                    sending = asyncio.ensure_future(self.send_async_body(request.body, send))
+                    await asyncio.wait({sending, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                    if not sending.done():
+                        sending.cancel()
+                    await asyncio.gather(sending, return_exceptions=True)
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            finally:
+                disconnected.cancel()
+                if hasattr(iterable, 'close'):
+                    # Lets stream_with_context pop its context and the session go back to the pool
+                    await loop.run_in_executor(self.pool, context.run, iterable.close)
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        # Body chunks can still arrive when the view didn't read them all (e.g. it answered 413
+        # to an oversized upload); those are discarded, only a disconnect ends the response early
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_async_body(self, body, send):
+        try:
+            async for chunk in body:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await body.aclose()
+
+
+def create_asgi_app(config=None):
+    return AsgiApp(create_app(config))
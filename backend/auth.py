@@ -0,0 +1,175 @@
+"""Accounts and sessions: registration, login, JWT identity and admission control.
+
+Logins and registrations are rate limited per client address, and workout
+writes per user (see ratelimit.py); ``write_endpoint`` is the decorator the
+write views use for both the limit and a write slot.
+"""
+import time
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, jwt_required
+from flask_login import UserMixin, logout_user
+
+from extensions import db, jwt, login_manager, password_hasher, rate_limiter, request_metrics, user_cache, write_slots
+from models import User
+from passwords import HashPoolBusy
+from ratelimit import Overloaded, RateLimited
+from sharding import use_user_shard
+
+auth = Blueprint('auth', __name__)
+
+request_metrics.registry.describe('http_rejected_total', 'counter',
+                                  'Requests turned away by rate or concurrency limits')
+
+@jwt.user_identity_loader
+def user_identity(user_id):
+    # PyJWT rejects non-string subjects, so ids go into tokens as strings
+    return str(user_id)
+
+def jwt_user_id():
+    # Every view that reads the user's data asks for their id first, so this is
+    # where the session gets pointed at the database holding it
+    user_id = int(get_jwt_identity())
+    use_user_shard(user_id)
+    return user_id
+
+# Identity lookups (flask-login, check-session) go through a per-process cache of
+# plain user snapshots rather than hitting the user table on every request.
+class CachedUser(UserMixin):
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username, 'email': self.email}
+
+def cached_user(user_id):
+    user = user_cache.get(user_id)
+    if user is None:
+        row = db.session.get(User, user_id)
+        if row is None:
+            return None
+        user = CachedUser(row.id, row.username, row.email)
+        user_cache.set(user_id, user)
+    return user
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    user_cache.pop(user.id)
+
+def issue_token(user):
+    # username/email ride along as claims so check-session can answer from the token alone
+    return create_access_token(identity=user.id, additional_claims={'username': user.username, 'email': user.email})
+
+@auth.app_errorhandler(HashPoolBusy)
+def password_hasher_busy(error):
+    # Too many logins/registrations in flight; shed load instead of queueing
+    response = jsonify({'message': 'Too many login attempts in progress, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def client_identity():
+    # Signed-in callers are limited per user, everyone else per address
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:  # the view doesn't verify a JWT
+        user_id = None
+    return f'user:{user_id}' if user_id else f'ip:{request.remote_addr}'
+
+def count_rejection(reason):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_metrics.registry.inc('http_rejected_total', (('route', route), ('method', request.method),
+                                                         ('reason', reason)))
+
+@auth.app_errorhandler(RateLimited)
+def rate_limited(error):
+    count_rejection('rate_limit')
+    response = jsonify({'message': 'Too many requests, please slow down'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@auth.app_errorhandler(Overloaded)
+def overloaded(error):
+    # Every write slot stayed busy for WRITE_CONCURRENCY_WAIT; shed load instead of queueing
+    count_rejection('concurrency')
+    response = jsonify({'message': 'Server is busy, please retry'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def write_endpoint(setting, methods=None):
+    """Rate limit per caller (``app.config[setting]``), then admit into one of the worker's write slots."""
+    def decorator(view):
+        return rate_limiter.limit(setting, client_identity, methods)(write_slots.guard(methods)(view))
+    return decorator
+
+@login_manager.user_loader
+def load_user(user_id):
+    return cached_user(int(user_id))
+
+@auth.route('/api/register', methods=['POST'])
+@write_endpoint('RATE_LIMIT_REGISTER')
+def register():
+    data = request.get_json()
+    if not data or not data.get('username') or not data.get('email') or not data.get('password'):
+        return jsonify({'message': 'Missing required fields'}), 400
+    
+    user = User.query.filter_by(username=data['username']).first()
+    if user:
+        return jsonify({'message': 'Username already exists'}), 400
+    
+    new_user = User(username=data['username'], email=data['email'])
+    new_user.set_password(data['password'])
+    db.session.add(new_user)
+    db.session.commit()
+    
+    access_token = issue_token(new_user)
+    return jsonify({'message': 'User registered successfully', 'token': access_token}), 201
+
+
+@auth.route('/api/login', methods=['POST'])
+@rate_limiter.limit('RATE_LIMIT_LOGIN', client_identity)
+def login():
+    data = request.get_json()
+    if not data or not data.get('username') or not data.get('password'):
+        return jsonify({'message': 'Missing required fields'}), 400
+    
+    user = User.query.filter_by(username=data['username']).first()
+    if user and user.check_password(data['password']):
+        if password_hasher.needs_rehash(user.password_hash):
+            user.set_password(data['password'])
+            db.session.commit()
+        access_token = issue_token(user)
+        return jsonify({'message': 'Logged in successfully', 'token': access_token}), 200
+    
+    return jsonify({'message': 'Invalid username or password'}), 401
+
+@auth.route('/api/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    logout_user()
+    return jsonify({'message': 'Logged out successfully'}), 200
+
+
+@auth.route('/api/check-session', methods=['GET'])
+@jwt_required(optional=True)
+def check_session():
+    if not get_jwt_identity():
+        return jsonify({'isAuthenticated': False}), 200
+
+    claims = get_jwt()
+    if 'username' in claims:
+        user = CachedUser(jwt_user_id(), claims['username'], claims.get('email'))
+    else:
+        # Tokens issued before the claims were added
+        user = cached_user(jwt_user_id())
+        if user is None:
+            return jsonify({'isAuthenticated': False}), 200
+
+    response = {'isAuthenticated': True, 'user': user.to_dict()}
+    # Only hand out a fresh token once the current one is about to expire
+    expires = claims.get('exp')
+    if 'username' not in claims or (expires and expires - time.time() < current_app.config['JWT_REFRESH_WINDOW']):
+        response['token'] = issue_token(user)
+    return jsonify(response), 200
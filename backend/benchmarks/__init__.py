@@ -0,0 +1 @@
+"""Benchmarks for the workout API. Run them from backend/ with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,305 @@
+"""Load test for the workout API, in-process and over a local WSGI server.
+
+Seeds a fresh SQLite database with USERS x SESSIONS x EXERCISES workouts
+through the app's own endpoints, then drives every scenario below with
+CONCURRENCY client threads for DURATION seconds each:
+
+* ``inprocess``: Flask's test client, i.e. the app's own cost without HTTP.
+* ``wsgi``: a threaded Werkzeug server on localhost, requests over real sockets.
+
+Per scenario it reports requests/sec and p50/p95/p99 latency; ``--output``
+writes everything to a JSON file together with the commit and machine it ran on.
+Pass an earlier file to ``--compare`` to print the difference; with
+``--fail-over PCT`` the run exits non-zero when any p95 got more than PCT%
+slower, so it can gate a change.
+
+    python -m benchmarks.api_load --users 20 --sessions 10 --exercises 8 \\
+        --duration 5 --concurrency 8 --output bench.json
+    python -m benchmarks.api_load ... --compare bench.json --fail-over 20
+"""
+import argparse
+import datetime
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import add_output_argument, latency_summary, output_path, run_metadata, write_results
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def load_app(workdir, hash_method, rate_limits=False):
+    """Create the app against a scratch database and upload folder."""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if not rate_limits:
+        os.environ['RATE_LIMIT_ENABLED'] = '0'  # a handful of bench users would hit them within a second
+    if hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = hash_method
+    os.chdir(workdir)  # UPLOAD_FOLDER is relative to the working directory
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+def seed(client, users, sessions, exercises):
+    """Create users and their workouts via the API; returns [(username, token, [session titles])]."""
+    accounts = []
+    today = datetime.date.today()
+    for u in range(users):
+        username = f'bench{u}'
+        response = client.post('/api/register', json={
+            'username': username, 'email': f'{username}@example.com', 'password': 'bench-password'})
+        token = response.get_json()['token']
+        titles = [f'Session {s}' for s in range(sessions)]
+        # One session a week going back from today
+        rows = [{'session_title': title, 'exercise': f'Exercise {e}', 'sets': 3 + e % 3, 'reps': 8 + e % 5,
+                 'rest': 60 + 15 * (e % 4), 'weight': 20 + 5 * e + s,
+                 'date': (today - datetime.timedelta(weeks=s)).isoformat()}
+                for s, title in enumerate(titles) for e in range(exercises)]
+        for start in range(0, len(rows), 5000):
+            client.post('/api/workouts/bulk', json=rows[start:start + 5000],
+                        headers={'Authorization': f'Bearer {token}'})
+        accounts.append((username, token, titles))
+    return accounts
+
+
+def scenarios(accounts):
+    """name -> fn(rng) returning (method, path, body, headers, expected statuses)."""
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def account(rng):
+        username, token, titles = rng.choice(accounts)
+        return username, {'Authorization': f'Bearer {token}'}, titles
+
+    def json_body(data):
+        return json.dumps(data).encode(), {'Content-Type': 'application/json'}
+
+    def list_all(rng):
+        _, headers, _ = account(rng)
+        return 'GET', '/api/workouts', None, headers, {200}
+
+    def list_page(rng):
+        _, headers, _ = account(rng)
+        return 'GET', '/api/workouts?limit=100', None, headers, {200}
+
+    def session_detail(rng):
+        _, headers, titles = account(rng)
+        return 'GET', '/api/workouts/' + titles[rng.randrange(len(titles))].replace(' ', '%20'), None, headers, {200}
+
+    def session_list(rng):
+        _, headers, _ = account(rng)
+        return 'GET', '/api/sessions', None, headers, {200}
+
+    def analytics(rng):
+        _, headers, _ = account(rng)
+        return 'GET', '/api/analytics?exercise=Exercise%200&period=week', None, headers, {200}
+
+    def create_workout(rng):
+        _, headers, titles = account(rng)
+        body, extra = json_body({'session_title': rng.choice(titles), 'exercise': 'Bench press',
+                                 'sets': 3, 'reps': 10, 'rest': 90})
+        return 'POST', '/api/workouts', body, dict(headers, **extra), {201}
+
+    def login(rng):
+        username, _, _ = account(rng)
+        body, headers = json_body({'username': username, 'password': 'bench-password'})
+        return 'POST', '/api/login', body, headers, {200}
+
+    def register(rng):
+        with lock:
+            n = next(counter)
+        name = f'new{os.getpid()}x{n}'
+        body, headers = json_body({'username': name, 'email': f'{name}@example.com', 'password': 'bench-password'})
+        return 'POST', '/api/register', body, headers, {201}
+
+    def upload(rng):
+        boundary = 'benchboundary'
+        payload = random_png(rng)
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="bench.png"\r\n'
+                f'Content-Type: image/png\r\n\r\n').encode() + payload + f'\r\n--{boundary}--\r\n'.encode()
+        return 'POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}, {201}
+
+    return {
+        'GET /api/workouts': list_all,
+        'GET /api/workouts?limit=100': list_page,
+        'GET /api/workouts/<session>': session_detail,
+        'GET /api/sessions': session_list,
+        'GET /api/analytics': analytics,
+        'POST /api/workouts': create_workout,
+        'POST /api/login': login,
+        'POST /api/register': register,
+        'POST /upload': upload,
+    }
+
+
+def random_png(rng, size=64):
+    """A noise image, so every upload is a new file rather than a dedup hit."""
+    pixels = rng.randbytes(size * size * 3)
+    if Image is None:
+        return b'\x89PNG\r\n\x1a\n' + pixels  # stored fine; renditions just fail to decode
+    out = io.BytesIO()
+    Image.frombytes('RGB', (size, size), pixels).save(out, 'PNG')
+    return out.getvalue()
+
+
+class InProcessTransport:
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body, headers):
+        client = self.app.test_client()
+        response = client.open(path, method=method, data=body, headers=headers)
+        response.get_data()  # drain streamed bodies
+        return response.status_code
+
+
+class WSGITransport:
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no per-request access log
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self, method, path, body, headers):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_scenario(transport, make_request, duration, concurrency, seed_value):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            method, path, body, headers, expected = make_request(rng)
+            started = time.perf_counter()
+            try:
+                ok = transport.request(method, path, body, headers) in expected
+            except (OSError, http.client.HTTPException):
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency_summary(latencies, time.perf_counter() - started, errors[0])
+
+
+def compare(previous, current, fail_over):
+    regressions = []
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+    for mode, results in current['results'].items():
+        for name, now in results.items():
+            before = previous['results'].get(mode, {}).get(name)
+            if not before or not before['p95_ms']:
+                continue
+            p95_change = 100 * (now['p95_ms'] - before['p95_ms']) / before['p95_ms']
+            rps_change = 100 * (now['rps'] - before['rps']) / before['rps'] if before['rps'] else 0.0
+            print(f'  {mode:>9} {name:<30} p95 {p95_change:+6.1f}%  rps {rps_change:+6.1f}%')
+            if fail_over is not None and p95_change > fail_over:
+                regressions.append((mode, name, p95_change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--sessions', type=int, default=10, help='sessions per user')
+    parser.add_argument('--exercises', type=int, default=8, help='exercises per session')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mode', choices=['inprocess', 'wsgi', 'both'], default='both')
+    parser.add_argument('--scenario', action='append', help='only run scenarios containing this text')
+    parser.add_argument('--hash-method', help='PASSWORD_HASH_METHOD to run with (default: the app default)')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='keep the rate limits on (rejections then count as errors)')
+    parser.add_argument('--seed', type=int, default=1)
+    add_output_argument(parser)
+    parser.add_argument('--compare', help='earlier results file to diff against')
+    parser.add_argument('--fail-over', type=float, help='exit 1 if any p95 regressed by more than this percent')
+    args = parser.parse_args()
+
+    output = output_path(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    sys.path.insert(0, os.getcwd())
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = load_app(workdir, args.hash_method, args.rate_limits)
+        started = time.perf_counter()
+        accounts = seed(app.test_client(), args.users, args.sessions, args.exercises)
+        print(f'Seeded {args.users} users x {args.sessions} sessions x {args.exercises} exercises '
+              f'in {time.perf_counter() - started:.1f}s')
+
+        modes = ['inprocess', 'wsgi'] if args.mode == 'both' else [args.mode]
+        all_scenarios = scenarios(accounts)
+        selected = {name: fn for name, fn in all_scenarios.items()
+                    if not args.scenario or any(text in name for text in args.scenario)}
+        report = {
+            'meta': run_metadata({k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'fail_over')}),
+            'results': {},
+        }
+        for mode in modes:
+            transport = InProcessTransport(app) if mode == 'inprocess' else WSGITransport(app)
+            report['results'][mode] = {}
+            for name, make_request in selected.items():
+                result = run_scenario(transport, make_request, args.duration, args.concurrency, args.seed)
+                report['results'][mode][name] = result
+                print(f"{mode:>9} {name:<30} {result['rps']:>8} req/s  p50 {result['p50_ms']:>8}ms  "
+                      f"p95 {result['p95_ms']:>8}ms  p99 {result['p99_ms']:>8}ms  {result['errors']} errors")
+            if mode == 'wsgi':
+                transport.close()
+        from extensions import media_worker
+        media_worker.shutdown()
+
+    write_results(output, report)
+
+    if baseline:
+        regressions = compare(baseline, report, args.fail_over)
+        if regressions:
+            print(f'{len(regressions)} scenario(s) regressed by more than {args.fail_over}% at p95')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
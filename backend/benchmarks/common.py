@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark scripts."""
+import json
+import os
+import platform
+import subprocess
+import time
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples`` (seconds in, seconds out)."""
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def latency_summary(latencies, duration, errors=0):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1) if duration else 0.0,
+        'p50_ms': round(1000 * percentile(latencies, 50), 2),
+        'p95_ms': round(1000 * percentile(latencies, 95), 2),
+        'p99_ms': round(1000 * percentile(latencies, 99), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_metadata(params):
+    """What a results file records about the run: commit, time, interpreter and machine."""
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': params,
+    }
+
+
+def add_output_argument(parser):
+    parser.add_argument('--output', help='also write the results to this JSON file')
+
+
+def output_path(args):
+    # Resolved up front, since some benchmarks change directory while they run
+    return os.path.abspath(args.output) if args.output else None
+
+
+def write_results(path, report):
+    """Write ``report`` to ``path`` as JSON, if a path was given."""
+    if path:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {path}')
@@ -0,0 +1,267 @@
+"""Concurrent-connection capacity and memory per connection, WSGI vs ASGI.
+
+Starts the API in a subprocess under each server, against a scratch database:
+
+* ``wsgi``: ``flask run`` as in the Dockerfile (Werkzeug, a thread per
+  connection), or with ``--wsgi gunicorn`` one gunicorn gthread worker with
+  ``--threads`` threads.
+* ``asgi``: ``uvicorn --factory asgi:create_asgi_app``, one process; skipped
+  when uvicorn isn't installed.
+
+Against each it opens long-lived connections in steps of STEP up to
+CONNECTIONS, of one of two kinds:
+
+* ``stream``: an idle change stream (``/api/changes/stream``), open once its
+  response headers and first event have arrived.
+* ``upload``: an ``/api/import`` that sends its headers and first line, then
+  nothing more, like a client on a slow link.
+
+After each step it records how many connections are open, how many were
+refused or timed out, the server's RSS (all its processes) and the growth per
+open connection, and the latency of ``/api/check-session`` requests made
+meanwhile, i.e. whether the server still answers anyone else. ``--output``
+also writes the results to a JSON file.
+
+    python -m benchmarks.connections --connections 2000 --step 500 --kind stream
+    python -m benchmarks.connections --wsgi gunicorn --threads 32 --kind upload
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_output_argument, latency_summary, output_path, run_metadata, write_results
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def raise_fd_limit():
+    # Each connection is a descriptor on both ends; the servers inherit the limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def prepare_database(workdir):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    with create_app().app_context():
+        db.create_all()
+        upgrade(db.engine)
+
+
+def server_command(server, port, wsgi, threads):
+    if server == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_asgi_app', '--port', str(port),
+                '--log-level', 'warning', '--backlog', '4096']
+    if wsgi == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-w', '1', '-k', 'gthread', '--threads', str(threads),
+                '-b', f'127.0.0.1:{port}', '--backlog', '4096', '--log-level', 'warning', 'app:create_app()']
+    return [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--no-reload']
+
+
+def process_tree(pid):
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            for child in f.read().split():
+                pids.extend(process_tree(int(child)))
+    return pids
+
+
+def rss_mb(pid):
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            pass  # exited meanwhile
+    return total / 1024
+
+
+async def request(port, raw, timeout):
+    """Send a raw HTTP/1.1 request; returns the raw response, read to EOF."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(raw)
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return data
+
+
+async def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await request(port, b'GET /api/check-session HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n', 2)
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    sys.exit(f'Server on port {port} did not come up')
+
+
+async def register(port):
+    body = json.dumps({'username': 'bench', 'email': 'bench@example.com', 'password': 'bench-password'}).encode()
+    head = (b'POST /api/register HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n'
+            b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body))
+    data = await request(port, head + body, 30)
+    head, _, payload = data.partition(b'\r\n\r\n')
+    if b' 201 ' not in head.split(b'\r\n', 1)[0]:
+        sys.exit(f'Register failed: {head[:200]}')
+    return json.loads(payload)['token']
+
+
+async def open_connection(port, kind, token, timeout):
+    """One long-lived connection; returns its writer once it counts as open, or None."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    if kind == 'stream':
+        writer.write(f'GET /api/changes/stream?jwt={token} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+        try:
+            data = b''
+            while b'retry:' not in data:
+                chunk = await asyncio.wait_for(reader.read(4096), timeout)
+                if not chunk:
+                    break
+                data += chunk
+        except (OSError, asyncio.TimeoutError):
+            data = b''
+        if b' 200 ' not in data.split(b'\r\n', 1)[0] or b'retry:' not in data:
+            writer.close()
+            return None
+    else:
+        first = b'session_title,exercise,sets,reps,rest,date,weight\n'
+        writer.write(f'POST /api/import HTTP/1.1\r\nHost: bench\r\nAuthorization: Bearer {token}\r\n'
+                     f'Content-Type: text/csv\r\nContent-Length: 1000000\r\n\r\n'.encode() + first)
+        try:
+            await asyncio.wait_for(writer.drain(), timeout)
+        except (OSError, asyncio.TimeoutError):
+            writer.close()
+            return None
+    return writer
+
+
+async def probe(port, token, count, timeout):
+    raw = (f'GET /api/check-session HTTP/1.1\r\nHost: bench\r\nAuthorization: Bearer {token}\r\n'
+           f'Connection: close\r\n\r\n').encode()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(count):
+        sent = time.perf_counter()
+        try:
+            data = await request(port, raw, timeout)
+            if b' 200 ' not in data.split(b'\r\n', 1)[0]:
+                raise OSError(data[:100])
+            latencies.append(time.perf_counter() - sent)
+        except (OSError, asyncio.TimeoutError):
+            errors += 1
+    return latency_summary(latencies, time.perf_counter() - started, errors)
+
+
+async def run_server(server, args, workdir):
+    port = free_port()
+    log = open(os.path.join(workdir, f'{server}.log'), 'w')
+    process = subprocess.Popen(server_command(server, port, args.wsgi, args.threads), cwd=BACKEND,
+                               stdout=log, stderr=subprocess.STDOUT)
+    writers, steps = [], []
+    try:
+        await wait_ready(port)
+        token = await register(port)
+        await asyncio.sleep(1)
+        idle_mb = rss_mb(process.pid)
+        print(f'{server}: idle RSS {idle_mb:.1f}MB')
+        print(f"{'open':>7} {'refused':>8} {'rss':>9} {'per conn':>10} {'probe p50':>10} {'p95':>9} {'errors':>7}")
+        target = 0
+        while target < args.connections:
+            target = min(args.connections, target + args.step)
+            opened = await asyncio.gather(*(open_connection(port, args.kind, token, args.timeout)
+                                            for _ in range(target - len(writers))))
+            writers.extend(writer for writer in opened if writer is not None)
+            refused = sum(writer is None for writer in opened)
+            await asyncio.sleep(args.settle)
+            rss = rss_mb(process.pid)
+            step = {
+                'target': target,
+                'open': len(writers),
+                'refused': refused,
+                'rss_mb': round(rss, 1),
+                'kb_per_connection': round(1024 * (rss - idle_mb) / len(writers), 1) if writers else None,
+                'probe': await probe(port, token, args.probes, args.timeout),
+            }
+            steps.append(step)
+            print(f"{step['open']:>7} {refused:>8} {step['rss_mb']:>7}MB {step['kb_per_connection'] or 0:>8}KB "
+                  f"{step['probe']['p50_ms']:>8}ms {step['probe']['p95_ms']:>7}ms {step['probe']['errors']:>7}")
+            if process.poll() is not None:
+                print(f'{server} exited with {process.returncode}, see {log.name}')
+                break
+        return {'idle_rss_mb': round(idle_mb, 1), 'steps': steps}
+    finally:
+        for writer in writers:
+            writer.close()
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--step', type=int, default=500)
+    parser.add_argument('--kind', choices=['stream', 'upload'], default='stream')
+    parser.add_argument('--servers', default='wsgi,asgi', help='comma-separated: wsgi, asgi')
+    parser.add_argument('--wsgi', choices=['flask', 'gunicorn'], default='flask', help='server for the WSGI run')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a connection counts as refused')
+    parser.add_argument('--settle', type=float, default=2, help='seconds to wait after each step before measuring')
+    parser.add_argument('--probes', type=int, default=20, help='check-session requests timed per step')
+    add_output_argument(parser)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    output = output_path(args)
+    fd_limit = raise_fd_limit()
+    if fd_limit < 2 * args.connections + 100:
+        print(f'Warning: the descriptor limit ({fd_limit}) is too low for {args.connections} connections')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_database(workdir)
+        for server in args.servers.split(','):
+            module = 'uvicorn' if server == 'asgi' else 'gunicorn' if args.wsgi == 'gunicorn' else 'flask'
+            if importlib.util.find_spec(module) is None:
+                print(f'{server}: skipped, {module} is not installed')
+                continue
+            results[server] = asyncio.run(run_server(server, args, workdir))
+
+    params = {'connections': args.connections, 'step': args.step, 'kind': args.kind, 'wsgi': args.wsgi,
+              'threads': args.threads, 'fd_limit': fd_limit}
+    report = {'meta': run_metadata(params), 'results': results}
+    write_results(output, report)
+
+
+if __name__ == '__main__':
+    main()
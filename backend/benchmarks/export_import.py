@@ -0,0 +1,116 @@
+"""Round-trip a large account through /api/import and /api/export.
+
+Writes ROWS workouts to a CSV file, streams it into /api/import, exports the
+account again as CSV and NDJSON, and checks the export has every row. Each
+step reports rows/sec and the process's peak RSS, which should stay flat
+however many rows there are: the import is parsed and committed a batch at a
+time and the exports come off a server-side cursor. ``--output`` also writes
+the results to a JSON file.
+
+    python -m benchmarks.export_import --rows 1000000 --output transfer.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_output_argument, output_path, run_metadata, write_results
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KiB on Linux
+
+
+def write_csv(path, rows):
+    today = datetime.date.today()
+    with open(path, 'w') as f:
+        f.write('session_title,exercise,sets,reps,rest,date,weight\n')
+        for i in range(rows):
+            day = today - datetime.timedelta(days=i % 1000)
+            f.write(f'Session {i % 50},Exercise {i % 60},{3 + i % 3},{8 + i % 5},{60 + 15 * (i % 4)},'
+                    f'{day.isoformat()},{20 + i % 80}\n')
+
+
+def load_app(workdir):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.chdir(workdir)
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+def timed(name, rows, fn):
+    started = time.perf_counter()
+    detail = fn()
+    elapsed = time.perf_counter() - started
+    result = dict(seconds=round(elapsed, 2), rows_per_sec=round(rows / elapsed), peak_rss_mb=peak_rss_mb(), **detail)
+    print(f"{name:<14} {result['seconds']:>8}s {result['rows_per_sec']:>9} rows/s  peak RSS {result['peak_rss_mb']}MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    add_output_argument(parser)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    output = output_path(args)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'import.csv')
+        write_csv(source, args.rows)
+        app = load_app(workdir)
+        client = app.test_client()
+        token = client.post('/api/register', json={
+            'username': 'bench', 'email': 'bench@example.com', 'password': 'bench-password'}).get_json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        results['baseline'] = {'peak_rss_mb': peak_rss_mb()}
+        print(f"{'baseline':<14} peak RSS {results['baseline']['peak_rss_mb']}MB")
+
+        def run_import():
+            with open(source, 'rb') as f:
+                response = client.post('/api/import', headers=headers, input_stream=f, content_type='text/csv',
+                                       content_length=os.path.getsize(source), buffered=False)
+                lines = [line for chunk in response.response for line in chunk.splitlines() if line]
+                response.close()
+            summary = json.loads(lines[-1])
+            if summary.get('error') or summary['imported'] != args.rows:
+                sys.exit(f'Import failed: {summary}')
+            return {'progress_lines': len(lines)}
+
+        def run_export(export_format):
+            def export():
+                response = client.get(f'/api/export?format={export_format}', headers=headers, buffered=False)
+                size = lines = 0
+                for chunk in response.response:
+                    size += len(chunk)
+                    lines += chunk.count(b'\n')
+                response.close()
+                expected = args.rows + (1 if export_format == 'csv' else 0)  # the CSV header
+                if lines != expected:
+                    sys.exit(f'{export_format} export has {lines} lines, expected {expected}')
+                return {'bytes': size}
+            return export
+
+        results['import_csv'] = timed('import csv', args.rows, run_import)
+        results['export_csv'] = timed('export csv', args.rows, run_export('csv'))
+        results['export_ndjson'] = timed('export ndjson', args.rows, run_export('ndjson'))
+
+    report = {'meta': run_metadata({'rows': args.rows}), 'results': results}
+    write_results(output, report)
+
+
+if __name__ == '__main__':
+    main()
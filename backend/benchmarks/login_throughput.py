@@ -0,0 +1,82 @@
+"""Login throughput at different password-hash cost settings.
+
+For each method, C concurrent clients log in repeatedly through a
+PasswordHasher sized like the app's (PASSWORD_HASH_WORKERS /
+PASSWORD_HASH_MAX_PENDING). Reports logins/sec, latency percentiles and how
+many attempts were shed with HashPoolBusy.
+
+    python -m benchmarks.login_throughput --clients 16 --duration 5
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.common import add_output_argument, output_path, percentile, write_results
+from database import env_int
+from passwords import HashPoolBusy, PasswordHasher
+
+METHODS = [
+    'pbkdf2:sha256:100000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+]
+
+
+def run_method(method, args):
+    hasher = PasswordHasher(method, workers=args.workers, max_pending=args.max_pending, wait=args.wait)
+    stored = generate_password_hash('correct horse', method)
+    latencies, rejected = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                hasher.verify(stored, 'correct horse')
+            except HashPoolBusy:
+                with lock:
+                    rejected[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'method': method,
+        'logins_per_sec': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(1000 * percentile(latencies, 50), 1),
+        'p95_ms': round(1000 * percentile(latencies, 95), 1),
+        'mean_ms': round(1000 * statistics.fmean(latencies), 1) if latencies else 0.0,
+        'rejected': rejected[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per method')
+    parser.add_argument('--workers', type=int, default=env_int('PASSWORD_HASH_WORKERS', 2))
+    parser.add_argument('--max-pending', type=int, default=env_int('PASSWORD_HASH_MAX_PENDING', 16))
+    parser.add_argument('--wait', type=float, default=2.0)
+    parser.add_argument('--method', action='append', help='hash method to test (repeatable)')
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    report = [run_method(method, args) for method in args.method or METHODS]
+    for row in report:
+        print(f"{row['method']:>22}: {row['logins_per_sec']:>7} logins/s  p50 {row['p50_ms']}ms  "
+              f"p95 {row['p95_ms']}ms  {row['rejected']} rejected")
+    write_results(output_path(args), report)
+
+
+if __name__ == '__main__':
+    main()
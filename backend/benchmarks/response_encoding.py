@@ -0,0 +1,144 @@
+"""CPU per response and bytes on the wire for the workout list encodings.
+
+Seeds one user with WORKOUTS workouts in a scratch database, then requests
+the same data every way a client can ask for it and measures, per request,
+the process CPU time (query, encoding and compression; the test client adds
+no HTTP parsing) and the size of the body as sent:
+
+* serializer: ``json`` (stdlib) or ``orjson`` (JSON_SERIALIZER, if installed)
+* shape: an object per row, or ``?shape=columns`` arrays
+* encoding: identity, gzip, or br when the brotli package is installed
+* endpoint: the streamed full list, a ``limit=1000`` page, one session
+
+The response and compression caches are switched off so every request does
+the full work. ``--output`` also writes the results to a JSON file;
+``--compare`` and ``--fail-over PCT`` work as in api_load.py on the CPU figures.
+
+    python -m benchmarks.response_encoding --workouts 20000 --requests 20
+    python -m benchmarks.response_encoding --compare encoding.json --fail-over 25
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_output_argument, output_path, run_metadata, write_results
+
+ENDPOINTS = {
+    'list': '/api/workouts',
+    'page': '/api/workouts?limit=1000',
+    'session': '/api/workouts/Session%200',
+}
+
+
+def load_apps(workdir):
+    """One app per available serializer, sharing a scratch database."""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.chdir(workdir)
+    from app import create_app
+    from compression import brotli
+    from extensions import db
+    from migrations import upgrade
+    from serialization import SERIALIZERS
+    overrides = {'RESPONSE_CACHE_SIZE': 0, 'COMPRESS_CACHE_SIZE': 0}
+    apps = {name: create_app(dict(overrides, JSON_SERIALIZER=name)) for name in SERIALIZERS}
+    with next(iter(apps.values())).app_context():
+        db.create_all()
+        upgrade(db.engine)
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    return apps, encodings
+
+
+def seed(app, workouts, sessions=20):
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'username': 'bench', 'email': 'bench@example.com', 'password': 'bench-password'}).get_json()['token']
+    today = datetime.date.today()
+    rows = [{'session_title': f'Session {i % sessions}', 'exercise': f'Exercise {i % 40}', 'sets': 3 + i % 3,
+             'reps': 8 + i % 5, 'rest': 60 + 15 * (i % 4), 'weight': 20 + i % 60,
+             'date': (today - datetime.timedelta(days=i % 365)).isoformat()} for i in range(workouts)]
+    for start in range(0, len(rows), 5000):
+        client.post('/api/workouts/bulk', json=rows[start:start + 5000], headers={'Authorization': f'Bearer {token}'})
+    return token
+
+
+def measure(app, token, url, encoding, requests):
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': encoding}
+    cpu, size = [], 0
+    for _ in range(requests + 1):
+        started = time.process_time()
+        response = client.get(url, headers=headers)
+        body = response.get_data()  # drains streamed bodies, so their encoding is timed too
+        elapsed = time.process_time() - started
+        if response.status_code != 200:
+            sys.exit(f'GET {url} returned {response.status_code}')
+        cpu.append(elapsed)
+        size = len(body)
+    cpu = cpu[1:]  # the first request warms the statement cache
+    return {'cpu_ms': round(1000 * statistics.median(cpu), 2), 'bytes': size}
+
+
+def compare(previous, current, fail_over):
+    regressions = []
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+    for name, now in current['results'].items():
+        before = previous['results'].get(name)
+        if not before or not before['cpu_ms']:
+            continue
+        change = 100 * (now['cpu_ms'] - before['cpu_ms']) / before['cpu_ms']
+        print(f'  {name:<36} cpu {change:+6.1f}%')
+        if fail_over is not None and change > fail_over:
+            regressions.append((name, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workouts', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=10, help='requests measured per combination')
+    add_output_argument(parser)
+    parser.add_argument('--compare', help='earlier results file to diff against')
+    parser.add_argument('--fail-over', type=float, help='exit 1 if any CPU figure regressed by more than this percent')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.abspath(args.compare)) as f:
+            baseline = json.load(f)
+    output = output_path(args)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        apps, encodings = load_apps(workdir)
+        token = seed(next(iter(apps.values())), args.workouts)
+        print(f"{'serializer/shape/encoding/endpoint':<36} {'cpu':>9} {'bytes':>10}")
+        for serializer, app in apps.items():
+            for shape in ('objects', 'columns'):
+                for encoding in encodings:
+                    for endpoint, url in ENDPOINTS.items():
+                        if shape == 'columns':
+                            url += ('&' if '?' in url else '?') + 'shape=columns'
+                        name = f'{serializer}/{shape}/{encoding}/{endpoint}'
+                        results[name] = measure(app, token, url, encoding, args.requests)
+                        print(f"{name:<36} {results[name]['cpu_ms']:>7}ms {results[name]['bytes']:>10}")
+
+    report = {'meta': run_metadata({'workouts': args.workouts, 'requests': args.requests}), 'results': results}
+    write_results(output, report)
+
+    if baseline:
+        regressions = compare(baseline, report, args.fail_over)
+        if regressions:
+            print(f'{len(regressions)} measurement(s) regressed by more than {args.fail_over}%')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
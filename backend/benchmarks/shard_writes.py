@@ -0,0 +1,151 @@
+"""Workout write throughput against the number of shards.
+
+For each SHARD_COUNT in --shards, builds a scratch main database and shards,
+registers USERS users and starts WORKERS processes, each with its own app,
+that POST single workouts for random users for DURATION seconds, the way
+gunicorn workers would. With everything in one file every commit waits for
+the same SQLite write lock; with shards, only writes for users on the same
+shard do. Reports writes/sec, latency and errors per shard count and the
+speed-up over the first count, then the best speed-up against the number of
+CPUs and whether sharding helped on this machine; ``--output`` also writes
+them to a JSON file.
+
+Shards only shorten the queue for the write lock, so they pay off only when
+workers spend their time waiting for it: commits that wait for the disk
+(``--synchronous FULL`` makes each one wait for an fsync) and CPUs to spare
+for more writers at once. When the workers are CPU-bound instead, as with
+the default SQLITE_SYNCHRONOUS (NORMAL, in WAL mode) and about as many
+workers as CPUs, there is no queue to shorten and sharding doesn't help:
+each shard is one more file and engine per worker, and the speed-up comes
+out below 1 (around 0.8x for ``--shards 0,4 --workers 4`` on a small
+machine, with either setting).
+
+    python -m benchmarks.shard_writes --shards 0,2,4,8 --workers 8 --duration 10
+    python -m benchmarks.shard_writes --synchronous FULL --output shards.json
+"""
+import argparse
+import datetime
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import add_output_argument, latency_summary, output_path, run_metadata, write_results
+
+HELPED = 1.1  # a smaller speed-up is within run-to-run noise
+
+
+def configure(workdir, shards, synchronous):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'main.db')}"
+    os.environ['SHARD_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'shard{}.db')}"
+    os.environ['SHARD_COUNT'] = str(shards)
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.environ['WRITE_CONCURRENCY'] = '0'  # measure the database, not the admission limit
+    if synchronous:
+        os.environ['SQLITE_SYNCHRONOUS'] = synchronous
+
+
+def prepare(users):
+    """Create the schema everywhere and register the users; returns their tokens."""
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    app = create_app({'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1'})  # registration speed isn't measured
+    with app.app_context():
+        for engine in db.engines.values():
+            db.metadata.create_all(engine)
+            upgrade(engine)
+    client = app.test_client()
+    return [client.post('/api/register', json={
+        'username': f'bench{u}', 'email': f'bench{u}@example.com', 'password': 'bench-password'}).get_json()['token']
+        for u in range(users)]
+
+
+def worker(tokens, duration, start_at, seed, results):
+    logging.disable(logging.WARNING)
+    from app import create_app
+    client = create_app().test_client()
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    latencies, errors = [], 0
+    while time.time() < start_at:
+        time.sleep(0.01)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        payload = {'session_title': f'Session {rng.randrange(10)}', 'exercise': f'Exercise {rng.randrange(30)}',
+                   'sets': 3, 'reps': 5 + rng.randrange(5), 'rest': 90, 'weight': 20 + rng.randrange(80),
+                   'date': (today - datetime.timedelta(days=rng.randrange(365))).isoformat()}
+        headers = {'Authorization': f'Bearer {rng.choice(tokens)}'}
+        started = time.perf_counter()
+        response = client.post('/api/workouts', json=payload, headers=headers)
+        if response.status_code == 201:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors += 1  # 503 when the lock wait ran out
+    results.put((latencies, errors))
+
+
+def run(shards, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir, shards, args.synchronous)
+        tokens = prepare(args.users)
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        start_at = time.time() + 5  # give every worker time to import and build its app
+        processes = [context.Process(target=worker, args=(tokens, args.duration, start_at, seed, results))
+                     for seed in range(args.workers)]
+        for process in processes:
+            process.start()
+        latencies, errors = [], 0
+        for _ in processes:
+            worker_latencies, worker_errors = results.get()
+            latencies.extend(worker_latencies)
+            errors += worker_errors
+        for process in processes:
+            process.join()
+    return latency_summary(latencies, args.duration, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', default='0,2,4,8', help='comma-separated SHARD_COUNTs; 0 is unsharded')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8, help='writer processes')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of writes per shard count')
+    parser.add_argument('--synchronous', choices=['OFF', 'NORMAL', 'FULL'], help='SQLITE_SYNCHRONOUS for the run')
+    add_output_argument(parser)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    output = output_path(args)
+
+    results = {}
+    baseline = None
+    print(f"{'shards':>6} {'writes/s':>9} {'p50':>9} {'p95':>9} {'errors':>7} {'speed-up':>9}")
+    for shards in [int(count) for count in args.shards.split(',')]:
+        result = run(shards, args)
+        baseline = baseline or result['rps']
+        result['speedup'] = round(result['rps'] / baseline, 2) if baseline else None
+        results[str(shards)] = result
+        print(f"{shards:>6} {result['rps']:>9} {result['p50_ms']:>7}ms {result['p95_ms']:>7}ms {result['errors']:>7} "
+              f"{result['speedup']:>8}x")
+
+    params = {'shards': args.shards, 'users': args.users, 'workers': args.workers, 'duration': args.duration,
+              'synchronous': args.synchronous}
+    report = {'meta': run_metadata(params), 'results': results}
+    if len(results) > 1:
+        # Compared with the first count, normally 0 (unsharded)
+        best = max(list(results)[1:], key=lambda shards: results[shards]['speedup'] or 0)
+        speedup = results[best]['speedup'] or 0
+        print(f'Best: {speedup}x with {best} shards, {args.workers} workers on {os.cpu_count()} CPUs')
+        if speedup < HELPED:
+            print('Sharding did not help here: the writes were limited by CPU, not by waiting for the write '
+                  'lock. It pays off when commits wait for the disk (--synchronous FULL) and there are CPUs '
+                  'to spare for the extra writers.')
+        report['best'] = {'shards': int(best), 'speedup': speedup, 'helped': speedup >= HELPED}
+    write_results(output, report)
+
+
+if __name__ == '__main__':
+    main()
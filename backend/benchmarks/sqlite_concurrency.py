@@ -0,0 +1,124 @@
+"""Read/write throughput of the SQLite engine settings under N parallel clients.
+
+Each client is a separate process (like a gunicorn worker) with its own engine.
+Clients run a mix of the queries behind GET /api/workouts and POST
+/api/workouts against one database file, first with the settings the app used
+to ship with (rollback journal, synchronous=FULL, no pragmas) and then with
+the tuned pragmas from database.py.
+
+    python -m benchmarks.sqlite_concurrency --clients 8 --duration 5 --output sqlite.json
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import event, text
+
+from benchmarks.common import add_output_argument, output_path, write_results
+from database import apply_sqlite_pragmas, sqlite_pragmas
+
+PROFILES = {
+    'baseline': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'tuned': sqlite_pragmas(),
+}
+
+SCHEMA = (
+    'CREATE TABLE workout (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,'
+    ' session_title VARCHAR(120) NOT NULL, exercise VARCHAR(120) NOT NULL,'
+    ' sets INTEGER NOT NULL, reps INTEGER NOT NULL, rest INTEGER NOT NULL)',
+    'CREATE INDEX ix_workout_user_id ON workout (user_id, id)',
+)
+READ = text('SELECT id, session_title, exercise, sets, reps, rest FROM workout'
+            ' WHERE user_id = :user_id ORDER BY id LIMIT 50')
+WRITE = text('INSERT INTO workout (user_id, session_title, exercise, sets, reps, rest)'
+             ' VALUES (:user_id, :session_title, :exercise, 3, 10, 90)')
+
+
+def seed(path, users, rows_per_user):
+    engine = sqlalchemy.create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(WRITE, [{'user_id': u, 'session_title': f'Session {i % 10}', 'exercise': f'Exercise {i % 25}'}
+                             for u in range(users) for i in range(rows_per_user)])
+    engine.dispose()
+
+
+def client(path, pragmas, duration, write_ratio, users, seed_value, results):
+    engine = sqlalchemy.create_engine(f'sqlite:///{path}', connect_args={'timeout': 5})
+    event.listen(engine, 'connect', lambda dbapi_connection, record: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    rng = random.Random(seed_value)
+    counts = {'reads': 0, 'writes': 0, 'errors': 0, 'read_latency': 0.0, 'write_latency': 0.0}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        user_id = rng.randrange(users)
+        is_write = rng.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if is_write:
+                    conn.execute(WRITE, {'user_id': user_id, 'session_title': 'Bench', 'exercise': 'Squat'})
+                else:
+                    conn.execute(READ, {'user_id': user_id}).all()
+        except sqlalchemy.exc.OperationalError:
+            counts['errors'] += 1
+            continue
+        elapsed = time.perf_counter() - started
+        kind = 'write' if is_write else 'read'
+        counts[kind + 's'] += 1
+        counts[kind + '_latency'] += elapsed
+    engine.dispose()
+    results.put(counts)
+
+
+def run_profile(name, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, args.users, args.rows)
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        workers = [ctx.Process(target=client, args=(path, PROFILES[name], args.duration, args.write_ratio,
+                                                    args.users, i, results))
+                   for i in range(args.clients)]
+        for worker in workers:
+            worker.start()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0, 'read_latency': 0.0, 'write_latency': 0.0}
+        for _ in workers:
+            for key, value in results.get().items():
+                totals[key] += value
+        for worker in workers:
+            worker.join()
+    return {
+        'profile': name,
+        'clients': args.clients,
+        'reads_per_sec': round(totals['reads'] / args.duration, 1),
+        'writes_per_sec': round(totals['writes'] / args.duration, 1),
+        'lock_errors': totals['errors'],
+        'mean_read_ms': round(1000 * totals['read_latency'] / max(totals['reads'], 1), 3),
+        'mean_write_ms': round(1000 * totals['write_latency'] / max(totals['writes'], 1), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=200, help='seeded workouts per user')
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    report = [run_profile(name, args) for name in PROFILES]
+    for row in report:
+        print(f"{row['profile']:>9}: {row['reads_per_sec']:>9} reads/s {row['writes_per_sec']:>8} writes/s "
+              f"{row['lock_errors']:>5} lock errors  read {row['mean_read_ms']}ms  write {row['mean_write_ms']}ms")
+    write_results(output_path(args), report)
+
+
+if __name__ == '__main__':
+    main()
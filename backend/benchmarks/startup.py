@@ -0,0 +1,123 @@
+"""Cold-start cost of the API: import, create_app() and the first requests.
+
+Every run is a fresh interpreter against a scratch database, timing:
+
+* ``import``: ``import app``
+* ``create_app``: building the app, its extensions and blueprints
+* ``first_request``: the first GET /, i.e. Flask's own first-request work
+* ``first_db_request``: the first request that queries the database
+* ``process``: the whole child process, interpreter start-up included
+* ``cli``: a short-lived ``flask db_upgrade``, as a deploy step would run it
+
+The median and minimum of each over RUNS runs are printed, and written to a
+JSON file with ``--output``; ``--compare`` and ``--fail-over PCT`` work as in api_load.py and
+compare medians, so start-up time can be tracked across releases.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --compare startup.json --fail-over 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_output_argument, output_path, run_metadata, write_results
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+client.get('/')
+first = time.perf_counter()
+client.post('/api/login', json={'username': 'nobody', 'password': 'x'})
+first_db = time.perf_counter()
+json.dump({'import': imported - started, 'create_app': created - imported, 'first_request': first - created,
+           'first_db_request': first_db - first}, sys.stdout)
+'''
+
+
+def child_env(workdir):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+               FLASK_APP='app.py', PYTHONDONTWRITEBYTECODE='1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND, env.get('PYTHONPATH')]))
+    return env
+
+
+def timed_run(args, env, cwd):
+    started = time.perf_counter()
+    result = subprocess.run(args, env=env, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"{' '.join(args)} failed:\n{result.stderr}")
+    return elapsed, result.stdout
+
+
+def measure(runs, workdir):
+    env = child_env(workdir)
+    timed_run([sys.executable, '-m', 'flask', 'db_create'], env, workdir)  # the schema the requests expect
+    # Byte-compile once, as an installed release would be; bytecode writes are off in the children
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', BACKEND], check=True)
+    samples = {}
+    for _ in range(runs):
+        elapsed, output = timed_run([sys.executable, '-c', CHILD], env, workdir)
+        for name, value in dict(json.loads(output.strip().splitlines()[-1]), process=elapsed).items():
+            samples.setdefault(name, []).append(value)
+        elapsed, _ = timed_run([sys.executable, '-m', 'flask', 'db_upgrade'], env, workdir)
+        samples.setdefault('cli', []).append(elapsed)
+    return {name: {'median_ms': round(1000 * statistics.median(values), 1),
+                   'min_ms': round(1000 * min(values), 1)} for name, values in samples.items()}
+
+
+def compare(previous, current, fail_over):
+    regressions = []
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+    for name, now in current['results'].items():
+        before = previous['results'].get(name)
+        if not before or not before['median_ms']:
+            continue
+        change = 100 * (now['median_ms'] - before['median_ms']) / before['median_ms']
+        print(f'  {name:<18} median {change:+6.1f}%')
+        if fail_over is not None and change > fail_over:
+            regressions.append((name, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    add_output_argument(parser)
+    parser.add_argument('--compare', help='earlier results file to diff against')
+    parser.add_argument('--fail-over', type=float, help='exit 1 if any median regressed by more than this percent')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = measure(args.runs, workdir)
+    report = {'meta': run_metadata({'runs': args.runs}), 'results': results}
+    for name, result in results.items():
+        print(f"{name:<18} median {result['median_ms']:>8}ms  min {result['min_ms']:>8}ms")
+
+    write_results(output_path(args), report)
+
+    if baseline:
+        regressions = compare(baseline, report, args.fail_over)
+        if regressions:
+            print(f'{len(regressions)} measurement(s) regressed by more than {args.fail_over}%')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
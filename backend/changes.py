@@ -0,0 +1,207 @@
+"""Change feed: what happened to a user's workouts since a given point.
+
+Every workout write appends one ``workout_change`` row per workout it inserted
+or deleted (``models.record_changes``), numbered by a seq that only grows.
+A client that already holds the user's sessions (``/api/sessions`` returns the
+``change_seq`` it reflects) keeps them current by applying the events after
+that seq, instead of refetching after every write:
+
+* ``GET /api/changes?since=<seq>&limit=N`` returns the next events as JSON.
+* ``GET /api/changes/stream?since=<seq>`` is a Server-Sent Events stream of
+  them. EventSource can't set headers, so the JWT may also come as ``?jwt=``;
+  on reconnect the browser's Last-Event-ID takes over from ``since``.
+
+Once ``flask prune_changes`` has deleted events a cursor still needed, the
+client is told to resync (HTTP 410, or an SSE ``resync`` event) and refetches.
+
+A stream wakes immediately for commits made by the same process and polls
+every CHANGE_STREAM_POLL_SECONDS for the others. Under WSGI each open stream
+holds a worker thread, so serve the API with threaded workers
+(``gunicorn -k gthread --threads N``) when clients keep streams open. Served
+by asgi.py it holds none: the events are sent from the event loop, and each
+poll borrows a pool thread only for its query.
+"""
+import asyncio
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from auth import jwt_user_id
+from extensions import db
+from models import WorkoutChange, changes_pruned_seq, latest_change_seq
+from sharding import use_user_shard
+
+changes = Blueprint('changes', __name__)
+
+CHANGES_PAGE_DEFAULT = 500
+CHANGES_PAGE_MAX = 5000
+
+
+class ChangeNotifier:
+    """Wakes this process's change streams when one of their user's writes commits."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.commits = {}  # user id -> commits with changes seen by this process
+        self.waiters = {}  # user id -> {(event loop, asyncio.Event)} of the async streams waiting on it
+
+    def seen(self, user_id):
+        with self.condition:
+            return self.commits.get(user_id, 0)
+
+    def notify(self, user_ids):
+        with self.condition:
+            for user_id in user_ids:
+                self.commits[user_id] = self.commits.get(user_id, 0) + 1
+                for loop, event in self.waiters.get(user_id, ()):
+                    loop.call_soon_threadsafe(event.set)
+            self.condition.notify_all()
+
+    def wait(self, user_id, seen, timeout):
+        """Block until the user has a commit newer than ``seen`` or ``timeout`` passes; returns the count."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.commits.get(user_id, 0) != seen, timeout)
+            return self.commits.get(user_id, 0)
+
+    async def wait_async(self, user_id, seen, timeout):
+        """``wait`` for a coroutine, without blocking the event loop meanwhile."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.condition:
+            if self.commits.get(user_id, 0) != seen:
+                return self.commits.get(user_id, 0)
+            self.waiters.setdefault(user_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                waiters = self.waiters[user_id]
+                waiters.discard(waiter)
+                if not waiters:
+                    del self.waiters[user_id]
+        return self.seen(user_id)
+
+
+change_notifier = ChangeNotifier()
+
+@db.event.listens_for(db.session, 'after_commit')
+def notify_changed_users(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids:
+        change_notifier.notify(user_ids)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_users', None)
+
+def changes_query(user_id, since, limit=CHANGES_PAGE_DEFAULT):
+    return (db.select(WorkoutChange)
+            .where(WorkoutChange.user_id == user_id, WorkoutChange.seq > since)
+            .order_by(WorkoutChange.seq)
+            .limit(limit))
+
+def cursor_expired(user_id, since):
+    # Events after ``since`` have been pruned, so replaying the rest would leave the client wrong
+    return since < changes_pruned_seq(user_id)
+
+def parse_since():
+    # Last-Event-ID is what EventSource sends when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    return since
+
+@changes.route('/api/changes', methods=['GET'])
+@jwt_required()
+def list_changes():
+    # Without ?since= only the current seq is returned, to start a cursor from
+    current_user_id = jwt_user_id()
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'changes': [], 'last_seq': latest_change_seq(current_user_id), 'more': False}), 200
+    if cursor_expired(current_user_id, since):
+        return jsonify({'error': 'Changes since this seq are no longer available, refetch',
+                        'last_seq': latest_change_seq(current_user_id)}), 410
+
+    limit = max(1, min(request.args.get('limit', CHANGES_PAGE_DEFAULT, type=int), CHANGES_PAGE_MAX))
+    rows = db.session.scalars(changes_query(current_user_id, since, limit + 1)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    body = (f'{{"changes":[{",".join(row.to_json() for row in rows)}],'
+            f'"last_seq":{rows[-1].seq if rows else since},"more":{"true" if more else "false"}}}')
+    return Response(body, status=200, mimetype='application/json')
+
+def poll_changes(user_id, since):
+    use_user_shard(user_id)  # an async stream polls from a fresh app context each time
+    rows = db.session.scalars(changes_query(user_id, since, CHANGES_PAGE_MAX)).all()
+    # End the read transaction between polls so an idle stream doesn't pin a WAL snapshot
+    db.session.rollback()
+    return [(row.seq, row.to_json()) for row in rows]
+
+def format_events(events):
+    return ''.join(f'id: {seq}\ndata: {data}\n\n' for seq, data in events)
+
+def stream_changes(user_id, since, settings):
+    poll, heartbeat, max_seconds = settings
+    started = last_sent = time.monotonic()
+    seen = change_notifier.seen(user_id)
+    yield f'retry: {int(1000 * poll)}\n\n'
+    while time.monotonic() - started < max_seconds:
+        events = poll_changes(user_id, since)
+        if events:
+            since = events[-1][0]
+            last_sent = time.monotonic()
+            yield format_events(events)
+            if len(events) == CHANGES_PAGE_MAX:
+                continue
+        elif time.monotonic() - last_sent >= heartbeat:
+            last_sent = time.monotonic()
+            yield ': keep-alive\n\n'
+        seen = change_notifier.wait(user_id, seen, poll)
+    # The browser reconnects on its own, resuming from the last id it received
+
+async def stream_changes_async(asgi, user_id, since, settings):
+    # stream_changes for asgi.py: the same events, with no thread held between polls
+    poll, heartbeat, max_seconds = settings
+    started = last_sent = time.monotonic()
+    seen = change_notifier.seen(user_id)
+    yield f'retry: {int(1000 * poll)}\n\n'
+    while time.monotonic() - started < max_seconds:
+        events = await asgi.run_sync(poll_changes, user_id, since)
+        if events:
+            since = events[-1][0]
+            last_sent = time.monotonic()
+            yield format_events(events)
+            if len(events) == CHANGES_PAGE_MAX:
+                continue
+        elif time.monotonic() - last_sent >= heartbeat:
+            last_sent = time.monotonic()
+            yield ': keep-alive\n\n'
+        seen = await change_notifier.wait_async(user_id, seen, poll)
+
+@changes.route('/api/changes/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def change_stream():
+    current_user_id = jwt_user_id()
+    since = parse_since()
+    if since is None:
+        since = latest_change_seq(current_user_id)
+    config = current_app.config
+    settings = (config['CHANGE_STREAM_POLL_SECONDS'], config['CHANGE_STREAM_HEARTBEAT_SECONDS'],
+                config['CHANGE_STREAM_MAX_SECONDS'])
+    asgi = request.environ.get('workout_api.asgi')  # set when served by asgi.py
+    if cursor_expired(current_user_id, since):
+        response = Response(f'retry: {int(1000 * settings[0])}\n\nevent: resync\ndata: {{}}\n\n',
+                            mimetype='text/event-stream')
+    elif asgi is not None:
+        asgi.stream(stream_changes_async(asgi, current_user_id, since, settings))
+        response = Response(mimetype='text/event-stream')
+    else:
+        body = stream_with_context(stream_changes(current_user_id, since, settings))
+        response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx would otherwise hold events back
+    return response
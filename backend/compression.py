@@ -0,0 +1,137 @@
+"""Response compression negotiated from Accept-Encoding.
+
+``Compressor.init_app`` installs an after_request hook that compresses text
+and JSON responses with brotli (if the ``brotli`` package is installed) or
+gzip, whichever the client prefers. Small bodies are sent as they are: below
+COMPRESS_MIN_SIZE bytes the CPU isn't worth the few bytes saved.
+
+Streamed responses (the NDJSON and JSON-array workout lists) are compressed
+chunk by chunk with a sync flush after each one, so rows still reach the
+client as they are produced and memory stays flat. Server-Sent Events are
+left alone, since a proxy or browser may hold compressed events back.
+
+Compressed bodies of responses with an ETag are kept in a small LRU cache, so
+the cached workout responses aren't recompressed on every request. Their ETag
+is made weak, since the bytes differ per encoding while the content doesn't.
+"""
+import zlib
+
+from flask import request
+
+from caching import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html',
+                      'application/javascript', 'text/css')
+
+
+def gzip_bytes(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_bytes(data, quality):
+    return brotli.compress(data, quality=quality)
+
+
+def brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class Compressor:
+    def __init__(self):
+        self.cache = LRUCache()  # (etag, encoding) -> compressed body
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def init_app(self, app):
+        self.enabled = app.config['COMPRESS_ENABLED']
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.levels = {'gzip': app.config['COMPRESS_GZIP_LEVEL'], 'br': app.config['COMPRESS_BROTLI_QUALITY']}
+        self.cache.configure(app.config['COMPRESS_CACHE_SIZE'])
+        app.after_request(self._after_request)
+
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose_encoding(self):
+        accepted = request.accept_encodings
+        best = max(self.encodings(), key=lambda coding: accepted[coding])
+        return best if accepted[best] > 0 else None
+
+    def _after_request(self, response):
+        if (not self.enabled or response.status_code != 200 or request.method == 'HEAD'
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not response.is_streamed and response.content_length < self.min_size:
+            return response
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        level = self.levels[encoding]
+        etag, weak = response.get_etag()
+        if response.is_streamed:
+            body = response.response
+            response.response = self._compress_stream(body, response.iter_encoded(), encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = self.cache.get((etag, encoding)) if etag else None
+            if data is None:
+                raw = response.get_data()
+                data = (brotli_bytes if encoding == 'br' else gzip_bytes)(raw, level)
+                self.compressed += 1
+                self.bytes_in += len(raw)
+                self.bytes_out += len(data)
+                if etag:
+                    self.cache.set((etag, encoding), data)
+            response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_stream(self, body, chunks, encoding, level):
+        stream = brotli_stream if encoding == 'br' else gzip_stream
+        size_in = size_out = 0
+
+        def counted(chunks):
+            nonlocal size_in
+            for chunk in chunks:
+                size_in += len(chunk)
+                yield chunk
+        try:
+            for data in stream(counted(chunks), level):
+                size_out += len(data)
+                yield data
+        finally:
+            if hasattr(body, 'close'):
+                body.close()  # lets stream_with_context tear down its request context
+            self.compressed += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+    def stats(self):
+        return {'compressed': self.compressed, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
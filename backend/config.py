@@ -0,0 +1,68 @@
+"""Application settings, read from the environment when an app is created.
+
+``create_app()`` starts from ``app_config()`` and applies any overrides it is
+given, so tests and scripts can change settings without touching os.environ.
+"""
+import os
+
+from database import database_config, env_int
+
+
+def app_config():
+    config = database_config()  # DATABASE_URL, pool sizing and SQLite pragmas
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    config['SECRET_KEY'] = 'your_secret_key'
+    config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+    config['UPLOAD_FOLDER'] = 'static/uploads/'
+    config['UPLOAD_MAX_LENGTH'] = 512 * 1024 * 1024  # total size of a resumable upload
+    config['UPLOAD_EXPIRY'] = 24 * 60 * 60  # seconds without a chunk before prune_uploads deletes an upload
+    config['IMPORT_MAX_LENGTH'] = 512 * 1024 * 1024  # an /api/import body, about 7M CSV rows
+    config['MEDIA_WORKERS'] = env_int('MEDIA_WORKERS', 2)  # processes rendering thumbnails/video
+    config['MEDIA_MAX_AGE'] = 365 * 24 * 60 * 60  # media URLs are content-addressed, so cache for a year
+    config['JWT_SECRET_KEY'] = 'your_jwt_secret_key'  # Change this to a random string
+    config['JWT_REFRESH_WINDOW'] = 5 * 60  # check-session only mints a new token this close to expiry
+    config['USER_CACHE_SIZE'] = 10000
+    config['USER_CACHE_TTL'] = 60  # seconds; bounds how stale another worker's copy can get
+    config['RESPONSE_CACHE_SIZE'] = 1024  # rendered workout responses kept per process
+    config['RESPONSE_CACHE_MAX_BODY'] = 256 * 1024  # larger bodies are sent but not cached
+    config['EXERCISE_CACHE_SIZE'] = 10000  # exercise name -> id entries kept per process
+    # Werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000". Hashes made
+    # with other parameters are upgraded the next time their owner logs in.
+    config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    config['PASSWORD_HASH_WORKERS'] = env_int('PASSWORD_HASH_WORKERS', 2)
+    config['PASSWORD_HASH_MAX_PENDING'] = env_int('PASSWORD_HASH_MAX_PENDING', 16)
+    # Seconds a login waits for one of those slots before a 503; 0 answers at once
+    config['PASSWORD_HASH_WAIT'] = float(os.environ.get('PASSWORD_HASH_WAIT', 0))
+    # Throttling, see ratelimit.py. Limits are "N/second|minute|hour|day" per route and caller, or "off".
+    config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+    config['RATE_LIMIT_STORAGE'] = os.environ.get('RATE_LIMIT_STORAGE', 'memory')  # or sqlite:///<path>
+    config['RATE_LIMIT_LOGIN'] = os.environ.get('RATE_LIMIT_LOGIN', '10/minute')
+    config['RATE_LIMIT_REGISTER'] = os.environ.get('RATE_LIMIT_REGISTER', '5/minute')
+    config['RATE_LIMIT_WRITES'] = os.environ.get('RATE_LIMIT_WRITES', '120/minute')
+    # Reverse proxies (nginx, a load balancer) in front of the app. Anonymous callers are limited per
+    # client address, so behind N proxies set TRUSTED_PROXIES=N to take it from X-Forwarded-For;
+    # with the default 0 the header is ignored, since clients could send any address in it.
+    config['TRUSTED_PROXIES'] = env_int('TRUSTED_PROXIES', 0)
+    config['WRITE_CONCURRENCY'] = env_int('WRITE_CONCURRENCY', 8)  # per worker; 0 disables the cap
+    config['WRITE_CONCURRENCY_WAIT'] = float(os.environ.get('WRITE_CONCURRENCY_WAIT', 0.5))
+    # Response encoding, see serialization.py and compression.py
+    config['JSON_SERIALIZER'] = os.environ.get('JSON_SERIALIZER', 'orjson')  # or "json" for the stdlib encoder
+    config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', '1') != '0'  # off when a proxy compresses
+    config['COMPRESS_MIN_SIZE'] = env_int('COMPRESS_MIN_SIZE', 1024)  # bytes; smaller bodies go out as they are
+    config['COMPRESS_GZIP_LEVEL'] = 6
+    config['COMPRESS_BROTLI_QUALITY'] = 4  # brotli's dense levels cost far more CPU than they save bytes here
+    config['COMPRESS_CACHE_SIZE'] = 256  # compressed bodies of ETagged responses kept per process
+    # Change feed, see changes.py
+    config['CHANGE_STREAM_POLL_SECONDS'] = float(os.environ.get('CHANGE_STREAM_POLL_SECONDS', 2))
+    config['CHANGE_STREAM_HEARTBEAT_SECONDS'] = 15  # comment lines that keep idle proxies from closing streams
+    config['CHANGE_STREAM_MAX_SECONDS'] = 300  # then the browser reconnects, freeing the worker thread
+    config['CHANGE_LOG_RETENTION_DAYS'] = env_int('CHANGE_LOG_RETENTION_DAYS', 30)  # default for prune_changes
+    # Serving with asgi.py
+    config['ASGI_THREADS'] = env_int('ASGI_THREADS', 32)  # per process; only busy while a view or query runs
+    config['ASGI_SPOOL_SIZE'] = 1024 * 1024  # request bodies past this are spooled to disk while they arrive
+    # Opt-in diagnostics, see metrics.py
+    config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # bearer token for /metrics and /api/cache/stats
+    config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 0)) or None
+    config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+    return config
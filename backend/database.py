@@ -0,0 +1,107 @@
+"""Database engine settings, read from the environment.
+
+DATABASE_URL picks the database (default: the SQLite file ``test.db`` in the
+instance folder); a server URL such as ``postgresql://...`` works as well.
+For SQLite every new connection gets WAL journaling and the pragmas below so
+that gunicorn workers can read while one of them writes, and writers wait
+for the lock instead of failing straight away with "database is locked".
+SHARD_COUNT and SHARD_DATABASE_URL spread users' data over several SQLite
+files; see sharding.py.
+"""
+import os
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = 'sqlite:///test.db'
+DEFAULT_SHARD_DATABASE_URL = 'sqlite:///shard{}.db'  # {} is the shard number
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': env_int('SQLITE_CACHE_SIZE', -64000),  # negative means KiB, so 64MB
+    }
+
+
+def is_memory_sqlite(url):
+    return url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]  # the scheme Heroku/Render hand out
+    return url
+
+
+def engine_options(url):
+    """Keyword arguments for ``create_engine`` (SQLALCHEMY_ENGINE_OPTIONS)."""
+    options = {}
+    if url.startswith('sqlite'):
+        if is_memory_sqlite(url):
+            return options  # Flask-SQLAlchemy pins in-memory databases to a StaticPool
+        # The sqlite3 module's own timeout is in seconds; keep it in line with busy_timeout
+        options['connect_args'] = {'timeout': env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = env_int('DB_POOL_RECYCLE', 1800)
+    options['pool_size'] = env_int('DB_POOL_SIZE', 5)
+    options['max_overflow'] = env_int('DB_MAX_OVERFLOW', 10)
+    options['pool_timeout'] = env_int('DB_POOL_TIMEOUT', 30)
+    return options
+
+
+def database_config():
+    url = database_url()
+    return {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url),
+        'SQLITE_PRAGMAS': sqlite_pragmas(),
+        'SHARD_COUNT': env_int('SHARD_COUNT', 0),  # 0: all data in the main database
+        'SHARD_DATABASE_URL': os.environ.get('SHARD_DATABASE_URL', DEFAULT_SHARD_DATABASE_URL),
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout goes first so the journal_mode switch itself waits for the lock
+        for name in ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size', 'cache_size'):
+            if pragmas.get(name) is not None:
+                cursor.execute(f'PRAGMA {name}={pragmas[name]}')
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run ``pragmas`` on every new DBAPI connection ``engine`` opens, if it is a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return None
+
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+    event.listen(engine, 'connect', on_connect)
+    return on_connect
+
+
+def begin_read_snapshot(connection):
+    """Make the following SELECTs on ``connection`` read one snapshot of a SQLite database.
+
+    pysqlite only begins a transaction before a write, so each SELECT
+    otherwise sees whatever was committed when it ran. Other databases are
+    already inside a transaction here; nothing is done for them.
+    """
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+
+
+def is_locked_error(error):
+    return 'database is locked' in str(getattr(error, 'orig', error))
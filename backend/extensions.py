@@ -0,0 +1,60 @@
+"""Extension objects shared by the blueprints.
+
+They are created unbound at import time, which costs next to nothing, and
+bound to an app by ``init_extensions`` from ``create_app()``. Anything
+expensive behind them (the password-hash thread pool, the media process pool,
+a shared rate-limit file) is only started by the first request that needs it.
+"""
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+from flask_login import LoginManager
+from flask_sqlalchemy import SQLAlchemy
+
+from caching import LRUCache
+from compression import Compressor
+from database import install_sqlite_pragmas
+from media import MediaStore
+from media_jobs import MediaWorker
+from metrics import RequestMetrics
+from passwords import PasswordHasher
+from ratelimit import ConcurrencyLimiter, RateLimiter
+from sharding import ShardedSession, shard_binds
+
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+cors = CORS()
+jwt = JWTManager()
+login_manager = LoginManager()
+request_metrics = RequestMetrics()
+compressor = Compressor()
+password_hasher = PasswordHasher()
+media_store = MediaStore()
+media_worker = MediaWorker()
+rate_limiter = RateLimiter()
+write_slots = ConcurrencyLimiter()
+
+# Per-process caches, sized from the config in init_extensions
+exercise_cache = LRUCache()  # (shard, exercise name) -> id
+user_cache = LRUCache()  # user id -> CachedUser
+response_cache = LRUCache()  # rendered workout responses
+
+
+def init_extensions(app):
+    app.config['SQLALCHEMY_BINDS'] = shard_binds(app.config)
+    db.init_app(app)
+    cors.init_app(app)
+    jwt.init_app(app)
+    login_manager.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            # Per engine rather than on Engine, so other apps and scratch engines in the process aren't affected
+            install_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+        request_metrics.init_app(app, db.engines.values())
+    compressor.init_app(app)  # after metrics, so its hook runs first and sizes are counted compressed
+    password_hasher.init_app(app)
+    media_store.init_app(app)
+    media_worker.init_app(app)
+    rate_limiter.init_app(app)
+    write_slots.init_app(app)
+    exercise_cache.configure(app.config['EXERCISE_CACHE_SIZE'])
+    user_cache.configure(app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+    response_cache.configure(app.config['RESPONSE_CACHE_SIZE'])
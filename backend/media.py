@@ -0,0 +1,209 @@
+"""Content-addressed storage for uploaded workout media.
+
+Files are stored under their SHA-256 as ``<root>/ab/cd/<sha256>.<ext>``, so the
+same screenshot uploaded twice is kept once and two different files called
+``image.png`` can no longer overwrite each other. Bodies are read and hashed
+in CHUNK_SIZE pieces and written to a temporary file next to the store, then
+renamed into place, so memory use doesn't depend on the file size.
+
+Large videos can be sent in pieces: ``start_upload`` opens a resumable upload,
+``append`` adds a chunk at the offset the client believes it is at, and once
+the declared length has arrived the file is moved into the store. Upload
+state lives on disk, so any worker can continue an upload another started;
+an append holds an exclusive lock on the upload's state file, so two
+requests can't write into the same upload at once. ``prune_uploads`` deletes
+uploads nobody has appended to for a while (``flask prune_uploads``).
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class MediaStore:
+    def __init__(self, root=None):
+        self.root = root
+        self.tmp_dir = os.path.join(root, '.tmp') if root else None
+        # Hash state of uploads this process has been receiving, so finishing
+        # them doesn't need a second pass over the file
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        # Directories are created on the first upload, not at startup
+        self.root = app.config['UPLOAD_FOLDER']
+        self.tmp_dir = os.path.join(self.root, '.tmp')
+
+    def relpath(self, digest, ext):
+        return f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+    def path(self, relpath):
+        return os.path.join(self.root, *relpath.split('/'))
+
+    def _commit(self, tmp_path, digest, ext):
+        """Move a fully written temp file into place; returns (relpath, created)."""
+        relpath = self.relpath(digest, ext)
+        final_path = self.path(relpath)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return relpath, False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return relpath, True
+
+    def save_stream(self, stream, ext, max_length=None):
+        """Store everything read from ``stream``; returns (relpath, created, size)."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_length is not None and size > max_length:
+                        raise UploadError('File is too large', 413)
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        relpath, created = self._commit(tmp_path, digest.hexdigest(), ext)
+        return relpath, created, size
+
+    # Resumable uploads
+
+    def _meta_path(self, upload_id):
+        if not upload_id.isalnum():
+            raise UploadError('Upload not found', 404)
+        return os.path.join(self.tmp_dir, upload_id + '.json')
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.tmp_dir, upload_id + '.part')
+
+    def start_upload(self, ext, length):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        open(self._part_path(upload_id), 'wb').close()
+        with open(self._meta_path(upload_id), 'w') as f:
+            json.dump({'ext': ext, 'length': length}, f)
+        with self._lock:
+            self._digests[upload_id] = (0, hashlib.sha256())
+        return upload_id
+
+    def status(self, upload_id):
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', 404)
+        meta['offset'] = os.path.getsize(self._part_path(upload_id))
+        return meta
+
+    @contextlib.contextmanager
+    def _locked(self, upload_id):
+        meta_path = self._meta_path(upload_id)
+        try:
+            f = open(meta_path)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', 404)
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Another request is appending to this upload', 409)
+            try:
+                # The holder before us may have finished the upload or pruned it
+                if os.fstat(f.fileno()).st_ino != os.stat(meta_path).st_ino:
+                    raise FileNotFoundError(meta_path)
+            except FileNotFoundError:
+                raise UploadError('Upload not found', 404)
+            yield  # closing the file releases the lock
+
+    def append(self, upload_id, offset, stream):
+        """Append a chunk at ``offset``; returns the new status, with ``relpath`` once complete."""
+        with self._locked(upload_id):
+            os.utime(self._meta_path(upload_id))  # the upload is still alive, see prune_uploads
+            return self._append(upload_id, offset, stream)
+
+    def _append(self, upload_id, offset, stream):
+        meta = self.status(upload_id)
+        if offset != meta['offset']:
+            raise UploadError(f"Expected offset {meta['offset']}", 409)
+        with self._lock:
+            offset_hashed, digest = self._digests.pop(upload_id, (None, None))
+        if offset_hashed != offset:
+            digest = None  # another worker took some chunks; rehash when finishing
+        with open(self._part_path(upload_id), 'ab') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if meta['offset'] + len(chunk) > meta['length']:
+                    out.truncate(offset)  # drop the partial chunk so the client can resend it
+                    raise UploadError('Chunk runs past the declared length', 413)
+                if digest is not None:
+                    digest.update(chunk)
+                out.write(chunk)
+                meta['offset'] += len(chunk)
+        if meta['offset'] < meta['length']:
+            if digest is not None:
+                with self._lock:
+                    self._digests[upload_id] = (meta['offset'], digest)
+            return meta
+        meta['relpath'], meta['created'] = self._finish(upload_id, meta['ext'], digest)
+        return meta
+
+    def _finish(self, upload_id, ext, digest):
+        part_path = self._part_path(upload_id)
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        relpath, created = self._commit(part_path, digest.hexdigest(), ext)
+        os.remove(self._meta_path(upload_id))
+        return relpath, created
+
+    def prune_uploads(self, max_age):
+        """Delete uploads untouched for ``max_age`` seconds and stray temp files; returns how many of either."""
+        if not os.path.isdir(self.tmp_dir):
+            return 0
+        cutoff = time.time() - max_age
+        pruned = 0
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            upload_id, ext = os.path.splitext(name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if ext == '.json':
+                    with self._locked(upload_id):  # not while a late chunk is still arriving
+                        for leftover in (self._part_path(upload_id), path):
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(leftover)
+                    with self._lock:
+                        self._digests.pop(upload_id, None)
+                elif ext == '' or (ext == '.part' and not os.path.exists(self._meta_path(upload_id))):
+                    os.remove(path)  # a save_stream temp file, or a part its state file went without
+                else:
+                    continue
+            except (FileNotFoundError, UploadError):
+                continue  # finished, pruned or busy meanwhile
+            pruned += 1
+        return pruned
@@ -0,0 +1,137 @@
+"""Background renditions for uploaded media.
+
+After an upload lands in the MediaStore, ``MediaWorker.submit`` queues a job
+on a local process pool that writes smaller, web-friendly copies next to the
+original:
+
+    <sha256>.w320.v1.jpg, <sha256>.w960.v1.jpg    images
+    <sha256>.720p.v1.mp4, <sha256>.poster.v1.jpg  videos
+
+The content hash in the name already changes whenever the source changes; the
+``v1`` part is bumped whenever the rendition settings change, so clients can
+cache every derived file forever. Pillow and ffmpeg are optional: without
+them the corresponding renditions are skipped and clients keep using the
+original.
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+
+RENDITION_VERSION = 'v1'
+IMAGE_WIDTHS = {'thumb': 320, 'medium': 960}
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'avi'}
+
+# Only the rendering processes import Pillow; the web process just checks that it is installed
+HAVE_PILLOW = importlib.util.find_spec('PIL') is not None
+
+
+def rendition_names(relpath):
+    """Map rendition name -> relpath of the derived file, for an original's relpath."""
+    base, ext = relpath.rsplit('.', 1)
+    if ext in IMAGE_EXTENSIONS:
+        return {name: f'{base}.w{width}.{RENDITION_VERSION}.jpg' for name, width in IMAGE_WIDTHS.items()}
+    if ext in VIDEO_EXTENSIONS:
+        return {'web': f'{base}.720p.{RENDITION_VERSION}.mp4', 'poster': f'{base}.poster.{RENDITION_VERSION}.jpg'}
+    return {}
+
+
+def available(relpath):
+    ext = relpath.rsplit('.', 1)[1]
+    if ext in IMAGE_EXTENSIONS:
+        return HAVE_PILLOW
+    return ext in VIDEO_EXTENSIONS and shutil.which('ffmpeg') is not None
+
+
+def _tmp_path(path):
+    # Written next to the target and renamed, so readers never see half a file
+    root, ext = os.path.splitext(path)
+    return f'{root}.{os.getpid()}.tmp{ext}'
+
+
+def make_image_renditions(source, targets):
+    from PIL import Image, ImageOps
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')  # also takes the first GIF frame
+        for path, width in targets:
+            if os.path.exists(path):
+                continue
+            copy = image.copy()
+            copy.thumbnail((width, width * 4))
+            tmp = _tmp_path(path)
+            copy.save(tmp, 'JPEG', quality=80, optimize=True, progressive=True)
+            os.replace(tmp, path)
+
+
+def make_video_renditions(source, web_path, poster_path):
+    if not os.path.exists(web_path):
+        tmp = _tmp_path(web_path)
+        subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', source,
+                        '-vf', 'scale=-2:min(720\\,ih)', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+                        '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart', tmp], check=True)
+        os.replace(tmp, web_path)
+    if not os.path.exists(poster_path):
+        tmp = _tmp_path(poster_path)
+        subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-ss', '1', '-i', source,
+                        '-frames:v', '1', '-vf', 'scale=480:-2', tmp], check=True)
+        os.replace(tmp, poster_path)
+
+
+def render(root, relpath):
+    """Job body: create whichever renditions of ``relpath`` don't exist yet."""
+    def path(rel):
+        return os.path.join(root, *rel.split('/'))
+
+    names = rendition_names(relpath)
+    ext = relpath.rsplit('.', 1)[1]
+    if ext in IMAGE_EXTENSIONS:
+        make_image_renditions(path(relpath), [(path(names[name]), width) for name, width in IMAGE_WIDTHS.items()])
+    elif ext in VIDEO_EXTENSIONS:
+        make_video_renditions(path(relpath), path(names['web']), path(names['poster']))
+    return relpath
+
+
+class MediaWorker:
+    """Runs rendition jobs on a process pool created on first use."""
+
+    def __init__(self, root=None, workers=2):
+        self.root = root
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def init_app(self, app):
+        self.root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.workers = app.config['MEDIA_WORKERS']
+
+    def submit(self, relpath):
+        if not available(relpath):
+            return None
+        with self._lock:
+            if relpath in self._pending:
+                return None
+            if self._pool is None:
+                # spawn rather than fork: the web process has DB connections and threads
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._pending.add(relpath)
+        future = self._pool.submit(render, self.root, relpath)
+        future.add_done_callback(lambda f: self._done(relpath, f))
+        return future
+
+    def _done(self, relpath, future):
+        with self._lock:
+            self._pending.discard(relpath)
+        if future.exception() is not None:
+            log.error('Rendering %s failed: %s', relpath, future.exception())
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
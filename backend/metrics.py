@@ -0,0 +1,221 @@
+"""Per-route request metrics, exposed in the Prometheus text format.
+
+``RequestMetrics.init_app`` records, for every request, its latency, the
+number and total time of SQL statements it ran (an N+1 shows up as a query
+count that grows with the data), and the response payload size, all labelled
+by route template and method. ``render`` produces the text served on
+/metrics. Recording is a few counter updates under a lock, cheap enough to
+leave on in production. For streamed responses the latency and query figures
+cover the work done before the first byte; the payload size is counted as the
+body is sent.
+
+Opt-in extras, off by default:
+
+* SLOW_REQUEST_SECONDS: log requests slower than this, with their query stats.
+* PROFILE_SAMPLE_RATE: profile this fraction of requests with cProfile; if a
+  profiled request is slow its stats are written to PROFILE_DIR.
+
+Metrics are per process; with several workers, scrape each one or sum them.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in labels)
+
+
+class Registry:
+    """Counters and histograms keyed by (metric name, label tuple)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add_collector(self, fn):
+        """``fn()`` returns ``[(name, labels, value), ...]`` read at scrape time; gauges unless described."""
+        self._collectors.append(fn)
+
+    def render(self):
+        # The text format wants each family's samples together, after its HELP and TYPE lines
+        lines = []
+
+        def header(name, kind):
+            kind, text = self._help.get(name, (kind, None))
+            if text:
+                lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def sample(name, labels, value):
+            lines.append(f'{name}{{{format_labels(labels)}}} {value}' if labels else f'{name} {value}')
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                 for key, h in self._histograms.items()))
+        collected = {}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                collected.setdefault(name, []).append((labels, value))
+
+        family = None
+        for (name, labels), value in counters:
+            if name != family:
+                header(name, 'counter')
+                family = name
+            sample(name, labels, value)
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            if name != family:
+                header(name, 'histogram')
+                family = name
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                sample(f'{name}_bucket', labels + (('le', bound),), cumulative)
+            sample(f'{name}_sum', labels, total)
+            sample(f'{name}_count', labels, count)
+        for name, samples in collected.items():
+            header(name, 'gauge')
+            for labels, value in samples:
+                sample(name, labels, value)
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        self.registry.describe('http_request_duration_seconds', 'histogram', 'Time to produce the response')
+        self.registry.describe('http_request_queries', 'histogram', 'SQL statements executed per request')
+        self.registry.describe('http_request_query_seconds', 'histogram', 'Time spent in SQL per request')
+        self.registry.describe('http_response_size_bytes', 'histogram', 'Response payload size')
+        self.registry.describe('http_requests_total', 'counter', 'Requests by route, method and status')
+        self.registry.describe('http_slow_requests_total', 'counter', 'Requests slower than SLOW_REQUEST_SECONDS')
+
+    def init_app(self, app, engines):
+        self.slow_seconds = app.config.get('SLOW_REQUEST_SECONDS')
+        self.profile_rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = app.config.get('PROFILE_DIR', 'profiles')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        for engine in engines:  # the main database and any shards
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+        g.metrics_profiler = None
+        if self.profile_rate and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.metrics_profiler = profiler
+            except ValueError:  # another profiler is already active
+                pass
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_query_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += time.perf_counter() - conn.info['metrics_query_started']
+
+    def _after_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+        registry = self.registry
+        registry.inc('http_requests_total', labels + (('status', response.status_code),))
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        registry.observe('http_request_queries', labels, g.metrics_queries, QUERY_COUNT_BUCKETS)
+        registry.observe('http_request_query_seconds', labels, g.metrics_query_time, LATENCY_BUCKETS)
+        # Streamed bodies have no length up front; they are measured as they are sent
+        if response.is_streamed:
+            response.response = self._count_streamed(response.response, labels)
+        else:
+            registry.observe('http_response_size_bytes', labels, response.content_length or 0, SIZE_BUCKETS)
+
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        if self.slow_seconds and elapsed >= self.slow_seconds:
+            registry.inc('http_slow_requests_total', labels)
+            log.warning('Slow request: %s %s took %.3fs, %d queries in %.3fs',
+                        request.method, request.full_path, elapsed, g.metrics_queries, g.metrics_query_time)
+            if profiler is not None:
+                self._dump_profile(profiler, route)
+        return response
+
+    def _count_streamed(self, body, labels):
+        size = 0
+        try:
+            for chunk in body:
+                size += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode())
+                yield chunk
+        finally:
+            if hasattr(body, 'close'):
+                body.close()  # lets stream_with_context tear down its request context
+            self.registry.observe('http_response_size_bytes', labels, size, SIZE_BUCKETS)
+
+    def _dump_profile(self, profiler, route):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.profile_dir, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+        log.warning('Profile written to %s\n%s', path, summary.getvalue())
+
+    def render(self):
+        return self.registry.render()
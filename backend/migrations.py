@@ -0,0 +1,287 @@
+"""Forward-only schema migrations.
+
+``db_create`` builds a fresh schema with ``create_all``; databases that already
+hold data are brought up to date with ``flask db_upgrade`` instead of the
+destructive ``db_migrate``. Each migration runs once, in its own transaction,
+and is recorded in ``schema_migrations``. Migrations must be idempotent
+(``IF NOT EXISTS``, ``checkfirst=True`` and friends) because ``db_create``
+also runs them on top of a schema that ``create_all`` has already built, and
+must cope with columns that later migrations have since removed. DDL is
+either built with SQLAlchemy constructs or written to run on both SQLite and
+PostgreSQL, with per-dialect branches where the two differ.
+
+Online migrations (``@migration(n, online=True)``) are handed the engine
+instead of a connection and commit in small batches, so a large backfill never
+holds the write lock for long and can be resumed if it is interrupted.
+"""
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, PrimaryKeyConstraint, String,
+                        Table, Text, UniqueConstraint, exc, func, inspect, text)
+
+from search import FTS_CREATE, FTS_REBUILD
+
+MIGRATIONS = []
+BACKFILL_BATCH = 1000
+
+
+# Tables as the migration creating them defined them, frozen here rather than
+# taken from models.py; create() emits the DDL for whichever database is
+# connected (quoting "user", SERIAL vs AUTOINCREMENT and so on).
+schema = MetaData()
+Table('user', schema, Column('id', Integer, primary_key=True))  # only for the foreign keys below
+
+workout_session_v2 = Table(
+    'workout_session', schema,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('title', String(120), nullable=False),
+    Column('exercise_count', Integer, nullable=False),
+    Column('total_volume', Integer, nullable=False),
+    Column('total_rest', Integer, nullable=False),
+    Column('latest_workout_id', Integer, nullable=False),
+    UniqueConstraint('user_id', 'title', name='uq_workout_session_user_title'))
+
+exercise_v5 = Table(
+    'exercise', schema,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(120), nullable=False),
+    Column('description', Text),
+    UniqueConstraint('name', name='uq_exercise_name'))
+
+rollups_v8 = [Table(
+    name, schema,
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('exercise_id', Integer, ForeignKey('exercise.id'), nullable=False),
+    Column('period_start', Date, nullable=False),
+    Column('workouts', Integer, nullable=False),
+    Column('sets', Integer, nullable=False),
+    Column('reps', Integer, nullable=False),
+    Column('volume', Float, nullable=False),
+    Column('max_weight', Float, nullable=False),
+    Column('best_1rm', Float, nullable=False),
+    PrimaryKeyConstraint('user_id', 'exercise_id', 'period_start')) for name in ('exercise_daily', 'exercise_weekly')]
+
+search_term_v9 = Table(
+    'search_term', schema,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('kind', String(16), nullable=False),
+    Column('ref_id', Integer, nullable=False),
+    Column('name', String(120), nullable=False),
+    Column('uses', Integer, nullable=False),
+    UniqueConstraint('user_id', 'kind', 'ref_id', name='uq_search_term_ref'))
+
+workout_change_v10 = Table(
+    'workout_change', schema,
+    Column('seq', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('op', String(8), nullable=False),
+    Column('workout_id', Integer, nullable=False),
+    Column('data', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False, server_default=func.current_timestamp()),
+    sqlite_autoincrement=True)
+
+user_counters_v11 = Table(
+    'user_counters', schema,
+    Column('user_id', Integer, ForeignKey('user.id'), primary_key=True, autoincrement=False),
+    Column('data_version', Integer, nullable=False, server_default='0'),
+    Column('changes_pruned_seq', Integer, nullable=False, server_default='0'))
+
+
+def migration(version, online=False):
+    def register(fn):
+        MIGRATIONS.append((version, fn, online))
+        return fn
+    return register
+
+
+def columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+@migration(1)
+def add_workout_indexes(conn):
+    # Every workout endpoint filters on user_id, most of them on session_title too
+    if 'session_title' in columns(conn, 'workout'):
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_workout_user_session ON workout (user_id, session_title)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_workout_user_id ON workout (user_id, id)'))
+
+
+@migration(2)
+def add_workout_sessions(conn):
+    workout_session_v2.create(conn, checkfirst=True)
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_workout_session_user_latest ON workout_session (user_id, latest_workout_id)'))
+    # Backfill summaries for sessions written before the table existed
+    if 'session_title' in columns(conn, 'workout'):
+        insert_missing_sessions(conn)
+
+
+def insert_missing_sessions(conn):
+    conn.execute(text(
+        'INSERT INTO workout_session (user_id, title, exercise_count, total_volume, total_rest, latest_workout_id)'
+        ' SELECT w.user_id, w.session_title, count(*), sum(w.sets * w.reps), sum(w.rest), max(w.id)'
+        ' FROM workout w'
+        ' WHERE NOT EXISTS (SELECT 1 FROM workout_session s'
+        '                   WHERE s.user_id = w.user_id AND s.title = w.session_title)'
+        ' GROUP BY w.user_id, w.session_title'))
+
+
+@migration(3)
+def widen_password_hash(conn):
+    # scrypt hashes don't fit in VARCHAR(128); SQLite doesn't enforce lengths
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+    elif conn.dialect.name == 'mysql':
+        conn.execute(text('ALTER TABLE user MODIFY password_hash VARCHAR(256)'))
+
+
+@migration(4)
+def add_user_data_version(conn):
+    if 'data_version' not in columns(conn, 'user'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+
+
+# Migrations 5-7 normalise the workout table: exercise names move to an
+# exercise dictionary and session titles to workout_session, and each workout
+# row points at both by id. 5 adds the new columns, 6 fills them in batches
+# while the old code keeps running, 7 catches up stragglers and drops the old
+# text columns.
+
+@migration(5)
+def add_exercise_dictionary(conn):
+    exercise_v5.create(conn, checkfirst=True)
+    existing = columns(conn, 'workout')
+    if 'session_id' not in existing:
+        conn.execute(text('ALTER TABLE workout ADD COLUMN session_id INTEGER REFERENCES workout_session (id)'))
+    if 'exercise_id' not in existing:
+        conn.execute(text('ALTER TABLE workout ADD COLUMN exercise_id INTEGER REFERENCES exercise (id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_workout_session_id ON workout (session_id, id)'))
+
+
+def insert_missing_exercises(conn):
+    conn.execute(text(
+        'INSERT INTO exercise (name)'
+        ' SELECT DISTINCT w.exercise FROM workout w'
+        ' WHERE NOT EXISTS (SELECT 1 FROM exercise e WHERE e.name = w.exercise)'))
+
+
+FILL_WORKOUT_IDS = text(
+    'UPDATE workout SET'
+    ' session_id = (SELECT s.id FROM workout_session s'
+    '               WHERE s.user_id = workout.user_id AND s.title = workout.session_title),'
+    ' exercise_id = (SELECT e.id FROM exercise e WHERE e.name = workout.exercise)'
+    ' WHERE id > :low AND id <= :high AND (session_id IS NULL OR exercise_id IS NULL)')
+
+
+@migration(6, online=True)
+def backfill_workout_ids(engine):
+    with engine.begin() as conn:
+        if 'session_title' not in columns(conn, 'workout'):
+            return
+        insert_missing_sessions(conn)
+        insert_missing_exercises(conn)
+        high = conn.execute(text('SELECT max(id) FROM workout')).scalar() or 0
+    # Walk the primary key in ranges, one short transaction per batch
+    for low in range(0, high, BACKFILL_BATCH):
+        with engine.begin() as conn:
+            conn.execute(FILL_WORKOUT_IDS, {'low': low, 'high': low + BACKFILL_BATCH})
+
+
+@migration(7)
+def drop_workout_text_columns(conn):
+    existing = columns(conn, 'workout')
+    if 'session_title' not in existing:
+        return
+    # Rows written by the old code while the backfill was running
+    insert_missing_sessions(conn)
+    insert_missing_exercises(conn)
+    conn.execute(FILL_WORKOUT_IDS, {'low': 0, 'high': conn.execute(text('SELECT max(id) FROM workout')).scalar() or 0})
+    if conn.dialect.name == 'mysql':
+        conn.execute(text('DROP INDEX ix_workout_user_session ON workout'))
+    else:
+        conn.execute(text('DROP INDEX IF EXISTS ix_workout_user_session'))
+    conn.execute(text('ALTER TABLE workout DROP COLUMN session_title'))
+    conn.execute(text('ALTER TABLE workout DROP COLUMN exercise'))
+
+
+@migration(8)
+def add_workout_date_weight_rollups(conn):
+    # Workouts recorded before this have no date and stay out of the analytics
+    existing = columns(conn, 'workout')
+    if 'date' not in existing:
+        conn.execute(text('ALTER TABLE workout ADD COLUMN date DATE'))
+    if 'weight' not in existing:
+        conn.execute(text('ALTER TABLE workout ADD COLUMN weight FLOAT NOT NULL DEFAULT 0'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_workout_user_exercise_date ON workout (user_id, exercise_id, date)'))
+    for table in rollups_v8:
+        table.create(conn, checkfirst=True)
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_{table.name}_user_period ON {table.name} (user_id, period_start)'))
+
+
+@migration(9)
+def add_search_index(conn):
+    search_term_v9.create(conn, checkfirst=True)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_search_term_user_name ON search_term (user_id, name)'))
+    conn.execute(text(
+        "INSERT INTO search_term (user_id, kind, ref_id, name, uses)"
+        " SELECT s.user_id, 'session', s.id, s.title, s.exercise_count FROM workout_session s"
+        " WHERE NOT EXISTS (SELECT 1 FROM search_term t"
+        "                   WHERE t.user_id = s.user_id AND t.kind = 'session' AND t.ref_id = s.id)"))
+    conn.execute(text(
+        "INSERT INTO search_term (user_id, kind, ref_id, name, uses)"
+        " SELECT w.user_id, 'exercise', e.id, e.name, count(*) FROM workout w JOIN exercise e ON e.id = w.exercise_id"
+        " WHERE NOT EXISTS (SELECT 1 FROM search_term t"
+        "                   WHERE t.user_id = w.user_id AND t.kind = 'exercise' AND t.ref_id = e.id)"
+        " GROUP BY w.user_id, e.id, e.name"))
+    if conn.dialect.name == 'sqlite':
+        try:
+            conn.execute(FTS_CREATE)
+        except exc.OperationalError:
+            return  # built without FTS5; search uses LIKE instead
+        conn.execute(FTS_REBUILD)
+
+
+@migration(10)
+def add_change_log(conn):
+    workout_change_v10.create(conn, checkfirst=True)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_workout_change_user_seq ON workout_change (user_id, seq)'))
+    if 'changes_pruned_seq' not in columns(conn, 'user'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN changes_pruned_seq INTEGER NOT NULL DEFAULT 0'))
+
+
+@migration(11)
+def add_user_counters(conn):
+    # data_version and changes_pruned_seq move next to the workouts they count,
+    # so a workout write doesn't need the user table (which sharding keeps apart)
+    user_counters_v11.create(conn, checkfirst=True)
+    if 'data_version' in columns(conn, 'user'):
+        conn.execute(text(
+            'INSERT INTO user_counters (user_id, data_version, changes_pruned_seq)'
+            ' SELECT id, data_version, changes_pruned_seq FROM "user"'
+            ' WHERE id NOT IN (SELECT user_id FROM user_counters)'))
+        conn.execute(text('ALTER TABLE "user" DROP COLUMN data_version'))
+        conn.execute(text('ALTER TABLE "user" DROP COLUMN changes_pruned_seq'))
+
+
+def applied_versions(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)'))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(engine):
+    """Apply pending migrations in version order and return the versions applied."""
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    ran = []
+    for version, fn, online in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        if online:
+            fn(engine)
+        with engine.begin() as conn:
+            if not online:
+                fn(conn)
+            conn.execute(text('INSERT INTO schema_migrations (version) VALUES (:v)'), {'v': version})
+        ran.append(version)
+    return ran
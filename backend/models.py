@@ -0,0 +1,599 @@
+"""Database models and the bookkeeping every workout write goes through.
+
+Besides the workout rows, each write keeps three derived structures current:
+the per-session summaries behind the session list, the daily and weekly
+exercise rollups behind analytics, and the search vocabulary behind
+/api/search. The write handlers call the helpers here in that order, append
+the workouts they inserted or deleted to the user's change log (see
+changes.py) and then bump the user's data_version, which invalidates their
+cached responses.
+"""
+import datetime
+import importlib
+
+import sqlalchemy
+from flask import current_app
+from flask_login import UserMixin
+
+from extensions import db, exercise_cache, password_hasher
+from search import FTS_DELETE, FTS_INSERT, fts5_available
+
+
+class User(db.Model, UserMixin):  # Make sure UserMixin is included here
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(64), index=True, unique=True)
+    email = db.Column(db.String(120), index=True, unique=True)
+    password_hash = db.Column(db.String(256))  # scrypt hashes are longer than 128 characters
+
+    def set_password(self, password):
+        self.password_hash = password_hasher.hash(password)
+
+    def check_password(self, password):
+        return password_hasher.verify(self.password_hash, password)
+
+    @property
+    def is_active(self):
+        return True
+
+# Per-user counters, kept in the same database as the user's workouts (see
+# sharding.py) so a workout write never has to touch the user table.
+class UserCounters(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # Bumped by every workout write; workout GETs derive their ETags from it
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Highest change-log seq of theirs that prune_changes has deleted; older cursors must resync
+    changes_pruned_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Exercise names are stored once per database; workout rows refer to them by id
+class Exercise(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    description = db.Column(db.Text)
+
+    # Keep in sync with migrations.add_exercise_dictionary
+    __table_args__ = (db.UniqueConstraint('name', name='uq_exercise_name'),)
+
+# Per-user workout session. Besides the title it holds a summary that the
+# workout write handlers keep up to date, so the session list never has to
+# aggregate workout rows.
+class WorkoutSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(120), nullable=False)
+    exercise_count = db.Column(db.Integer, nullable=False, default=0)
+    total_volume = db.Column(db.Integer, nullable=False, default=0)  # sum of sets * reps
+    total_rest = db.Column(db.Integer, nullable=False, default=0)
+    latest_workout_id = db.Column(db.Integer, nullable=False, default=0)
+
+    # Keep in sync with migrations.add_workout_sessions
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'title', name='uq_workout_session_user_title'),
+        db.Index('ix_workout_session_user_latest', 'user_id', 'latest_workout_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'session_title': self.title,
+            'exercise_count': self.exercise_count,
+            'total_volume': self.total_volume,
+            'total_rest': self.total_rest,
+            'latest_id': self.latest_workout_id
+        }
+
+# Define the Workout model: one exercise performed in a session
+class Workout(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Link to User model
+    session_id = db.Column(db.Integer, db.ForeignKey('workout_session.id'), nullable=False)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    sets = db.Column(db.Integer, nullable=False)
+    reps = db.Column(db.Integer, nullable=False)
+    rest = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.Date)  # NULL for workouts recorded before dates were tracked
+    weight = db.Column(db.Float, nullable=False, default=0)
+
+    # Both are loaded in the same SELECT as the workout rows
+    session = db.relationship(WorkoutSession, lazy='joined', innerjoin=True)
+    exercise = db.relationship(Exercise, lazy='joined', innerjoin=True)
+
+    # Keep in sync with migrations.add_workout_indexes, add_exercise_dictionary
+    # and add_workout_date_weight_rollups
+    __table_args__ = (
+        db.Index('ix_workout_user_id', 'user_id', 'id'),
+        db.Index('ix_workout_session_id', 'session_id', 'id'),
+        db.Index('ix_workout_user_exercise_date', 'user_id', 'exercise_id', 'date'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'session_title': self.session.title,
+            'exercise': self.exercise.name,
+            'sets': self.sets,
+            'reps': self.reps,
+            'rest': self.rest,
+            'date': self.date.isoformat() if self.date else None,
+            'weight': self.weight
+        }
+
+    def __repr__(self):
+        return f'<Workout {self.exercise.name}>'
+
+# Progress analytics read per-user, per-exercise rollups by day and by ISO week,
+# so a year of history is a few hundred rows however many workouts it holds.
+# Single inserts fold their numbers straight in; deletes and bulk writes
+# recompute the buckets they touched.
+class ExerciseRollup:
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    workouts = db.Column(db.Integer, nullable=False, default=0)
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)  # sum of sets * reps
+    volume = db.Column(db.Float, nullable=False, default=0)  # sum of sets * reps * weight
+    max_weight = db.Column(db.Float, nullable=False, default=0)
+    best_1rm = db.Column(db.Float, nullable=False, default=0)  # best Epley estimate
+
+    # Keep in sync with migrations.add_workout_date_weight_rollups
+    @db.declared_attr
+    def __table_args__(cls):
+        return (db.Index(f'ix_{cls.__tablename__}_user_period', 'user_id', 'period_start'),)
+
+class DailyExerciseRollup(ExerciseRollup, db.Model):
+    __tablename__ = 'exercise_daily'
+
+class WeeklyExerciseRollup(ExerciseRollup, db.Model):
+    __tablename__ = 'exercise_weekly'
+
+# A user's search vocabulary: one row per session and per exercise they use,
+# indexed for prefix search (see search.py)
+class SearchTerm(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # 'session' or 'exercise'
+    ref_id = db.Column(db.Integer, nullable=False)  # workout_session.id or exercise.id
+    name = db.Column(db.String(120), nullable=False)
+    uses = db.Column(db.Integer, nullable=False, default=0)  # workouts in the session / with the exercise
+
+    # Keep in sync with migrations.add_search_index
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'ref_id', name='uq_search_term_ref'),
+        db.Index('ix_search_term_user_name', 'user_id', 'name'),
+    )
+
+    def to_dict(self):
+        return {'kind': self.kind, 'name': self.name, 'uses': self.uses}
+
+# Per-user change log: one row per workout inserted or deleted, in commit
+# order. Clients that already hold a user's data catch up from the seq they
+# last saw instead of downloading everything again.
+class WorkoutChange(db.Model):
+    seq = db.Column(db.Integer, primary_key=True)  # AUTOINCREMENT, so never reused after pruning
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    op = db.Column(db.String(8), nullable=False)  # 'insert' or 'delete'
+    workout_id = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # the workout as JSON; deletes carry what the summaries need
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+    # Keep in sync with migrations.add_change_log
+    __table_args__ = (
+        db.Index('ix_workout_change_user_seq', 'user_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+    def to_json(self):
+        # data is already JSON, so it is spliced in rather than decoded and encoded again
+        return f'{{"seq":{self.seq},"op":"{self.op}","workout":{self.data}}}'
+
+ROLLUP_TOTALS = ('workouts', 'sets', 'reps', 'volume')
+ROLLUP_MAXIMA = ('max_weight', 'best_1rm')
+
+# Databases with INSERT ... ON CONFLICT, and the module whose insert() builds it
+UPSERT_DIALECTS = {'sqlite': 'sqlalchemy.dialects.sqlite', 'postgresql': 'sqlalchemy.dialects.postgresql'}
+
+def intern_ids(model, column, values, **scope):
+    """Map values of a unique ``column`` to row ids, inserting rows for new values.
+
+    Returns ``(ids, created)`` where ``created`` is the set of values inserted here.
+    """
+    values = set(values)
+    filters = [getattr(model, name) == value for name, value in scope.items()]
+    ids = dict(db.session.execute(db.select(column, model.id).where(column.in_(values), *filters)).all())
+    created = set()
+    dialect = db.session.get_bind().dialect.name
+    for value in values - ids.keys():
+        if dialect in UPSERT_DIALECTS:
+            # No savepoint: pysqlite doesn't BEGIN before one, so releasing it would commit the request's
+            # writes so far. A row another request inserted in the meantime is skipped and looked up below.
+            insert = importlib.import_module(UPSERT_DIALECTS[dialect]).insert(model.__table__)
+            row_id = db.session.scalar(insert.values(**{column.key: value}, **scope)
+                                       .on_conflict_do_nothing().returning(model.id))
+        else:
+            try:
+                with db.session.begin_nested():
+                    row = model(**{column.key: value}, **scope)
+                    db.session.add(row)
+                row_id = row.id
+            except sqlalchemy.exc.IntegrityError:
+                row_id = None
+        if row_id is None:
+            # Another request inserted it in the meantime
+            row_id = db.session.scalar(db.select(model.id).where(column == value, *filters))
+        else:
+            created.add(value)
+        ids[value] = row_id
+    return ids, created
+
+# Exercise names are interned through a per-process cache, so adding a workout
+# normally costs no dictionary lookup. Ids never change once assigned; ids of
+# names inserted by the current transaction are only cached after it commits.
+# Each shard has its own dictionary, so the cache is keyed by shard and name.
+
+def exercise_ids(names):
+    shard = db.session.info.get('shard')
+    ids, missing = {}, set()
+    for name in set(names):
+        exercise_id = exercise_cache.get((shard, name))
+        if exercise_id is None:
+            missing.add(name)
+        else:
+            ids[name] = exercise_id
+    if missing:
+        found, created = intern_ids(Exercise, Exercise.name, missing)
+        pending = db.session.info.setdefault('new_exercise_ids', {})
+        for name, exercise_id in found.items():
+            if name in created:
+                pending[(shard, name)] = exercise_id
+            else:
+                exercise_cache.set((shard, name), exercise_id)
+        ids.update(found)
+    return ids
+
+@db.event.listens_for(db.session, 'after_commit')
+def cache_new_exercises(session):
+    for key, exercise_id in session.info.pop('new_exercise_ids', {}).items():
+        exercise_cache.set(key, exercise_id)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_new_exercises(session):
+    session.info.pop('new_exercise_ids', None)
+
+def user_session_ids(user_id, titles):
+    return intern_ids(WorkoutSession, WorkoutSession.title, titles, user_id=user_id)[0]
+
+def workout_rows(user_id, items):
+    """Turn validated workout payloads into ``workout`` column values."""
+    sessions = user_session_ids(user_id, {item['session_title'] for item in items})
+    exercises = exercise_ids(item['exercise'] for item in items)
+    return [{'user_id': user_id, 'session_id': sessions[item['session_title']],
+             'exercise_id': exercises[item['exercise']],
+             'sets': item['sets'], 'reps': item['reps'], 'rest': item['rest'],
+             'date': item['date'], 'weight': item['weight']} for item in items]
+
+def session_added(workout):
+    """Fold a freshly flushed workout into its session summary."""
+    summary = WorkoutSession
+    db.session.execute(
+        db.update(summary)
+        .where(summary.id == workout.session_id)
+        .values(exercise_count=summary.exercise_count + 1,
+                total_volume=summary.total_volume + workout.sets * workout.reps,
+                total_rest=summary.total_rest + workout.rest,
+                latest_workout_id=workout.id))
+
+def sessions_added(rows):
+    """Fold freshly inserted workout rows (dicts with their ids) into their session summaries.
+
+    One UPDATE per session touched, however many rows went into it, so batch
+    after batch of a large import costs the same.
+    """
+    totals = {}
+    for row in rows:
+        total = totals.get(row['session_id'])
+        if total is None:
+            total = totals[row['session_id']] = {'b_id': row['session_id'], 'b_count': 0, 'b_volume': 0,
+                                                 'b_rest': 0, 'b_latest': 0}
+        total['b_count'] += 1
+        total['b_volume'] += row['sets'] * row['reps']
+        total['b_rest'] += row['rest']
+        total['b_latest'] = max(total['b_latest'], row['id'])
+    if not totals:
+        return
+    summary = WorkoutSession.__table__.c
+    latest = db.bindparam('b_latest')
+    db.session.execute(
+        db.update(WorkoutSession.__table__)
+        .where(summary.id == db.bindparam('b_id'))
+        .values(exercise_count=summary.exercise_count + db.bindparam('b_count'),
+                total_volume=summary.total_volume + db.bindparam('b_volume'),
+                total_rest=summary.total_rest + db.bindparam('b_rest'),
+                latest_workout_id=db.case((summary.latest_workout_id < latest, latest),
+                                          else_=summary.latest_workout_id)),
+        list(totals.values()))
+
+def session_removed(workout):
+    """Take a deleted workout (or a RETURNING row of it) back out of its session summary."""
+    summary = db.session.get(WorkoutSession, workout.session_id)
+    if summary is None:
+        return
+    if summary.exercise_count <= 1:
+        db.session.delete(summary)
+        return
+    summary.exercise_count -= 1
+    summary.total_volume -= workout.sets * workout.reps
+    summary.total_rest -= workout.rest
+    if summary.latest_workout_id == workout.id:
+        summary.latest_workout_id = db.session.scalar(
+            db.select(db.func.max(Workout.id))
+            .where(Workout.session_id == workout.session_id, Workout.id != workout.id))
+
+def refresh_session_summaries(session_ids):
+    """Recompute the summaries of the given sessions from their workout rows.
+
+    Used after set-based writes where per-row deltas aren't available. Sessions
+    left without workouts are deleted.
+    """
+    session_ids = set(session_ids)
+    if not session_ids:
+        return
+    totals = {row[0]: row[1:] for row in db.session.execute(
+        db.select(Workout.session_id, db.func.count(), db.func.sum(Workout.sets * Workout.reps),
+                  db.func.sum(Workout.rest), db.func.max(Workout.id))
+        .where(Workout.session_id.in_(session_ids))
+        .group_by(Workout.session_id))}
+    for summary in db.session.scalars(db.select(WorkoutSession).where(WorkoutSession.id.in_(session_ids))):
+        if summary.id not in totals:
+            db.session.delete(summary)
+            continue
+        summary.exercise_count, summary.total_volume, summary.total_rest, summary.latest_workout_id = \
+            totals[summary.id]
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())  # ISO weeks start on Monday
+
+def estimated_1rm(weight, reps):
+    # Epley; a single rep is the one-rep max itself
+    if not reps:
+        return 0.0
+    return weight if reps == 1 else weight * (1 + reps / 30)
+
+ESTIMATED_1RM = db.case((Workout.reps == 0, 0.0), (Workout.reps == 1, Workout.weight),
+                        else_=Workout.weight * (1 + Workout.reps / 30.0))
+
+def rollup_statements(model):
+    # Built once with bound parameters; constructing them is most of the cost of a write
+    table = model.__table__
+    key = (table.c.user_id == db.bindparam('b_user_id'), table.c.exercise_id == db.bindparam('b_exercise_id'),
+           table.c.period_start == db.bindparam('b_period_start'))
+    weight, one_rm = db.bindparam('b_weight'), db.bindparam('b_one_rm')
+    update = db.update(table).where(*key).values(
+        workouts=table.c.workouts + db.bindparam('b_workouts'),
+        sets=table.c.sets + db.bindparam('b_sets'),
+        reps=table.c.reps + db.bindparam('b_reps'),
+        volume=table.c.volume + db.bindparam('b_volume'),
+        max_weight=db.case((table.c.max_weight < weight, weight), else_=table.c.max_weight),
+        best_1rm=db.case((table.c.best_1rm < one_rm, one_rm), else_=table.c.best_1rm))
+    insert = db.insert(table).values(
+        user_id=db.bindparam('b_user_id'), exercise_id=db.bindparam('b_exercise_id'),
+        period_start=db.bindparam('b_period_start'), workouts=db.bindparam('b_workouts'), sets=db.bindparam('b_sets'),
+        reps=db.bindparam('b_reps'), volume=db.bindparam('b_volume'), max_weight=weight, best_1rm=one_rm)
+    return update, insert
+
+ROLLUP_STATEMENTS = ((rollup_statements(DailyExerciseRollup), lambda day: day),
+                     (rollup_statements(WeeklyExerciseRollup), week_start))
+
+def rollups_added(workout):
+    """Fold a freshly inserted workout into its daily and weekly rollups."""
+    if workout.date is None:
+        return
+    volume = workout.sets * workout.reps
+    params = {'b_user_id': workout.user_id, 'b_exercise_id': workout.exercise_id, 'b_workouts': 1,
+              'b_sets': workout.sets, 'b_reps': volume, 'b_volume': volume * workout.weight, 'b_weight': workout.weight,
+              'b_one_rm': estimated_1rm(workout.weight, workout.reps)}
+    for (update, insert), period_start in ROLLUP_STATEMENTS:
+        params['b_period_start'] = period_start(workout.date)
+        if not db.session.execute(update, params).rowcount:
+            db.session.execute(insert, params)
+
+def daily_rollup_query(*filters):
+    volume = Workout.sets * Workout.reps
+    return (db.select(Workout.user_id, Workout.exercise_id, Workout.date, db.func.count(), db.func.sum(Workout.sets),
+                      db.func.sum(volume), db.func.sum(volume * Workout.weight), db.func.max(Workout.weight),
+                      db.func.max(ESTIMATED_1RM))
+            .where(Workout.date.is_not(None), *filters)
+            .group_by(Workout.user_id, Workout.exercise_id, Workout.date))
+
+ROLLUP_COLUMNS = ('user_id', 'exercise_id', 'period_start') + ROLLUP_TOTALS + ROLLUP_MAXIMA
+
+rollup_upserts = {}  # (model, dialect name) -> statement, built on first use
+
+def rollup_upsert(model, dialect):
+    statement = rollup_upserts.get((model, dialect))
+    if statement is None:
+        insert = importlib.import_module(UPSERT_DIALECTS[dialect]).insert(model.__table__)
+        current, new = model.__table__.c, insert.excluded
+        statement = insert.on_conflict_do_update(
+            index_elements=['user_id', 'exercise_id', 'period_start'],
+            set_=dict({name: current[name] + new[name] for name in ROLLUP_TOTALS},
+                      **{name: db.case((current[name] < new[name], new[name]), else_=current[name])
+                         for name in ROLLUP_MAXIMA}))
+        rollup_upserts[(model, dialect)] = statement
+    return statement
+
+# rollup_statements parameter for each rollup column
+ROLLUP_PARAMS = dict(zip(ROLLUP_COLUMNS, ('b_user_id', 'b_exercise_id', 'b_period_start', 'b_workouts', 'b_sets',
+                                          'b_reps', 'b_volume', 'b_weight', 'b_one_rm')))
+
+def rollups_added_rows(rows):
+    """Fold freshly inserted workout rows (dicts) into their rollups.
+
+    The rows are summed per bucket first and the sums added to what's stored,
+    so a batch costs one upsert per day and week it touches rather than a
+    recompute of the range.
+    """
+    dialect = db.session.get_bind().dialect.name
+    for model, ((update, insert), period_start) in zip((DailyExerciseRollup, WeeklyExerciseRollup),
+                                                       ROLLUP_STATEMENTS):
+        buckets = {}
+        for row in rows:
+            if row['date'] is None:
+                continue
+            key = (row['user_id'], row['exercise_id'], period_start(row['date']))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = dict(zip(('user_id', 'exercise_id', 'period_start'), key), workouts=0,
+                                             sets=0, reps=0, volume=0.0, max_weight=0.0, best_1rm=0.0)
+            volume = row['sets'] * row['reps']
+            bucket['workouts'] += 1
+            bucket['sets'] += row['sets']
+            bucket['reps'] += volume
+            bucket['volume'] += volume * row['weight']
+            bucket['max_weight'] = max(bucket['max_weight'], row['weight'])
+            bucket['best_1rm'] = max(bucket['best_1rm'], estimated_1rm(row['weight'], row['reps']))
+        if not buckets:
+            continue
+        if dialect in UPSERT_DIALECTS:  # a whole batch of deltas in one executemany
+            db.session.execute(rollup_upsert(model, dialect), list(buckets.values()))
+            continue
+        for bucket in buckets.values():
+            params = {ROLLUP_PARAMS[name]: value for name, value in bucket.items()}
+            if not db.session.execute(update, params).rowcount:
+                db.session.execute(insert, params)
+
+def weekly_from_daily(rows):
+    """Merge daily rollup rows into weekly rollup values."""
+    weeks = {}
+    for row in rows:
+        key = (row.user_id, row.exercise_id, week_start(row.period_start))
+        week = weeks.get(key)
+        if week is None:
+            weeks[key] = week = dict(zip(('user_id', 'exercise_id', 'period_start'), key),
+                                     **{name: 0 for name in ROLLUP_TOTALS + ROLLUP_MAXIMA})
+        for name in ROLLUP_TOTALS:
+            week[name] += getattr(row, name)
+        for name in ROLLUP_MAXIMA:
+            week[name] = max(week[name], getattr(row, name))
+    return list(weeks.values())
+
+def rebuild_rollups_where(daily_filters, weekly_filters, workout_filters):
+    """Replace the rollups matching the filters; the daily filters must cover whole weeks."""
+    daily, weekly = DailyExerciseRollup, WeeklyExerciseRollup
+    db.session.execute(db.delete(daily).where(*daily_filters), execution_options={'synchronize_session': False})
+    db.session.execute(db.delete(weekly).where(*weekly_filters), execution_options={'synchronize_session': False})
+    db.session.execute(db.insert(daily).from_select(ROLLUP_COLUMNS, daily_rollup_query(*workout_filters)))
+    days = db.session.execute(db.select(*[getattr(daily, name) for name in ROLLUP_COLUMNS]).where(*daily_filters))
+    weeks = weekly_from_daily(days)
+    if weeks:
+        db.session.execute(db.insert(weekly), weeks)
+
+def refresh_rollups(user_id, days):
+    """Recompute the rollups around the given ``(exercise_id, date)`` pairs.
+
+    Used after deletes and set-based writes. Every day from the first to the
+    last affected week is recomputed for the affected exercises.
+    """
+    days = {(exercise_id, day) for exercise_id, day in days if day is not None}
+    if not days:
+        return
+    exercise_ids = {exercise_id for exercise_id, _ in days}
+    first = week_start(min(day for _, day in days))
+    last = week_start(max(day for _, day in days)) + datetime.timedelta(days=6)
+    daily, weekly = DailyExerciseRollup, WeeklyExerciseRollup
+    rebuild_rollups_where(
+        (daily.user_id == user_id, daily.exercise_id.in_(exercise_ids), daily.period_start.between(first, last)),
+        (weekly.user_id == user_id, weekly.exercise_id.in_(exercise_ids), weekly.period_start.between(first, last)),
+        (Workout.user_id == user_id, Workout.exercise_id.in_(exercise_ids), Workout.date.between(first, last)))
+
+search_index = sqlalchemy.table('search_index', sqlalchemy.column('rowid'))
+fts_by_engine = {}  # engine url -> whether the database has the FTS5 index; checked on first use
+
+def search_uses_fts():
+    engine = db.session.get_bind()  # the user's shard, if sharded
+    if engine.url not in fts_by_engine:
+        with engine.connect() as conn:
+            fts_by_engine[engine.url] = fts5_available(conn)
+    return fts_by_engine[engine.url]
+
+def update_search_terms(user_id, changes):
+    """Apply ``{(kind, ref_id): change in uses}`` to the user's search terms.
+
+    Terms are added when first used and dropped once nothing uses them.
+    """
+    changes = {key: change for key, change in changes.items() if change}
+    if not changes:
+        return
+    session_ids = [ref_id for kind, ref_id in changes if kind == 'session']
+    exercise_ids = [ref_id for kind, ref_id in changes if kind == 'exercise']
+    terms = {(term.kind, term.ref_id): term for term in db.session.scalars(
+        db.select(SearchTerm).where(SearchTerm.user_id == user_id, db.or_(
+            db.and_(SearchTerm.kind == 'session', SearchTerm.ref_id.in_(session_ids)),
+            db.and_(SearchTerm.kind == 'exercise', SearchTerm.ref_id.in_(exercise_ids)))))}
+
+    new = [key for key, change in changes.items() if key not in terms and change > 0]
+    names = {}
+    if any(kind == 'session' for kind, _ in new):
+        names.update((('session', id), title) for id, title in db.session.execute(
+            db.select(WorkoutSession.id, WorkoutSession.title).where(WorkoutSession.id.in_(session_ids))))
+    if any(kind == 'exercise' for kind, _ in new):
+        names.update((('exercise', id), name) for id, name in db.session.execute(
+            db.select(Exercise.id, Exercise.name).where(Exercise.id.in_(exercise_ids))))
+
+    added, removed = [], []
+    for key, change in changes.items():
+        term = terms.get(key)
+        if term is None:
+            if change > 0:
+                term = SearchTerm(user_id=user_id, kind=key[0], ref_id=key[1], name=names[key], uses=change)
+                db.session.add(term)
+                added.append(term)
+        elif term.uses + change > 0:
+            term.uses += change
+        else:
+            removed.append({'id': term.id, 'user_id': user_id, 'name': term.name})
+            db.session.delete(term)
+    if search_uses_fts() and (added or removed):
+        db.session.flush()
+        if removed:
+            db.session.execute(FTS_DELETE, removed)
+        if added:
+            db.session.execute(FTS_INSERT, [{'id': term.id, 'user_id': user_id, 'name': term.name} for term in added])
+
+def search_term_changes(rows, sign=1):
+    """Count workout rows (models, dicts or RETURNING rows) per session and exercise."""
+    changes = {}
+    for row in rows:
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+        for key in (('session', get('session_id')), ('exercise', get('exercise_id'))):
+            changes[key] = changes.get(key, 0) + sign
+    return changes
+
+def record_changes(user_id, op, workouts):
+    """Append an ``op`` event per workout dict (each with an ``id``) to the user's change log.
+
+    Streams in this process are woken once the transaction commits.
+    """
+    if not workouts:
+        return
+    dumps = current_app.json.dumps
+    db.session.execute(db.insert(WorkoutChange), [
+        {'user_id': user_id, 'op': op, 'workout_id': workout['id'], 'data': dumps(workout)}
+        for workout in workouts])
+    db.session.info.setdefault('changed_users', set()).add(user_id)
+
+def changes_pruned_seq(user_id):
+    return db.session.scalar(db.select(UserCounters.changes_pruned_seq).where(UserCounters.user_id == user_id)) or 0
+
+def latest_change_seq(user_id):
+    latest = db.session.scalar(db.select(db.func.max(WorkoutChange.seq)).where(WorkoutChange.user_id == user_id))
+    # Never below the pruned floor, or a cursor started from it would be expired straight away
+    return max(latest or 0, changes_pruned_seq(user_id))
+
+def bump_data_version(user_id):
+    counters = UserCounters
+    if not db.session.execute(db.update(counters).where(counters.user_id == user_id)
+                              .values(data_version=counters.data_version + 1)).rowcount:
+        db.session.execute(db.insert(counters).values(user_id=user_id, data_version=1))
+
+def current_data_version(user_id):
+    return db.session.scalar(db.select(UserCounters.data_version).where(UserCounters.user_id == user_id)) or 0
@@ -0,0 +1,241 @@
+"""Operational endpoints and CLI commands: metrics, cache stats, migrations.
+
+/metrics and /api/cache/stats answer only requests carrying METRICS_TOKEN as
+a bearer token (Prometheus: ``authorization: {credentials: ...}``); they are
+off while it is unset.
+
+The commands are registered without a group, so they run as e.g.
+``flask db_create`` with FLASK_APP=app.py. With SHARD_COUNT set, the schema
+commands cover the main database and every shard, and the data commands go
+through the shards one at a time.
+"""
+import datetime
+import hmac
+import sys
+from functools import wraps
+
+import click
+import sqlalchemy
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from changes import changes_query
+from extensions import (compressor, db, exercise_cache, media_store, password_hasher, request_metrics, response_cache,
+                        user_cache, write_slots)
+from migrations import upgrade
+from models import (DailyExerciseRollup, Exercise, SearchTerm, UserCounters, WeeklyExerciseRollup, Workout,
+                    WorkoutChange, WorkoutSession, daily_rollup_query, rebuild_rollups_where)
+from query_plans import check_query_plans as find_full_scans
+from rebalance import rebalance
+from sharding import shard_keys, use_shard
+import workouts
+from workouts import (analytics_query, delete_session_stmt, delete_workouts_stmt, search_terms_query,
+                      session_workouts_query, user_sessions_query, user_workouts_query)
+
+ops = Blueprint('ops', __name__, cli_group=None)
+
+@ops.route('/')
+def root():
+    return jsonify({"message": "Welcome to the Workout API!"}), 200
+
+@ops.cli.command('db_migrate')
+def db_migrate():
+    for engine in db.engines.values():
+        db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+    print("Database migrated.")
+
+
+@ops.cli.command('rebuild_rollups')
+@click.option('--batch', default=100, help='Users rebuilt per transaction.')
+def rebuild_rollups(batch):
+    # Recomputes every user's analytics rollups from their workouts, a batch of
+    # users per commit, e.g. after importing history or changing the rollups.
+    # Users who never wrote a workout have no counters row and nothing to rebuild.
+    daily, weekly = DailyExerciseRollup, WeeklyExerciseRollup
+    rebuilt = 0
+    for shard in shard_keys():
+        use_shard(shard)
+        last_id = 0
+        while True:
+            user_ids = db.session.scalars(
+                db.select(UserCounters.user_id).where(UserCounters.user_id > last_id)
+                .order_by(UserCounters.user_id).limit(batch)).all()
+            if not user_ids:
+                break
+            rebuild_rollups_where((daily.user_id.in_(user_ids),), (weekly.user_id.in_(user_ids),),
+                                  (Workout.user_id.in_(user_ids),))
+            db.session.commit()
+            last_id = user_ids[-1]
+            rebuilt += len(user_ids)
+            print(f"Rebuilt rollups for {rebuilt} users")
+
+@ops.cli.command('prune_changes')
+@click.option('--days', type=int, help='Keep this many days of changes (default: CHANGE_LOG_RETENTION_DAYS).')
+@click.option('--batch', default=1000, help='Changes deleted per transaction.')
+def prune_changes(days, batch):
+    # Deletes old change-log rows, oldest first, recording per user the last seq
+    # removed so a client still holding an older cursor is told to resync
+    if days is None:
+        days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(days=days)
+    pruned = 0
+    for shard in shard_keys():
+        use_shard(shard)
+        while True:
+            rows = db.session.execute(
+                db.select(WorkoutChange.seq, WorkoutChange.user_id)
+                .where(WorkoutChange.created_at < cutoff).order_by(WorkoutChange.seq).limit(batch)).all()
+            if not rows:
+                break
+            floors = {}
+            for seq, user_id in rows:
+                floors[user_id] = seq
+            # Every user with changes has a counters row: the write that logged them bumped it
+            db.session.execute(db.update(UserCounters), [{'user_id': user_id, 'changes_pruned_seq': seq}
+                                                         for user_id, seq in floors.items()])
+            db.session.execute(db.delete(WorkoutChange).where(WorkoutChange.seq.in_([seq for seq, _ in rows])),
+                               execution_options={'synchronize_session': False})
+            db.session.commit()
+            pruned += len(rows)
+            print(f"Pruned {pruned} changes")
+    print(f"Changes older than {days} days pruned ({pruned} rows).")
+
+@ops.cli.command('prune_uploads')
+@click.option('--hours', type=float, help='Delete resumable uploads untouched this long (default: UPLOAD_EXPIRY).')
+def prune_uploads(hours):
+    # Abandoned resumable uploads (and temp files of interrupted ones) would otherwise stay in .tmp for good
+    max_age = hours * 3600 if hours is not None else current_app.config['UPLOAD_EXPIRY']
+    pruned = media_store.prune_uploads(max_age)
+    print(f"Uploads untouched for {max_age / 3600:g} hours pruned ({pruned} uploads and temp files).")
+
+@ops.cli.command('db_create')
+def db_create():
+    for engine in db.engines.values():
+        db.metadata.create_all(engine)
+        upgrade(engine)
+    print("Database created.")
+
+@ops.cli.command('db_upgrade')
+def db_upgrade():
+    for key, engine in db.engines.items():
+        ran = upgrade(engine)
+        name = key or 'main database'
+        print(f"{name}: applied migrations {ran}" if ran else f"{name}: up to date.")
+
+@ops.cli.command('rebalance_shards')
+@click.option('--from-count', type=int, required=True,
+              help='SHARD_COUNT the data is laid out for now; 0 if it is all in the main database.')
+@click.option('--batch', default=500, help='Users checked per query.')
+def rebalance_shards(from_count, batch):
+    # Lays the data out for the configured SHARD_COUNT; run it with the app
+    # stopped. Safe to run again after an interruption.
+    count = current_app.config['SHARD_COUNT']
+    moved = rebalance(from_count, count, batch, progress=print)
+    print(f"Moved {moved} users (SHARD_COUNT {from_count} -> {count}).")
+
+def endpoint_queries():
+    # One entry per endpoint query; tests/test_query_plans.py fails if any of them scans
+    return [
+        ('manage_workouts', user_workouts_query(1)),
+        ('manage_workouts (page)', user_workouts_query(1, after_id=100, limit=50)),
+        ('get_session_workouts', session_workouts_query(1, 'Leg day')),
+        ('delete_session', delete_session_stmt(1, 'Leg day')),
+        ('delete_workout', delete_workouts_stmt(1, [1])),
+        ('delete_workouts', delete_workouts_stmt(1, [1, 2, 3])),
+        ('list_sessions', user_sessions_query(1)),
+        ('list_sessions (page)', user_sessions_query(1, before_id=100)),
+        ('exercise_ids', db.select(Exercise.name, Exercise.id).where(Exercise.name.in_(['Squat', 'Row']))),
+        ('user_session_ids', db.select(WorkoutSession.title, WorkoutSession.id)
+                             .where(WorkoutSession.title.in_(['Leg day']), WorkoutSession.user_id == 1)),
+        ('refresh_rollups', daily_rollup_query(Workout.user_id == 1, Workout.exercise_id.in_([1, 2]),
+                                               Workout.date.between(datetime.date(2024, 1, 1),
+                                                                    datetime.date(2024, 1, 7)))),
+        ('analytics', analytics_query(1, WeeklyExerciseRollup, datetime.date(2024, 1, 1),
+                                      datetime.date(2024, 12, 31), exercise_id=1)),
+        ('search', search_terms_query(1, ['squ', 'b'], fts=True)),
+        ('search (sessions)', search_terms_query(1, ['leg'], kind='session', fts=True)),
+        ('search (LIKE)', search_terms_query(1, ['squ', 'b'], fts=False)),
+        ('update_search_terms', db.select(SearchTerm).where(SearchTerm.user_id == 1, db.or_(
+            db.and_(SearchTerm.kind == 'session', SearchTerm.ref_id.in_([1])),
+            db.and_(SearchTerm.kind == 'exercise', SearchTerm.ref_id.in_([1, 2]))))),
+        ('list_changes', changes_query(1, 100)),
+        ('change_seq', db.select(db.func.max(WorkoutChange.seq)).where(WorkoutChange.user_id == 1)),
+        ('analytics (all exercises)', analytics_query(1, DailyExerciseRollup, datetime.date(2024, 1, 1),
+                                                      datetime.date(2024, 12, 31))),
+    ]
+
+@ops.cli.command('check_query_plans')
+def check_query_plans():
+    # Plans are checked against a scratch database built the same way db_create does
+    engine = sqlalchemy.create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    upgrade(engine)
+    failures = find_full_scans(engine, endpoint_queries())
+    for name, scans in failures.items():
+        print(f"FAIL {name}: {'; '.join(scans)}")
+    if failures:
+        sys.exit(1)
+    print("All endpoint queries use an index.")
+
+# LRUCache.stats() key -> metric family; hits, misses and evictions only ever go up
+CACHE_METRICS = {
+    'size': ('cache_size', 'gauge', 'Entries in the cache'),
+    'maxsize': ('cache_maxsize', 'gauge', 'Entries the cache holds at most'),
+    'hits': ('cache_hits_total', 'counter', 'Lookups that found an entry'),
+    'misses': ('cache_misses_total', 'counter', 'Lookups that found nothing'),
+    'evictions': ('cache_evictions_total', 'counter', 'Entries dropped to make room'),
+}
+OPS_METRICS = [
+    ('cache_not_modified_total', 'counter', 'Conditional GETs answered with 304'),
+    ('password_hash_rejected_total', 'counter', 'Logins and registrations turned away by a full hash pool'),
+    ('write_requests_in_flight', 'gauge', 'Write requests being handled'),
+    ('response_compressed_total', 'counter', 'Responses compressed'),
+    ('response_compressed_bytes_in_total', 'counter', 'Response bytes before compression'),
+    ('response_compressed_bytes_out_total', 'counter', 'Response bytes after compression'),
+]
+
+def cache_gauges():
+    gauges = []
+    for cache_name, cache in (('responses', response_cache), ('users', user_cache), ('exercises', exercise_cache),
+                              ('compressed', compressor.cache)):
+        for stat, value in cache.stats().items():
+            gauges.append((CACHE_METRICS[stat][0], (('cache', cache_name),), value))
+    gauges.append(('cache_not_modified_total', (('cache', 'responses'),), workouts.not_modified_count))
+    gauges.append(('password_hash_rejected_total', (), password_hasher.rejected))
+    gauges.append(('write_requests_in_flight', (), write_slots.in_flight))
+    gauges.append(('response_compressed_total', (), compressor.compressed))
+    gauges.append(('response_compressed_bytes_in_total', (), compressor.bytes_in))
+    gauges.append(('response_compressed_bytes_out_total', (), compressor.bytes_out))
+    return gauges
+
+for name, kind, text in list(CACHE_METRICS.values()) + OPS_METRICS:
+    request_metrics.registry.describe(name, kind, text)
+request_metrics.registry.add_collector(cache_gauges)
+
+def metrics_token_required(view):
+    # Per-cache and per-process internals are for the scraper, not the public: callers must send
+    # METRICS_TOKEN as a bearer token, and while it is unset the endpoints don't exist
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['METRICS_TOKEN']
+        if not token:
+            return jsonify({'error': 'Not found'}), 404
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@ops.route('/metrics', methods=['GET'])
+@metrics_token_required
+def metrics():
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@ops.route('/api/cache/stats', methods=['GET'])
+@metrics_token_required
+def cache_stats():
+    return jsonify({
+        'responses': dict(response_cache.stats(), not_modified=workouts.not_modified_count),
+        'users': user_cache.stats(),
+        'exercises': exercise_cache.stats(),
+        'compressed': dict(compressor.cache.stats(), **compressor.stats())
+    }), 200
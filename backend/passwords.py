@@ -0,0 +1,74 @@
+"""Password hashing with a configurable cost and a bounded worker pool.
+
+Hashing is deliberately expensive, so a burst of logins can eat every core on
+the box. All hash work runs on a small thread pool (hashlib releases the GIL
+while it hashes) and at most ``max_pending`` calls may be running or queued at
+once. This caps how many hashes are in progress, not how many request threads
+they occupy: a login still holds its request thread until its hash is done.
+What it prevents is logins piling up behind each other: a caller that can't
+get a slot within ``wait`` seconds (by default none, so at once) gets
+``HashPoolBusy`` and the endpoint answers 503, leaving the other request
+threads to everything else.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', workers=2, max_pending=16, wait=0.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait = wait
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._prefix = None
+
+    def init_app(self, app):
+        # Called before any hashing starts, so the pool and slots can simply be replaced
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.wait = app.config['PASSWORD_HASH_WAIT']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._prefix = None
+
+    @property
+    def prefix(self):
+        # Werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1"),
+        # so learn the stored form of the configured method from a real hash.
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            self.rejected += 1
+            raise HashPoolBusy()
+        try:
+            if self._pool is None:
+                with self._pool_lock:
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.prefix
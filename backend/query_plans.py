@@ -0,0 +1,34 @@
+"""EXPLAIN QUERY PLAN checks for the endpoint queries.
+
+tests/test_query_plans.py builds a scratch SQLite schema, asks the planner how
+it would run each endpoint's query (``ops.endpoint_queries``) and fails if any
+of them scans a whole table instead of searching an index.
+``flask check_query_plans`` runs the same check by hand.
+"""
+
+
+def explain(conn, statement):
+    # render_postcompile expands IN (...) lists into one placeholder per value
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)
+    return [row[-1] for row in rows]
+
+
+def full_scans(conn, statement):
+    # "SCAN t" is a full table scan; "SEARCH t USING INDEX ..." is what we want.
+    # Covering-index scans still read every entry, so they count as well. A
+    # virtual table "scan" is a lookup in its own index (e.g. an FTS5 MATCH).
+    return [detail for detail in explain(conn, statement)
+            if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail]
+
+
+def check_query_plans(engine, queries):
+    """Return ``{name: [offending plan lines]}`` for queries that fall back to a scan."""
+    failures = {}
+    with engine.connect() as conn:
+        for name, statement in queries:
+            scans = full_scans(conn, statement)
+            if scans:
+                failures[name] = scans
+    return failures
@@ -0,0 +1,237 @@
+"""Rate limiting and admission control for the auth and write endpoints.
+
+``RateLimiter.limit`` puts a token bucket in front of a view, keyed by route
+plus the caller: the JWT user when there is one, otherwise the client IP. A
+limit like "10/minute" is a bucket of 10 tokens refilled at 10 per minute, so
+short bursts go through and a steady flood is held to the rate. Callers over
+the limit get ``RateLimited`` (answered with 429 and Retry-After).
+
+Buckets live in process memory by default. With several gunicorn workers
+that multiplies every limit by the worker count, so RATE_LIMIT_STORAGE can
+point at a SQLite file (``sqlite:///path/ratelimit.db``) that all workers on
+the host share; each check is a single UPSERT on that file.
+
+The client IP is ``request.remote_addr``, which behind a reverse proxy is the
+proxy's address for everyone unless TRUSTED_PROXIES is set (see config.py).
+
+``ConcurrencyLimiter`` caps how many write requests run at once in a worker.
+Writes beyond the cap wait up to ``wait`` seconds for a slot and then get
+``Overloaded`` (503 and Retry-After), rather than queueing on the database
+write lock until their clients time out. A streamed write (an import) holds
+its slot until the response is closed.
+"""
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.wrappers import Response
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+MEMORY_MAX_KEYS = 100000
+SQLITE_PRUNE_INTERVAL = 300  # seconds between deletes of idle buckets
+SQLITE_IDLE_AFTER = 86400  # a bucket idle this long is full again for any sensible limit
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after=1):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def parse_limit(spec):
+    """"10/minute" -> (burst 10, refill rate in tokens per second); None for "off" or ""."""
+    if not spec or spec.strip().lower() in ('off', 'none', '0'):
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*', spec.lower())
+    if not match:
+        raise ValueError(f'Invalid rate limit {spec!r}, expected e.g. "10/minute"')
+    count, multiple, period = int(match.group(1)), int(match.group(2) or 1), match.group(3)
+    return count, count / (multiple * PERIODS[period])
+
+
+def retry_after(tokens, rate, cost=1):
+    return max(1, math.ceil((cost - tokens) / rate))
+
+
+class MemoryBuckets:
+    """Buckets for this process only. The least recently used are dropped beyond ``max_keys``."""
+
+    def __init__(self, max_keys=MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate, cost=1):
+        """Returns (allowed, tokens left)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by every worker on the host."""
+
+    TAKE = ('INSERT INTO bucket (key, tokens, updated, allowed) VALUES (:key, :burst - :cost, :now, :burst >= :cost) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            '  allowed = min(:burst, tokens + (:now - updated) * :rate) >= :cost, '
+            '  tokens = min(:burst, tokens + (:now - updated) * :rate) '
+            '    - CASE WHEN min(:burst, tokens + (:now - updated) * :rate) >= :cost THEN :cost ELSE 0 END, '
+            '  updated = :now '
+            'RETURNING allowed, tokens')
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS bucket ('
+                     ' key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # losing the last few refills in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, burst, rate, cost=1):
+        now = time.time()
+        conn = self._connection()
+        allowed, tokens = conn.execute(self.TAKE, {'key': key, 'burst': burst, 'rate': rate, 'cost': cost,
+                                                   'now': now}).fetchone()
+        if now >= self._next_prune:
+            self._next_prune = now + SQLITE_PRUNE_INTERVAL
+            conn.execute('DELETE FROM bucket WHERE updated < ?', (now - SQLITE_IDLE_AFTER,))
+        return bool(allowed), tokens
+
+
+def open_buckets(storage):
+    if not storage or storage == 'memory':
+        return MemoryBuckets()
+    if storage.startswith('sqlite:///'):
+        return SQLiteBuckets(storage[len('sqlite:///'):])
+    raise ValueError(f'Unsupported RATE_LIMIT_STORAGE {storage!r}, expected "memory" or "sqlite:///<path>"')
+
+
+class RateLimiter:
+    def __init__(self, buckets=None, enabled=True):
+        self.storage = 'memory'
+        self.enabled = enabled
+        self._buckets = buckets
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.storage = app.config.get('RATE_LIMIT_STORAGE', 'memory')
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self._buckets = None
+        self._limits = {}
+
+    @property
+    def buckets(self):
+        # Opened on the first limited request, so CLI commands never touch the storage
+        if self._buckets is None:
+            with self._lock:
+                if self._buckets is None:
+                    self._buckets = open_buckets(self.storage)
+        return self._buckets
+
+    def check(self, key, limit):
+        if not self.enabled or limit is None:
+            return
+        burst, rate = limit
+        allowed, tokens = self.buckets.take(key, burst, rate)
+        if not allowed:
+            raise RateLimited(retry_after(tokens, rate))
+
+    def configured_limit(self, setting):
+        spec = current_app.config.get(setting)
+        if spec not in self._limits:
+            self._limits[spec] = parse_limit(spec)
+        return self._limits[spec]
+
+    def limit(self, setting, identity, methods=None):
+        """Decorator: at most ``app.config[setting]`` (e.g. "10/minute") requests per route and caller.
+
+        ``identity()`` names the caller (e.g. "user:12" or "ip:10.0.0.1");
+        ``methods`` restricts the limit to some of the view's methods.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled and (methods is None or request.method in methods):
+                    self.check(f'{request.endpoint}:{request.method}:{identity()}', self.configured_limit(setting))
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_in_flight=0, wait=0.5):
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.configure(max_in_flight, wait)
+
+    def init_app(self, app):
+        self.configure(app.config['WRITE_CONCURRENCY'], app.config['WRITE_CONCURRENCY_WAIT'])
+
+    def configure(self, max_in_flight, wait):
+        self.max_in_flight = max_in_flight
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def guard(self, methods=None):
+        """Decorator: run the view in one of ``max_in_flight`` slots, or raise Overloaded.
+
+        A streamed response keeps the slot until it is closed, since its body
+        (an import, say) does the writing after the view has returned.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self._slots is None or (methods is not None and request.method not in methods):
+                    return view(*args, **kwargs)
+                if not self._slots.acquire(timeout=self.wait):
+                    raise Overloaded()
+                with self._lock:
+                    self.in_flight += 1
+                try:
+                    result = view(*args, **kwargs)
+                except BaseException:
+                    self.release()
+                    raise
+                response = result[0] if isinstance(result, tuple) else result
+                if isinstance(response, Response) and response.is_streamed:
+                    response.call_on_close(self.release)
+                else:
+                    self.release()
+                return result
+            return wrapper
+        return decorator
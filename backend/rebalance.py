@@ -0,0 +1,206 @@
+"""Moving users' data between databases when SHARD_COUNT changes.
+
+``flask rebalance_shards --from-count OLD`` runs with the new SHARD_COUNT
+configured and the app stopped. Every user whose shard (see sharding.py) is
+different under the new count has their rows copied to the new shard and then
+deleted from the old one, a user per transaction on each side. Rows a previous,
+interrupted run left in the new shard are deleted before copying, so the
+command can simply be run again.
+
+Ids are per database, so moved rows get new ones, with session and exercise
+references remapped by title and name. The change log isn't copied: the
+user's cursor floor is raised past every seq they have been sent, so their
+clients resync once, which they would have to anyway with the workout ids
+changed.
+"""
+import os
+
+from flask import current_app
+from sqlalchemy import create_engine, make_url
+
+from database import engine_options, install_sqlite_pragmas
+from extensions import db
+from migrations import upgrade
+from models import (DailyExerciseRollup, Exercise, SearchTerm, User, UserCounters, WeeklyExerciseRollup, Workout,
+                    WorkoutChange, WorkoutSession)
+from search import FTS_DELETE, FTS_INSERT, fts5_available
+from sharding import shard_key, shard_url
+
+MOVE_BATCH = 1000
+ROLLUP_MODELS = (DailyExerciseRollup, WeeklyExerciseRollup)
+# Deleted in this order; search_term first, since the FTS index needs its rows
+USER_TABLES = (SearchTerm, DailyExerciseRollup, WeeklyExerciseRollup, Workout, WorkoutSession, WorkoutChange,
+               UserCounters)
+
+
+def resolve_url(url):
+    # Relative SQLite paths are relative to the instance folder, as for the engines Flask-SQLAlchemy makes
+    url = make_url(url)
+    if url.drivername.startswith('sqlite') and url.database not in (None, '', ':memory:') \
+            and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(current_app.instance_path, url.database))
+    return url
+
+
+def database_engine(key, engines):
+    """Engine for a bind key, including shards the current SHARD_COUNT no longer has."""
+    if key not in engines:
+        if key in db.engines:
+            engines[key] = db.engines[key]
+        else:
+            url = shard_url(current_app.config, int(key[len('shard'):]))
+            engines[key] = create_engine(resolve_url(url), **engine_options(url))
+            install_sqlite_pragmas(engines[key], current_app.config['SQLITE_PRAGMAS'])
+    return engines[key]
+
+
+def delete_user_rows(conn, user_id):
+    if fts5_available(conn):
+        table = SearchTerm.__table__
+        removed = [dict(row._mapping) for row in conn.execute(
+            db.select(table.c.id, table.c.user_id, table.c.name).where(table.c.user_id == user_id))]
+        if removed:
+            conn.execute(FTS_DELETE, removed)
+    for model in USER_TABLES:
+        table = model.__table__
+        conn.execute(db.delete(table).where(table.c.user_id == user_id))
+
+
+def insert_returning_ids(conn, table, rows):
+    statement = db.insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    return conn.execute(statement, rows).scalars().all()
+
+
+def exercise_id_map(src, dst, user_id):
+    """Source exercise id -> target exercise id for every exercise the user's rows refer to."""
+    used = set()
+    for table in (Workout.__table__, DailyExerciseRollup.__table__, WeeklyExerciseRollup.__table__):
+        used.update(src.execute(db.select(table.c.exercise_id).where(table.c.user_id == user_id).distinct()).scalars())
+    terms = SearchTerm.__table__
+    used.update(src.execute(db.select(terms.c.ref_id).where(terms.c.user_id == user_id,
+                                                           terms.c.kind == 'exercise')).scalars())
+    exercise = Exercise.__table__
+    names = dict(src.execute(db.select(exercise.c.id, exercise.c.name).where(exercise.c.id.in_(used))).all())
+    ids = dict(dst.execute(db.select(exercise.c.name, exercise.c.id)
+                           .where(exercise.c.name.in_(set(names.values())))).all())
+    missing = sorted(set(names.values()) - ids.keys())
+    if missing:
+        ids.update(zip(missing, insert_returning_ids(dst, exercise, [{'name': name} for name in missing])))
+    return {old_id: ids[name] for old_id, name in names.items()}
+
+
+def copy_workouts(src, dst, user_id, sessions, exercises, wanted):
+    """Copy the user's workouts; returns source id -> target id for the ids in ``wanted``."""
+    table = Workout.__table__
+    columns = [column for column in table.c if column.key != 'id']
+    found = {}
+    result = src.execution_options(yield_per=MOVE_BATCH).execute(
+        db.select(table.c.id, *columns).where(table.c.user_id == user_id).order_by(table.c.id))
+    for batch in result.partitions():
+        rows = [dict(row._mapping) for row in batch]
+        old_ids = [row.pop('id') for row in rows]
+        for row in rows:
+            row['session_id'] = sessions[row['session_id']]
+            row['exercise_id'] = exercises[row['exercise_id']]
+        for old_id, new_id in zip(old_ids, insert_returning_ids(dst, table, rows)):
+            if old_id in wanted:
+                found[old_id] = new_id
+    return found
+
+
+def raise_change_floor(src, dst, user_id, pruned):
+    """Start the user's change log in the target past every seq they have seen; returns the new floor."""
+    changes = WorkoutChange.__table__
+    latest = src.execute(db.select(db.func.max(changes.c.seq)).where(changes.c.user_id == user_id)).scalar()
+    floor = max(latest or 0, pruned) + 1
+    if dst.dialect.name == 'sqlite':
+        # workout_change is AUTOINCREMENT: new seqs continue from sqlite_sequence, so move it past the floor
+        current = dst.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'workout_change'").scalar()
+        if current is None:
+            dst.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('workout_change', ?)", (floor,))
+        elif current < floor:
+            dst.exec_driver_sql("UPDATE sqlite_sequence SET seq = ? WHERE name = 'workout_change'", (floor,))
+        else:
+            floor = current
+    return floor
+
+
+def copy_user_rows(src, dst, user_id):
+    sessions_table = WorkoutSession.__table__
+    sessions = [dict(row._mapping) for row in src.execute(
+        db.select(sessions_table).where(sessions_table.c.user_id == user_id).order_by(sessions_table.c.id))]
+    session_ids = {}
+    if sessions:
+        old_ids = [session.pop('id') for session in sessions]
+        session_ids = dict(zip(old_ids, insert_returning_ids(dst, sessions_table, sessions)))
+    exercises = exercise_id_map(src, dst, user_id)
+
+    latest = copy_workouts(src, dst, user_id, session_ids, exercises,
+                           {session['latest_workout_id'] for session in sessions})
+    if sessions:
+        dst.execute(db.update(sessions_table).where(sessions_table.c.id == db.bindparam('b_id'))
+                    .values(latest_workout_id=db.bindparam('b_latest')),
+                    [{'b_id': session_ids[old_id], 'b_latest': latest.get(session['latest_workout_id'], 0)}
+                     for old_id, session in zip(old_ids, sessions)])
+
+    for model in ROLLUP_MODELS:
+        table = model.__table__
+        rows = [dict(row._mapping) for row in src.execute(db.select(table).where(table.c.user_id == user_id))]
+        for row in rows:
+            row['exercise_id'] = exercises[row['exercise_id']]
+        if rows:
+            dst.execute(db.insert(table), rows)
+
+    terms_table = SearchTerm.__table__
+    terms = [dict(row._mapping) for row in src.execute(db.select(terms_table).where(terms_table.c.user_id == user_id))]
+    if terms:
+        for term in terms:
+            del term['id']
+            term['ref_id'] = (session_ids if term['kind'] == 'session' else exercises)[term['ref_id']]
+        new_ids = insert_returning_ids(dst, terms_table, terms)
+        if fts5_available(dst):
+            dst.execute(FTS_INSERT, [{'id': term_id, 'user_id': user_id, 'name': term['name']}
+                                     for term_id, term in zip(new_ids, terms)])
+
+    counters = UserCounters.__table__
+    row = src.execute(db.select(counters.c.data_version, counters.c.changes_pruned_seq)
+                      .where(counters.c.user_id == user_id)).first()
+    data_version, pruned = row if row else (0, 0)
+    dst.execute(db.insert(counters).values(
+        user_id=user_id, data_version=data_version + 1,  # new ETags, since the ids in the bodies changed
+        changes_pruned_seq=raise_change_floor(src, dst, user_id, pruned)))
+
+
+def move_user(user_id, source, target):
+    with source.connect() as src, target.begin() as dst:
+        delete_user_rows(dst, user_id)  # whatever an interrupted run copied
+        copy_user_rows(src, dst, user_id)
+    with source.begin() as src:
+        delete_user_rows(src, user_id)
+
+
+def rebalance(from_count, to_count, batch=500, progress=None):
+    """Move every user whose shard differs between the two counts; returns how many moved."""
+    engines = {None: db.engine}
+    for number in range(to_count):
+        target = database_engine(f'shard{number}', engines)
+        db.metadata.create_all(target)
+        upgrade(target)
+    moved = checked = 0
+    last_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            db.select(User.id).where(User.id > last_id).order_by(User.id).limit(batch)).all()
+        db.session.rollback()
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            source, target = shard_key(user_id, from_count), shard_key(user_id, to_count)
+            if source != target:
+                move_user(user_id, database_engine(source, engines), database_engine(target, engines))
+                moved += 1
+        checked += len(user_ids)
+        last_id = user_ids[-1]
+        if progress:
+            progress(f'Checked {checked} users, moved {moved}')
+    return moved
@@ -0,0 +1,44 @@
+"""Prefix search over a user's session titles and exercise names.
+
+Every user has a small vocabulary in the ``search_term`` table: one row per
+session and per exercise they have used, with how many workouts use it. On
+SQLite it is indexed by an FTS5 table (``search_index``, external content
+pointing at ``search_term``) with prefix indexes, so "squ" finds "Back Squat"
+without touching other users' rows and results come back ranked by bm25. The
+write handlers keep both tables in sync. Other databases, or SQLite builds
+without FTS5, fall back to LIKE over the user's own terms.
+"""
+import re
+
+from sqlalchemy import text
+
+MAX_QUERY_WORDS = 8
+
+FTS_CREATE = text(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    " user_id, name, content='search_term', content_rowid='id', prefix='2 3')")
+FTS_REBUILD = text("INSERT INTO search_index(search_index) VALUES ('rebuild')")
+FTS_INSERT = text('INSERT INTO search_index (rowid, user_id, name) VALUES (:id, :user_id, :name)')
+# External-content tables need the old values to remove a row from the index
+FTS_DELETE = text("INSERT INTO search_index (search_index, rowid, user_id, name) VALUES ('delete', :id, :user_id, :name)")
+
+
+def fts5_available(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    return conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").first() is not None
+
+
+def query_words(query):
+    """Lower-cased words of a search box entry, the way the FTS5 tokenizer splits them."""
+    return re.findall(r'\w+', query.lower())[:MAX_QUERY_WORDS]
+
+
+def fts_expression(user_id, words):
+    # Every word is a prefix of some word in the name, scoped to the user's rows
+    terms = ' AND '.join(f'name : "{word}" *' for word in words)
+    return f'user_id : "{int(user_id)}" AND {terms}'
+
+
+def escape_like(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
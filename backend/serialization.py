@@ -0,0 +1,90 @@
+"""JSON encoding for API responses, with a choice of encoder.
+
+``JSONProvider`` replaces Flask's default provider, so ``jsonify`` and the
+streaming endpoints share one encoder, picked by JSON_SERIALIZER:
+
+* ``orjson`` (the default when it is installed): several times faster than the
+  stdlib and encodes dates, tuples and dataclasses natively, so endpoints can
+  hand it rows straight from a query instead of building a dict per row.
+* ``json``: the stdlib encoder, with dates as ISO strings.
+
+Both produce compact UTF-8 JSON with keys in insertion order.
+"""
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+from collections.abc import Sequence
+
+from flask import current_app
+from flask.json.provider import JSONProvider as BaseJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+
+def stdlib_default(obj):
+    if isinstance(obj, (datetime.date, datetime.datetime, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    if isinstance(obj, Sequence):  # e.g. SQLAlchemy Row
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=stdlib_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def orjson_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    if isinstance(obj, Sequence):  # e.g. SQLAlchemy Row, which orjson doesn't know
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def orjson_dumps(obj):
+    return orjson.dumps(obj, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+SERIALIZERS = {'json': (stdlib_dumps, json.loads)}
+if orjson is not None:
+    SERIALIZERS['orjson'] = (orjson_dumps, orjson.loads)
+
+
+class JSONProvider(BaseJSONProvider):
+    """Flask JSON provider backed by the encoder named in JSON_SERIALIZER."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        name = app.config.get('JSON_SERIALIZER') or 'orjson'
+        if name not in SERIALIZERS and name != 'orjson':
+            raise ValueError(f"Unknown JSON_SERIALIZER {name!r}, expected one of {', '.join(SERIALIZERS)}")
+        self.name = name if name in SERIALIZERS else 'json'  # orjson asked for but not installed
+        self.dumps_bytes, self._loads = SERIALIZERS[self.name]
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return self._loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype='application/json')
+
+
+def dumps_bytes(obj):
+    """Encode ``obj`` with the current app's encoder, for streamed bodies."""
+    return current_app.json.dumps_bytes(obj)
@@ -0,0 +1,96 @@
+"""Per-user sharding: each user's workout data in one of SHARD_COUNT SQLite files.
+
+SQLite takes one writer per database at a time, so with every user in one file
+all workout writes of all workers queue for the same lock. With SHARD_COUNT
+set, the ``user`` table stays in the main database (DATABASE_URL) and all a
+user's other rows (workouts, sessions, rollups, search terms, the change log
+and their counters) live in shard ``jump_hash(user_id, SHARD_COUNT)``, i.e.
+SHARD_DATABASE_URL with the number filled in. Writes for users on different
+shards no longer wait for each other. SHARD_COUNT=0 (the default) keeps
+everything in the main database.
+
+Views point the session at the user's shard through ``auth.jwt_user_id()``;
+``ShardedSession.get_bind`` then sends statements on the user table to the
+main database and everything else, raw SQL included, to the shard. Every
+database has the full schema, so the migrations run unchanged on each, and
+each shard has its own exercise dictionary and id sequences.
+
+Jump hashing moves only 1/N of users when the count grows to N. Changing
+SHARD_COUNT still moves data: stop the app, configure the new count and run
+``flask rebalance_shards --from-count OLD`` (see rebalance.py).
+"""
+import zlib
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
+
+from database import engine_options
+
+CENTRAL_TABLES = frozenset({'user'})
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping and Veach): the bucket in ``range(buckets)`` for an integer key."""
+    key = zlib.crc32(str(key).encode())  # spread out sequential ids first
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (1 << 31) / ((key >> 33) + 1))
+    return bucket
+
+
+def shard_key(user_id, count):
+    """Bind key of the database holding the user's data; None (the main database) when unsharded."""
+    return f'shard{jump_hash(user_id, count)}' if count else None
+
+
+def shard_url(config, number):
+    return config['SHARD_DATABASE_URL'].format(number)
+
+
+def shard_binds(config):
+    """SQLALCHEMY_BINDS for the shards, each with the same engine options as the main database."""
+    binds = {}
+    for number in range(config['SHARD_COUNT']):
+        url = shard_url(config, number)
+        binds[f'shard{number}'] = dict(engine_options(url), url=url)
+    return binds
+
+
+def shard_keys():
+    """Bind keys of the databases holding user data, for commands that go through all of it."""
+    count = current_app.config['SHARD_COUNT']
+    return [f'shard{number}' for number in range(count)] if count else [None]
+
+
+def use_shard(key):
+    current_app.extensions['sqlalchemy'].session.info['shard'] = key
+
+
+def use_user_shard(user_id):
+    """Point ``db.session`` at the database holding the user's data."""
+    use_shard(shard_key(user_id, current_app.config['SHARD_COUNT']))
+
+
+class ShardedSession(Session):
+    """``db.session``: once ``info['shard']`` is set, all but the user table goes to that shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = self.info.get('shard')
+        if shard is None or bind is not None or self.is_central(mapper, clause):
+            return super().get_bind(mapper, clause, bind, **kwargs)
+        return self._db.engines[shard]
+
+    @staticmethod
+    def is_central(mapper, clause):
+        if mapper is not None:
+            return inspect(mapper).local_table.name in CENTRAL_TABLES
+        if clause is None:
+            return False
+        names = {table.name for table in find_tables(clause, include_crud=True, check_columns=True)}
+        if names & CENTRAL_TABLES and names - CENTRAL_TABLES:
+            raise ValueError(f'Statement joins {", ".join(sorted(names))} across databases')
+        return bool(names) and names <= CENTRAL_TABLES
@@ -0,0 +1,56 @@
+import pytest
+
+from app import create_app
+from extensions import db, exercise_cache, response_cache, user_cache
+from migrations import upgrade
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps on the test's databases; overrides go on top of the test settings."""
+    apps = []
+
+    def make_app(**overrides):
+        app = create_app(dict({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'SHARD_DATABASE_URL': f"sqlite:///{tmp_path / 'shard{}.db'}",
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'RATE_LIMIT_ENABLED': False,
+            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1',  # registering in every test shouldn't take seconds
+        }, **overrides))
+        with app.app_context():
+            for engine in db.engines.values():
+                db.metadata.create_all(engine)
+                upgrade(engine)
+        # The caches are per process, and ids from another test's database would be wrong here
+        for cache in (exercise_cache, response_cache, user_cache):
+            cache.clear()
+        apps.append(app)
+        return app
+
+    yield make_app
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    return register(client, 'alice')
+
+
+def register(client, username):
+    response = client.post('/api/register', json={'username': username, 'email': f'{username}@example.com',
+                                                  'password': 'correct horse'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
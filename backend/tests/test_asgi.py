@@ -0,0 +1,126 @@
+"""asgi.py driven directly with ASGI messages, the way uvicorn calls it."""
+import asyncio
+import json
+
+from asgi import AsgiApp
+
+WORKOUT = {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+
+
+def call(asgi_app, method, path, headers=(), chunks=(b'',), disconnect_on_body=False, query=b''):
+    """Run one request; returns the messages sent. ``chunks`` arrive as the request body."""
+    async def run():
+        sent = []
+        disconnect = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1}
+                    for index, chunk in enumerate(chunks)]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if disconnect_on_body and message.get('body'):
+                disconnect.set()
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'http_version': '1.1',
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+        await asyncio.wait_for(asgi_app(scope, receive, send), 10)
+        return sent
+    return asyncio.run(run())
+
+
+def body_of(sent):
+    return b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+
+
+def test_streams_a_response_in_chunks(app, client, auth_headers):
+    for _ in range(3):
+        client.post('/api/workouts', headers=auth_headers, json=WORKOUT)
+    sent = call(AsgiApp(app), 'GET', '/api/workouts', auth_headers.items())
+    assert sent[0]['status'] == 200
+    assert sent[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+    assert len(json.loads(body_of(sent))) == 3
+
+
+def test_posts_a_body_sent_in_pieces(app, auth_headers):
+    body = json.dumps(WORKOUT).encode()
+    headers = dict(auth_headers, **{'Content-Type': 'application/json', 'Content-Length': str(len(body))})
+    sent = call(AsgiApp(app), 'POST', '/api/workouts', headers.items(), chunks=(body[:10], body[10:]))
+    assert sent[0]['status'] == 201
+    assert json.loads(body_of(sent))['exercise'] == 'Squat'
+
+
+def test_oversized_upload_gets_a_complete_413(app, auth_headers):
+    app.config.update(MAX_CONTENT_LENGTH=1000, IMPORT_MAX_LENGTH=1000)
+    headers = dict(auth_headers, **{'Content-Type': 'text/csv', 'Content-Length': '5000'})
+    sent = call(AsgiApp(app), 'POST', '/api/import', headers.items(), chunks=(b'x' * 1000,) * 5)
+    assert sent[0]['status'] == 413
+    # The unread body chunks must not be mistaken for a disconnect that cuts the response short
+    assert sent[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+
+
+def test_client_disconnect_ends_a_change_stream(app, auth_headers):
+    app.config.update(CHANGE_STREAM_POLL_SECONDS=0.05, CHANGE_STREAM_MAX_SECONDS=30)
+    sent = call(AsgiApp(app), 'GET', '/api/changes/stream', auth_headers.items(), query=b'since=0',
+                disconnect_on_body=True)
+    assert sent[0]['status'] == 200
+    assert body_of(sent).startswith(b'retry: 50')
+    assert not any(message.get('more_body') is False for message in sent)  # nothing sent after the disconnect
+
+
+def test_a_trickling_upload_holds_no_thread_while_it_is_spooled(make_app, auth_headers):
+    app = make_app(ASGI_THREADS=1)
+    asgi_app = AsgiApp(app)
+    body = json.dumps(WORKOUT).encode()
+    upload_headers = dict(auth_headers, **{'Content-Type': 'application/json', 'Content-Length': str(len(body))})
+
+    async def run():
+        other_done = asyncio.Event()
+        stalled = []
+        pieces = [body[:5], body[5:10], body[10:]]
+
+        async def trickle():
+            # One piece at a time; the last only once the other request got the only pool thread
+            if len(pieces) == 1:
+                try:
+                    await asyncio.wait_for(other_done.wait(), 2)
+                except asyncio.TimeoutError:
+                    stalled.append(True)  # the other request didn't finish while this one was receiving
+            else:
+                await asyncio.sleep(0.05)
+            return {'type': 'http.request', 'body': pieces.pop(0), 'more_body': bool(pieces)} \
+                if pieces else {'type': 'http.disconnect'}
+
+        get_messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive_get():
+            if get_messages:
+                return get_messages.pop()
+            await asyncio.Event().wait()  # no disconnect
+
+        def scope(method, path, headers):
+            return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+                    'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+
+        upload_sent, other_sent = [], []
+
+        async def record(sent, message):
+            sent.append(message)
+
+        upload = asyncio.ensure_future(asgi_app(scope('POST', '/api/workouts', upload_headers), trickle,
+                                                lambda message: record(upload_sent, message)))
+        await asyncio.sleep(0.02)  # the upload is now being received
+        await asyncio.wait_for(asgi_app(scope('GET', '/api/workouts', auth_headers), receive_get,
+                                        lambda message: record(other_sent, message)), 10)
+        other_done.set()
+        await asyncio.wait_for(upload, 10)
+        return stalled, upload_sent, other_sent
+
+    stalled, upload_sent, other_sent = asyncio.run(run())
+    assert not stalled
+    assert other_sent[0]['status'] == 200 and json.loads(body_of(other_sent)) == []
+    assert upload_sent[0]['status'] == 201
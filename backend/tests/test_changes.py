@@ -0,0 +1,39 @@
+import threading
+
+from sqlalchemy import event
+
+from extensions import db
+
+WORKOUT = {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+
+
+def test_sessions_and_change_seq_cover_a_concurrent_write_exactly_once(app, client, auth_headers):
+    assert client.post('/api/workouts', headers=auth_headers, json=WORKOUT).status_code == 201
+
+    def write():
+        assert app.test_client().post('/api/workouts', headers=auth_headers, json=WORKOUT).status_code == 201
+
+    written = []
+
+    def write_between_reads(conn, cursor, statement, parameters, context, executemany):
+        # Commit another workout right after the first of the two reads, whichever runs first
+        if not written and threading.current_thread() is main and \
+                ('FROM workout_change' in statement or 'FROM workout_session' in statement):
+            written.append(statement)
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join()
+
+    main = threading.current_thread()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'after_cursor_execute', write_between_reads)
+    try:
+        body = client.get('/api/sessions', headers=auth_headers).get_json()
+    finally:
+        event.remove(engine, 'after_cursor_execute', write_between_reads)
+    assert written
+
+    listed = sum(session['exercise_count'] for session in body['sessions'])
+    changes = client.get(f"/api/changes?since={body['change_seq']}", headers=auth_headers).get_json()['changes']
+    assert listed + len([change for change in changes if change['op'] == 'insert']) == 2
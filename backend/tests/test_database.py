@@ -0,0 +1,25 @@
+from sqlalchemy import create_engine, text
+
+import database
+from app import create_app
+from extensions import db
+
+
+def test_pragmas_run_once_per_connection_of_the_apps_engines(app, tmp_path, monkeypatch):
+    for _ in range(3):
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}"})
+    calls = []
+    apply = database.apply_sqlite_pragmas
+    monkeypatch.setattr(database, 'apply_sqlite_pragmas', lambda *args: calls.append(args) or apply(*args))
+
+    with app.app_context():
+        db.engine.dispose()
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+    assert len(calls) == 1
+
+    scratch = create_engine(f"sqlite:///{tmp_path / 'scratch.db'}")
+    with scratch.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+    scratch.dispose()
+    assert len(calls) == 1
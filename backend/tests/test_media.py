@@ -0,0 +1,61 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from media import MediaStore, UploadError
+
+
+class SlowStream:
+    """A request body that blocks after its first read until released."""
+
+    def __init__(self, data):
+        self.chunks = [data[:4], data[4:]]
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size):
+        if len(self.chunks) == 1:
+            self.reading.set()
+            self.release.wait(5)
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+def test_concurrent_append_at_the_same_offset_is_refused(tmp_path):
+    store = MediaStore(str(tmp_path))
+    upload_id = store.start_upload('mp4', 8)
+    slow = SlowStream(b'abcdefgh')
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.append(upload_id, 0, slow)))
+    first.start()
+    assert slow.reading.wait(5)
+    with pytest.raises(UploadError) as refused:
+        store.append(upload_id, 0, io.BytesIO(b'ABCDEFGH'))
+    assert refused.value.status == 409
+    slow.release.set()
+    first.join()
+
+    relpath = results[0]['relpath']
+    with open(store.path(relpath), 'rb') as f:
+        assert f.read() == b'abcdefgh'
+    assert relpath == store.relpath(hashlib.sha256(b'abcdefgh').hexdigest(), 'mp4')
+
+
+def test_prune_uploads_deletes_only_abandoned_uploads(tmp_path):
+    store = MediaStore(str(tmp_path))
+    abandoned = store.start_upload('mp4', 8)
+    store.append(abandoned, 0, io.BytesIO(b'abcd'))
+    active = store.start_upload('mp4', 8)
+    stale = time.time() - 7200
+    for name in os.listdir(store.tmp_dir):
+        if name.startswith(abandoned):
+            os.utime(os.path.join(store.tmp_dir, name), (stale, stale))
+
+    assert store.prune_uploads(3600) == 1
+    assert sorted(os.listdir(store.tmp_dir)) == [active + '.json', active + '.part']
+    with pytest.raises(UploadError):
+        store.append(abandoned, 4, io.BytesIO(b'efgh'))
+    assert store.append(active, 0, io.BytesIO(b'abcdefgh'))['created']
@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+TOKEN = {'Authorization': 'Bearer scrape-me'}
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(METRICS_TOKEN='scrape-me')
+
+
+def parse(text):
+    """{family: (type, [sample name, ...])}, checking the layout the text format requires."""
+    families, current = {}, None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            continue
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert name not in families, f'{name} has two TYPE lines'
+            families[name] = (kind, [])
+            current = name
+            continue
+        name = SAMPLE.match(line).group(1)
+        family = current if name in (current, f'{current}_bucket', f'{current}_sum', f'{current}_count') else None
+        assert family, f'{name} is not inside its own family (after {current})'
+        float(SAMPLE.match(line).group(3))
+        families[family][1].append(name)
+    return families
+
+
+def test_metrics_groups_each_family_under_one_type_line(client, auth_headers):
+    client.post('/api/workouts', headers=auth_headers,
+                json={'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60})
+    client.get('/api/sessions', headers=auth_headers)
+    client.get('/api/sessions', headers=auth_headers)
+
+    families = parse(client.get('/metrics', headers=TOKEN).get_data(as_text=True))
+    for name in ('cache_hits_total', 'cache_misses_total', 'cache_evictions_total', 'http_requests_total'):
+        assert families[name][0] == 'counter'
+        assert len(families[name][1]) >= 1
+    assert families['cache_size'][0] == 'gauge' and len(families['cache_size'][1]) == 4  # one per cache
+    assert families['http_request_duration_seconds'][0] == 'histogram'
+    assert all(kind == 'counter' for name, (kind, _) in families.items() if name.endswith('_total'))
+
+
+def test_ops_endpoints_need_the_metrics_token(make_app):
+    client = make_app(METRICS_TOKEN='scrape-me').test_client()
+    for path in ('/metrics', '/api/cache/stats'):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={'Authorization': 'Bearer guess'}).status_code == 401
+        assert client.get(path, headers=TOKEN).status_code == 200
+
+    closed = make_app().test_client()  # no token configured
+    assert closed.get('/metrics').status_code == 404
+    assert closed.get('/api/cache/stats', headers=TOKEN).status_code == 404
@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+import migrations
+
+BASELINE_SCHEMA = (
+    'CREATE TABLE user (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(64), email VARCHAR(120),'
+    ' password_hash VARCHAR(128))',
+    'CREATE TABLE workout (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),'
+    ' session_title VARCHAR(120) NOT NULL, exercise VARCHAR(120) NOT NULL, sets INTEGER NOT NULL,'
+    ' reps INTEGER NOT NULL, rest INTEGER NOT NULL)',
+)
+
+
+def test_upgrade_from_baseline_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, username) VALUES (1, 'alice')"))
+        conn.execute(text("INSERT INTO workout (user_id, session_title, exercise, sets, reps, rest)"
+                          " VALUES (1, 'Legs', 'Squat', 3, 5, 60)"))
+    assert migrations.upgrade(engine) == [version for version, _, _ in sorted(migrations.MIGRATIONS)]
+    assert migrations.upgrade(engine) == []
+    with engine.connect() as conn:
+        assert {column['name'] for column in inspect(conn).get_columns('workout')} >= {'session_id', 'exercise_id'}
+        assert conn.execute(text('SELECT title, exercise_count FROM workout_session')).all() == [('Legs', 1)]
+    engine.dispose()
+
+
+def test_migration_tables_render_for_postgresql():
+    for table in migrations.schema.sorted_tables:
+        ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+        assert 'AUTOINCREMENT' not in ddl and 'DATETIME' not in ddl
+        if table.name != 'user':
+            assert 'REFERENCES user ' not in ddl
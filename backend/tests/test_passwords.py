@@ -0,0 +1,24 @@
+import threading
+import time
+
+from conftest import register
+from extensions import password_hasher
+
+
+def test_saturated_hash_pool_answers_503_at_once_and_reads_go_on(make_app):
+    client = make_app(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1).test_client()
+    headers = register(client, 'alice')
+
+    release = threading.Event()
+    hashing = threading.Thread(target=password_hasher._run, args=(release.wait,))  # holds the only slot
+    hashing.start()
+    try:
+        started = time.monotonic()
+        response = client.post('/api/login', json={'username': 'alice', 'password': 'correct horse'})
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+        assert time.monotonic() - started < 0.5
+        assert client.get('/api/workouts', headers=headers).status_code == 200
+    finally:
+        release.set()
+        hashing.join()
+    assert client.post('/api/login', json={'username': 'alice', 'password': 'correct horse'}).status_code == 200
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import create_engine
+
+from extensions import db
+from migrations import upgrade
+from models import Workout
+from ops import endpoint_queries
+from query_plans import check_query_plans
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # Built the way db_create builds a database: the models' schema, then every migration
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    db.metadata.create_all(engine)
+    upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_endpoint_queries_use_an_index(engine):
+    assert check_query_plans(engine, endpoint_queries()) == {}
+
+
+def test_a_full_scan_is_reported(engine):
+    failures = check_query_plans(engine, [('by reps', db.select(Workout.id).where(Workout.reps == 5))])
+    assert list(failures) == ['by reps']
+    assert failures['by reps'][0].startswith('SCAN workout')
@@ -0,0 +1,46 @@
+from app import create_app
+from extensions import db, write_slots
+
+WORKOUT = {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+CSV = b'session_title,exercise,sets,reps,rest,date,weight\nLegs,Squat,3,5,60,2024-01-01,100\n'
+
+
+def test_streaming_import_holds_a_write_slot_until_closed(app, client, auth_headers):
+    write_slots.configure(1, 0.05)
+    importing = client.post('/api/import', headers=dict(auth_headers, **{'Content-Type': 'text/csv'}), data=CSV,
+                            buffered=False)
+    assert importing.status_code == 200
+    assert write_slots.in_flight == 1
+    assert client.post('/api/workouts', headers=auth_headers, json=WORKOUT).status_code == 503
+
+    assert b'"done":true' in importing.get_data()
+    importing.close()
+    assert write_slots.in_flight == 0
+    assert client.post('/api/workouts', headers=auth_headers, json=WORKOUT).status_code == 201
+
+
+def test_slot_is_released_after_a_rejected_write(app, client, auth_headers):
+    write_slots.configure(1, 0.05)
+    assert client.post('/api/workouts', headers=auth_headers, json={'sets': 'many'}).status_code == 400
+    assert write_slots.in_flight == 0
+    assert client.post('/api/workouts', headers=auth_headers, json=WORKOUT).status_code == 201
+
+
+def login_statuses(app, addresses):
+    client = app.test_client()
+    return [client.post('/api/login', json={'username': 'nobody', 'password': 'wrong'},
+                        headers={'X-Forwarded-For': address}).status_code for address in addresses]
+
+
+def test_anonymous_limits_key_on_the_forwarded_address_behind_trusted_proxies(tmp_path):
+    config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}", 'RATE_LIMIT_LOGIN': '2/minute'}
+    proxied = create_app(dict(config, TRUSTED_PROXIES=1))
+    with proxied.app_context():
+        db.create_all()
+    # Two clients behind the proxy each get their own bucket
+    assert 429 not in login_statuses(proxied, ['203.0.113.1', '203.0.113.1', '203.0.113.2', '203.0.113.2'])
+    assert login_statuses(proxied, ['203.0.113.1']) == [429]
+
+    # Without trusted proxies the header is ignored: everyone shares the proxy's address
+    direct = create_app(dict(config, TRUSTED_PROXIES=0, RATE_LIMIT_LOGIN='3/minute'))
+    assert login_statuses(direct, ['198.51.100.1', '198.51.100.2', '198.51.100.3', '198.51.100.4'])[-1] == 429
@@ -0,0 +1,109 @@
+import collections
+
+import pytest
+from sqlalchemy import text
+
+from conftest import register
+from extensions import db
+from models import User, UserCounters, Workout
+from rebalance import USER_TABLES, rebalance
+from sharding import jump_hash, shard_key, use_shard
+
+USERS = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+
+
+def test_jump_hash_stays_in_range_and_is_balanced():
+    counts = collections.Counter(jump_hash(key, 8) for key in range(8000))
+    assert set(counts) == set(range(8))
+    assert min(counts.values()) > 800
+    assert all(jump_hash(key, 1) == 0 for key in range(100))
+    assert shard_key(7, 0) is None
+
+
+def test_growing_the_count_only_moves_keys_to_the_new_bucket():
+    for buckets in range(1, 10):
+        moved = [key for key in range(5000) if jump_hash(key, buckets) != jump_hash(key, buckets + 1)]
+        assert all(jump_hash(key, buckets + 1) == buckets for key in moved)
+        assert len(moved) < 2 * 5000 / (buckets + 1)  # about 1/(N+1) of the keys
+
+
+def test_session_sends_user_data_to_the_shard_and_users_to_the_main_database(make_app):
+    app = make_app(SHARD_COUNT=2)
+    with app.app_context():
+        session = db.session
+        assert session.get_bind(Workout.__mapper__) is db.engines[None]  # no shard chosen yet
+        use_shard('shard1')
+        assert session.get_bind(Workout.__mapper__) is db.engines['shard1']
+        assert session.get_bind(User.__mapper__) is db.engines[None]
+        assert session.get_bind(clause=db.select(User.id)) is db.engines[None]
+        assert session.get_bind(clause=db.select(UserCounters.data_version)) is db.engines['shard1']
+        assert session.get_bind(clause=text('SELECT 1')) is db.engines['shard1']
+        with pytest.raises(ValueError, match='across databases'):
+            session.get_bind(clause=db.select(User.id).join(Workout, Workout.user_id == User.id))
+
+
+def seed(client):
+    headers = {}
+    for number, username in enumerate(USERS):
+        headers[username] = register(client, username)
+        for day in range(1, 4 + number):
+            client.post('/api/workouts', headers=headers[username], json={
+                'session_title': f'Day {day % 3}', 'exercise': ['Squat', 'Bench', f'Curl {username}'][day % 3],
+                'sets': 3, 'reps': 5 + day, 'rest': 60, 'weight': 20 * day, 'date': f'2024-05-{day:02d}'})
+    return headers
+
+
+def snapshot(client, headers):
+    # What each user sees, minus the ids, which rebalancing renumbers
+    state = {}
+    for username, auth in headers.items():
+        workouts = client.get('/api/workouts', headers=auth).get_json()
+        sessions = client.get('/api/sessions', headers=auth).get_json()['sessions']
+        state[username] = {
+            'workouts': sorted(tuple(sorted((k, v) for k, v in w.items() if k != 'id')) for w in workouts),
+            'sessions': sorted(tuple(sorted((k, v) for k, v in s.items() if k != 'latest_id')) for s in sessions),
+            'search': client.get('/api/search?q=c', headers=auth).get_json(),
+            'analytics': client.get('/api/analytics?period=day&from=2024-01-01&to=2024-12-31',
+                                    headers=auth).get_json(),
+        }
+    return state
+
+
+def user_rows(app, key):
+    # user_id -> number of rows of theirs in each user-data table of one database
+    with app.app_context():
+        with db.engines[key].connect() as conn:
+            return {model.__tablename__: dict(conn.execute(
+                db.select(model.user_id, db.func.count()).group_by(model.user_id)).all()) for model in USER_TABLES}
+
+
+def test_rebalance_out_to_shards_and_back_keeps_every_users_data(make_app):
+    unsharded = make_app()
+    headers = seed(unsharded.test_client())
+    before = snapshot(unsharded.test_client(), headers)
+    rows_before = user_rows(unsharded, None)
+    with unsharded.app_context():
+        versions = dict(db.session.execute(db.select(UserCounters.user_id, UserCounters.data_version)).all())
+
+    sharded = make_app(SHARD_COUNT=3)
+    with sharded.app_context():
+        assert rebalance(0, 3) == len(USERS)
+    assert snapshot(sharded.test_client(), headers) == before
+    assert all(not rows for rows in user_rows(sharded, None).values())  # moved, not copied
+    by_shard = {key: user_rows(sharded, key) for key in ('shard0', 'shard1', 'shard2')}
+    for user_id in versions:
+        home = shard_key(user_id, 3)
+        for table in ('workout', 'workout_session', 'search_term', 'exercise_daily', 'exercise_weekly'):
+            assert by_shard[home][table][user_id] == rows_before[table][user_id]
+            assert all(user_id not in rows[table] for key, rows in by_shard.items() if key != home)
+        assert user_id not in by_shard[home]['workout_change']  # clients resync instead
+    with sharded.app_context():
+        use_shard(shard_key(1, 3))
+        counters = db.session.get(UserCounters, 1)
+        assert counters.data_version == versions[1] + 1 and counters.changes_pruned_seq > 0
+
+    unsharded = make_app()
+    with unsharded.app_context():
+        assert rebalance(3, 0) == len(USERS)
+    assert snapshot(unsharded.test_client(), headers) == before
+    assert all(not user_rows(sharded, key)['workout'] for key in ('shard0', 'shard1', 'shard2'))
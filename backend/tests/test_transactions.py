@@ -0,0 +1,28 @@
+import workouts
+from extensions import db
+from models import Exercise, WorkoutSession
+
+
+def test_failed_write_leaves_no_interned_rows(app, client, auth_headers, monkeypatch):
+    def fail(workout):
+        raise RuntimeError('after interning')
+
+    monkeypatch.setattr(workouts, 'session_added', fail)
+    response = client.post('/api/workouts', headers=auth_headers,
+                           json={'session_title': 'Ghost', 'exercise': 'Phantom press', 'sets': 3, 'reps': 5,
+                                 'rest': 60})
+    assert response.status_code == 500
+    with app.app_context():
+        assert db.session.scalars(db.select(WorkoutSession.title)).all() == []
+        assert db.session.scalars(db.select(Exercise.name)).all() == []
+    monkeypatch.undo()
+    assert client.get('/api/sessions', headers=auth_headers).get_json()['sessions'] == []
+
+
+def test_interning_reuses_existing_rows(app, client, auth_headers):
+    workout = {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+    assert client.post('/api/workouts', headers=auth_headers, json=workout).status_code == 201
+    assert client.post('/api/workouts', headers=auth_headers, json=workout).status_code == 201
+    with app.app_context():
+        assert db.session.scalars(db.select(WorkoutSession.exercise_count)).all() == [2]
+        assert db.session.scalars(db.select(Exercise.name)).all() == ['Squat']
@@ -0,0 +1,53 @@
+import datetime
+import json
+
+import pytest
+
+from extensions import db
+from workouts import insert_workouts
+
+SEEDED = [
+    {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60, 'weight': 100.0,
+     'date': datetime.date(2024, 3, 4)},
+    {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60, 'weight': 80.0,
+     'date': None},  # recorded before dates were tracked
+    {'session_title': 'Pull', 'exercise': 'Row', 'sets': 4, 'reps': 8, 'rest': 90, 'weight': 50.0,
+     'date': datetime.date(2024, 3, 6)},
+]
+ANALYTICS = ['/api/analytics?period=day&from=2024-01-01',
+             '/api/analytics?period=week&from=2024-01-01&exercise=Squat']
+
+
+def workouts(client, auth_headers):
+    rows = client.get('/api/workouts', headers=auth_headers).get_json()
+    return sorted((row['session_title'], row['exercise'], row['date'] or '', row['weight']) for row in rows)
+
+
+@pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+def test_export_import_round_trip_keeps_undated_workouts(app, client, auth_headers, export_format):
+    with app.app_context():
+        insert_workouts(1, SEEDED)
+        db.session.commit()
+    before = workouts(client, auth_headers)
+    analytics_before = [client.get(url, headers=auth_headers).get_json() for url in ANALYTICS]
+    assert '' in [row[2] for row in before] and analytics_before[0]['points']
+
+    exported = client.get(f'/api/export?format={export_format}', headers=auth_headers).get_data()
+    for title in ('Legs', 'Pull'):
+        assert client.delete(f'/api/workouts/session/{title}', headers=auth_headers).status_code == 200
+    assert workouts(client, auth_headers) == []
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = client.post('/api/import', headers=dict(auth_headers, **{'Content-Type': mimetype}), data=exported)
+    summary = json.loads(response.get_data().splitlines()[-1])
+    assert (summary['imported'], summary['failed']) == (3, 0)
+
+    assert workouts(client, auth_headers) == before
+    assert [client.get(url, headers=auth_headers).get_json() for url in ANALYTICS] == analytics_before
+
+
+def test_api_create_without_date_is_dated_today(client, auth_headers):
+    response = client.post('/api/workouts', headers=auth_headers,
+                           json={'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60,
+                                 'date': None})
+    assert response.get_json()['date'] == datetime.datetime.now(datetime.timezone.utc).date().isoformat()
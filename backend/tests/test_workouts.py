@@ -0,0 +1,134 @@
+import datetime
+import json
+
+import pytest
+
+import models
+import workouts
+from conftest import register
+
+WORKOUT = {'session_title': 'Legs', 'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+
+
+@pytest.mark.parametrize('weight', [-1, 'inf', 'nan', '-inf'])
+def test_weight_must_be_finite_and_non_negative(client, auth_headers, weight):
+    response = client.post('/api/workouts', headers=auth_headers, json=dict(WORKOUT, weight=weight))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'weight must be a finite, non-negative number'}
+
+
+def test_analytics_without_to_rolls_over_at_midnight(client, auth_headers, monkeypatch):
+    client.post('/api/workouts', headers=auth_headers, json=dict(WORKOUT, date='2024-05-01'))
+    monkeypatch.setattr(workouts, 'utc_today', lambda: datetime.date(2024, 5, 1))
+    first = client.get('/api/analytics?period=day', headers=auth_headers)
+    fixed = client.get('/api/analytics?period=day&to=2024-05-01', headers=auth_headers)
+
+    monkeypatch.setattr(workouts, 'utc_today', lambda: datetime.date(2024, 5, 2))
+    response = client.get('/api/analytics?period=day',
+                          headers=dict(auth_headers, **{'If-None-Match': first.headers['ETag']}))
+    assert response.status_code == 200 and response.get_json()['to'] == '2024-05-02'
+    # An explicit range doesn't depend on the day
+    response = client.get('/api/analytics?period=day&to=2024-05-01',
+                          headers=dict(auth_headers, **{'If-None-Match': fixed.headers['ETag']}))
+    assert response.status_code == 304
+
+
+def add_workout(client, headers, **overrides):
+    return client.post('/api/workouts', headers=headers, json=dict(WORKOUT, **overrides)).get_json()
+
+
+def test_session_summary_follows_deletes_until_the_last_workout_goes(client, auth_headers):
+    first = add_workout(client, auth_headers)
+    second = add_workout(client, auth_headers, reps=8, rest=90)
+    add_workout(client, auth_headers, session_title='Pull', exercise='Row')
+
+    sessions = client.get('/api/sessions', headers=auth_headers).get_json()['sessions']
+    assert [session['session_title'] for session in sessions] == ['Pull', 'Legs']  # newest first
+    assert sessions[1] == {'session_title': 'Legs', 'exercise_count': 2, 'total_volume': 3 * 5 + 3 * 8,
+                           'total_rest': 150, 'latest_id': second['id']}
+
+    client.delete(f"/api/workouts/{second['id']}", headers=auth_headers)
+    legs = client.get('/api/sessions', headers=auth_headers).get_json()['sessions'][1]
+    assert legs == {'session_title': 'Legs', 'exercise_count': 1, 'total_volume': 15, 'total_rest': 60,
+                    'latest_id': first['id']}
+
+    client.delete(f"/api/workouts/{first['id']}", headers=auth_headers)
+    sessions = client.get('/api/sessions', headers=auth_headers).get_json()['sessions']
+    assert [session['session_title'] for session in sessions] == ['Pull']
+    assert client.get('/api/workouts/Legs', headers=auth_headers).status_code == 404
+
+
+def test_bulk_insert_keeps_valid_rows_and_reports_the_rest(client, auth_headers):
+    response = client.post('/api/workouts/bulk', headers=auth_headers, json=[
+        WORKOUT, dict(WORKOUT, exercise=''), dict(WORKOUT, exercise='Lunge', date='2024-05-01'),
+        dict(WORKOUT, sets='three')])
+    assert response.status_code == 201
+    assert response.get_json() == {'inserted': 2, 'errors': [{'index': 1, 'error': 'Missing exercise'},
+                                                             {'index': 3, 'error': 'sets must be an integer'}]}
+
+    ndjson = '\n'.join([json.dumps(dict(WORKOUT, exercise='Deadlift')), '{not json'])
+    response = client.post('/api/workouts/bulk', headers=dict(auth_headers, **{'Content-Type': 'application/x-ndjson'}),
+                           data=ndjson)
+    assert response.get_json() == {'inserted': 1, 'errors': [{'index': 1, 'error': 'Invalid JSON'}]}
+
+    rows = client.get('/api/workouts', headers=auth_headers).get_json()
+    assert [row['exercise'] for row in rows] == ['Squat', 'Lunge', 'Deadlift']
+    assert client.get('/api/sessions', headers=auth_headers).get_json()['sessions'][0]['exercise_count'] == 3
+
+
+def test_deleting_several_workouts_by_id_skips_other_peoples(client, auth_headers):
+    legs = [add_workout(client, auth_headers)['id'], add_workout(client, auth_headers, reps=8)['id']]
+    pull = add_workout(client, auth_headers, session_title='Pull', exercise='Row')['id']
+    bobs = add_workout(client, register(client, 'bob'))['id']
+
+    response = client.delete('/api/workouts', headers=auth_headers, json={'ids': [legs[0], pull, bobs, 99999]})
+    assert response.get_json()['deleted'] == 2
+    assert [row['id'] for row in client.get('/api/workouts', headers=auth_headers).get_json()] == [legs[1]]
+    sessions = client.get('/api/sessions', headers=auth_headers).get_json()['sessions']
+    assert [(session['session_title'], session['exercise_count']) for session in sessions] == [('Legs', 1)]
+    assert client.delete('/api/workouts', headers=auth_headers, json={'ids': [bobs]}).status_code == 404
+    assert client.delete('/api/workouts', headers=auth_headers, json={'ids': ['1']}).status_code == 400
+
+
+@pytest.mark.parametrize('fts', [True, False])
+def test_search_finds_word_prefixes_best_first(app, client, auth_headers, monkeypatch, fts):
+    with app.app_context():
+        assert models.search_uses_fts()  # this SQLite has FTS5, so the fallback is forced below
+    if not fts:
+        monkeypatch.setattr(workouts, 'search_uses_fts', lambda: False)
+    for exercise, times in (('Back Squat', 1), ('Front Squat', 3), ('Bench Press', 2)):
+        for _ in range(times):
+            add_workout(client, auth_headers, session_title='Leg day', exercise=exercise)
+    add_workout(client, auth_headers, session_title='Upper body', exercise='Row')
+    add_workout(client, register(client, 'bob'), exercise='Squat jump')
+
+    def search(query, **params):
+        response = client.get('/api/search', headers=auth_headers, query_string=dict(params, q=query))
+        return [(result['kind'], result['name']) for result in response.get_json()['results']]
+
+    # Same score on the words, so the more used term ranks first; bob's terms never show up
+    assert search('squ') == [('exercise', 'Front Squat'), ('exercise', 'Back Squat')]
+    assert search('SQUAT ba') == [('exercise', 'Back Squat')]
+    assert search('b') == [('exercise', 'Bench Press'), ('exercise', 'Back Squat'), ('session', 'Upper body')]
+    assert search('b', kind='session') == [('session', 'Upper body')]
+    assert search('%') == []
+
+
+def test_ndjson_rows_carry_iso_dates_with_either_encoder(make_app):
+    bodies = {}
+    for serializer in ('orjson', 'json'):
+        app = make_app(JSON_SERIALIZER=serializer)
+        assert app.json.name == serializer
+        client = app.test_client()
+        headers = register(client, f'user-{serializer}')
+        add_workout(client, headers, date='2024-05-01', weight=62.5)
+        add_workout(client, headers, exercise='Lunge', date='2024-05-02')
+        response = client.get('/api/workouts?fields=exercise,date,weight',
+                              headers=dict(headers, Accept='application/x-ndjson'))
+        assert response.mimetype == 'application/x-ndjson'
+        bodies[serializer] = response.get_data()
+
+    assert [json.loads(line) for line in bodies['orjson'].splitlines()] == [
+        {'exercise': 'Squat', 'date': '2024-05-01', 'weight': 62.5},
+        {'exercise': 'Lunge', 'date': '2024-05-02', 'weight': 0.0}]
+    assert bodies['orjson'] == bodies['json']
@@ -0,0 +1,167 @@
+"""Whole-account export and import, streamed both ways.
+
+``GET /api/export?format=csv|ndjson`` sends every workout of the user as a
+download. Rows come off a server-side cursor (``yield_per``) and are encoded a
+batch at a time, so the worker's memory doesn't depend on the account size.
+
+``POST /api/import`` takes the same formats back as the raw request body
+(``Content-Type: text/csv`` or ``application/x-ndjson``; a browser sends a
+File that way with ``fetch(url, {body: file})``). Multipart forms aren't
+accepted: they are spooled to disk before the view runs, which is exactly
+what this avoids. The body is parsed as it arrives and committed every
+IMPORT_BATCH rows through the same bookkeeping as /api/workouts/bulk. The
+response is NDJSON: a progress line after each committed batch, then a
+summary line with ``"done": true`` and the first IMPORT_ERRORS_MAX errors.
+Rows committed before a failure stay imported; the summary says how far it got.
+An empty date is imported as empty, as the export writes undated workouts,
+rather than as today.
+"""
+import csv
+import io
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from auth import jwt_user_id, write_endpoint
+from extensions import db
+from sharding import use_user_shard
+from workouts import (WORKOUT_STREAM_BATCH, insert_workouts, iter_workout_rows, stream_ndjson, utc_today,
+                      validate_workout)
+
+transfer = Blueprint('transfer', __name__)
+
+# The import columns, plus the id for reference; user_id is implied by the account
+EXPORT_FIELDS = ['id', 'session_title', 'exercise', 'sets', 'reps', 'rest', 'date', 'weight']
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+IMPORT_BATCH = 1000
+IMPORT_ERRORS_MAX = 100
+
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+    batch = []
+    for _, row in rows:
+        batch.append(row)
+        if len(batch) >= WORKOUT_STREAM_BATCH:
+            writer.writerows(batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            batch = []
+    writer.writerows(batch)
+    yield buffer.getvalue().encode()
+
+
+@transfer.route('/api/export', methods=['GET'])
+@jwt_required()
+def export_workouts():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    current_user_id = jwt_user_id()
+    if export_format == 'csv':
+        body = stream_csv(iter_workout_rows(current_user_id, EXPORT_FIELDS, columns=True))
+    else:
+        body = stream_ndjson(iter_workout_rows(current_user_id, EXPORT_FIELDS))
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
+    filename = f'workouts-{utc_today().isoformat()}.{export_format}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def import_format():
+    name = request.args.get('format')
+    if name is None:
+        if request.mimetype in ('text/csv', 'application/csv'):
+            name = 'csv'
+        elif request.mimetype == 'application/x-ndjson':
+            name = 'ndjson'
+    if name not in EXPORT_FORMATS:
+        raise ValueError('Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson')
+    return name
+
+
+def read_csv(stream):
+    # utf-8-sig drops the byte-order mark spreadsheet programs put in front of the header
+    text = io.TextIOWrapper(stream if hasattr(stream, 'read1') else io.BufferedReader(stream),
+                            encoding='utf-8-sig', newline='')
+    for item in csv.DictReader(text):
+        yield item
+
+
+def read_ndjson(stream):
+    loads = current_app.json.loads
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield loads(line)
+        except ValueError:
+            yield None  # reported as an invalid row
+
+
+def run_import(user_id, items):
+    use_user_shard(user_id)  # runs as the response streams, in a new session
+    processed = imported = failed = 0
+    errors, batch = [], []
+    started = time.monotonic()
+
+    def progress(**extra):
+        elapsed = time.monotonic() - started
+        line = dict(processed=processed, imported=imported, failed=failed, seconds=round(elapsed, 2), **extra)
+        return current_app.json.dumps_bytes(line) + b'\n'
+
+    def commit(batch):
+        insert_workouts(user_id, batch)
+        db.session.commit()
+
+    try:
+        for item in items:
+            values, error = validate_workout(item, keep_empty_date=True) if item is not None else (None, 'Invalid JSON')
+            processed += 1
+            if error:
+                failed += 1
+                if len(errors) < IMPORT_ERRORS_MAX:
+                    errors.append({'row': processed, 'error': error})
+                continue
+            batch.append(values)
+            if len(batch) >= IMPORT_BATCH:
+                commit(batch)
+                imported += len(batch)
+                batch = []
+                yield progress()
+        if batch:
+            commit(batch)
+            imported += len(batch)
+        yield progress(done=True, errors=errors)
+    except Exception as error:
+        # The 200 and the progress so far are already sent, so the failure goes in the summary
+        db.session.rollback()
+        current_app.logger.exception('Import for user %s failed after %d rows', user_id, imported)
+        if hasattr(error, 'description'):  # e.g. the body went over IMPORT_MAX_LENGTH
+            message = error.description
+        elif isinstance(error, (csv.Error, UnicodeDecodeError)):
+            message = f'Could not parse the file: {error}'
+        else:
+            message = 'Import failed'
+        yield progress(done=True, errors=errors, error=message)
+
+
+@transfer.route('/api/import', methods=['POST'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES')
+def import_workouts():
+    # Exports can be far bigger than MAX_CONTENT_LENGTH allows for other requests
+    max_length = current_app.config['IMPORT_MAX_LENGTH']
+    if request.content_length is not None and request.content_length > max_length:
+        return jsonify({'error': 'File is too large'}), 413
+    request.max_content_length = max_length  # also caps chunked bodies, whose length isn't known up front
+    try:
+        items = read_csv(request.stream) if import_format() == 'csv' else read_ndjson(request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    body = run_import(jwt_user_id(), items)
+    return Response(stream_with_context(body), mimetype='application/x-ndjson'), 200
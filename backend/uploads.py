@@ -0,0 +1,113 @@
+"""File upload endpoints.
+
+Files are stored by content hash (see media.py), so re-uploads are
+deduplicated, and their renditions are made in the background (media_jobs.py).
+"""
+import os
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_from_directory, url_for
+from flask_jwt_extended import jwt_required
+
+from extensions import media_store, media_worker
+from media import UploadError
+from media_jobs import rendition_names
+
+uploads = Blueprint('uploads', __name__)
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi'}
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def file_ext(filename):
+    return filename.rsplit('.', 1)[1].lower()
+
+def media_response(relpath, created=True, status=201):
+    # Renditions are rendered in the background; their URLs 404 (with Retry-After) until ready
+    media_worker.submit(relpath)
+    return jsonify({
+        'message': 'File successfully uploaded',
+        'url': url_for('uploads.serve_media', relpath=relpath, _external=True),
+        'renditions': {name: url_for('uploads.serve_media', relpath=path, _external=True)
+                       for name, path in rendition_names(relpath).items()},
+        'sha256': relpath.rsplit('/', 1)[1].split('.', 1)[0],
+        'duplicate': not created
+    }), status
+
+@uploads.route('/media/<path:relpath>', methods=['GET'])
+def serve_media(relpath):
+    # send_from_directory answers If-None-Match/If-Modified-Since with 304 and
+    # serves Range requests, so video seeks only fetch the bytes they need
+    if relpath.startswith('.'):
+        return jsonify({'error': 'Not found'}), 404
+    root = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    if not os.path.isfile(media_store.path(relpath)):
+        response = jsonify({'error': 'Not found'})
+        if relpath.count('.') > 1:
+            response.headers['Retry-After'] = '5'  # a rendition that may still be rendering
+        return response, 404
+    response = send_from_directory(root, relpath, conditional=True, max_age=current_app.config['MEDIA_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
+
+@uploads.app_errorhandler(UploadError)
+def upload_error(error):
+    return jsonify({'error': str(error)}), error.status
+
+@uploads.route('/upload', methods=['POST'])
+def upload_file():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    relpath, created, _ = media_store.save_stream(file.stream, file_ext(file.filename))
+    return media_response(relpath, created)
+
+@uploads.route('/api/uploads/<string:filename>', methods=['PUT'])
+@jwt_required()
+def stream_upload(filename):
+    # Raw request body, hashed and written to disk chunk by chunk as it arrives
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    relpath, created, _ = media_store.save_stream(request.stream, file_ext(filename))
+    return media_response(relpath, created)
+
+@uploads.route('/api/uploads', methods=['POST'])
+@jwt_required()
+def start_upload():
+    # Resumable upload: {"filename": "squat.mp4", "length": <bytes>} -> upload id.
+    # Send the bytes with PATCH /api/uploads/<id> and an Upload-Offset header;
+    # HEAD /api/uploads/<id> tells a reconnecting client where to resume.
+    data = request.get_json(silent=True) or {}
+    filename, length = data.get('filename') or '', data.get('length')
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if not isinstance(length, int) or length <= 0:
+        return jsonify({'error': 'length must be a positive integer'}), 400
+    if length > current_app.config['UPLOAD_MAX_LENGTH']:
+        return jsonify({'error': 'File is too large'}), 413
+    upload_id = media_store.start_upload(file_ext(filename), length)
+    response = jsonify({'upload_id': upload_id, 'offset': 0, 'length': length})
+    response.headers['Location'] = url_for('uploads.upload_chunk', upload_id=upload_id)
+    return response, 201
+
+@uploads.route('/api/uploads/<string:upload_id>', methods=['HEAD', 'PATCH'])
+@jwt_required()
+def upload_chunk(upload_id):
+    if request.method == 'HEAD':
+        meta = media_store.status(upload_id)
+    else:
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'Missing Upload-Offset header'}), 400
+        meta = media_store.append(upload_id, offset, request.stream)
+        if 'relpath' in meta:
+            return media_response(meta['relpath'], meta['created'])
+    response = Response(status=204)
+    response.headers['Upload-Offset'] = str(meta['offset'])
+    response.headers['Upload-Length'] = str(meta['length'])
+    return response
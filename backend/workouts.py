@@ -0,0 +1,612 @@
+"""Workout, session, search and analytics endpoints.
+
+Reads are scoped to the JWT user and cached per user and data_version (see
+``cached_by_data_version``); writes go through the bookkeeping helpers in
+models.py, are recorded in the user's change log (see changes.py) and are
+rate limited and admitted through ``write_endpoint``.
+"""
+import datetime
+import hashlib
+import json
+from functools import wraps
+
+import sqlalchemy
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from auth import jwt_user_id, write_endpoint
+from database import begin_read_snapshot, is_locked_error
+from extensions import db, exercise_cache, response_cache
+from models import (ROLLUP_MAXIMA, ROLLUP_TOTALS, DailyExerciseRollup, Exercise, SearchTerm, WeeklyExerciseRollup,
+                    Workout, WorkoutSession, bump_data_version, current_data_version, latest_change_seq,
+                    record_changes, refresh_rollups, refresh_session_summaries, rollups_added, rollups_added_rows,
+                    search_index, search_term_changes, search_uses_fts, session_added, session_removed,
+                    sessions_added, update_search_terms, week_start, workout_rows)
+from search import escape_like, fts_expression, query_words
+from sharding import use_user_shard
+
+workouts = Blueprint('workouts', __name__)
+
+SESSION_PAGE_DEFAULT = 50
+SESSION_PAGE_MAX = 200
+
+SEARCH_LIMIT_DEFAULT = 10
+SEARCH_LIMIT_MAX = 50
+
+def search_terms_query(user_id, words, kind=None, limit=SEARCH_LIMIT_DEFAULT, fts=None):
+    filters = [SearchTerm.user_id == user_id]
+    if kind:
+        filters.append(SearchTerm.kind == kind)
+    if search_uses_fts() if fts is None else fts:
+        rank = db.func.bm25(db.literal_column('search_index'), 0.0, 1.0)
+        return (db.select(SearchTerm)
+                .select_from(search_index).join(SearchTerm, SearchTerm.id == search_index.c.rowid)
+                .where(db.literal_column('search_index').op('MATCH')(fts_expression(user_id, words)), *filters)
+                .order_by(rank, SearchTerm.uses.desc())
+                .limit(limit))
+    # LIKE fallback: every word starts the name or one of its words
+    name = db.func.lower(SearchTerm.name)
+    for word in words:
+        word = escape_like(word)
+        filters.append(db.or_(name.like(f'{word}%', escape='\\'), name.like(f'% {word}%', escape='\\')))
+    starts = db.case((name.like(f'{escape_like(words[0])}%', escape='\\'), 0), else_=1)
+    return db.select(SearchTerm).where(*filters).order_by(starts, SearchTerm.uses.desc(), SearchTerm.name).limit(limit)
+
+def user_sessions_query(user_id, before_id=None, limit=SESSION_PAGE_DEFAULT):
+    # Newest session first; the latest workout id doubles as the page cursor
+    query = db.select(WorkoutSession).where(WorkoutSession.user_id == user_id)
+    if before_id is not None:
+        query = query.where(WorkoutSession.latest_workout_id < before_id)
+    return query.order_by(WorkoutSession.latest_workout_id.desc()).limit(limit)
+
+WORKOUT_BULK_MAX = 5000
+INVALID_JSON = object()  # placeholder for an NDJSON line that didn't parse
+
+def utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+def parse_date(value):
+    """``YYYY-MM-DD`` (or a full ISO timestamp) -> date; None for a missing value."""
+    if value in (None, ''):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return datetime.date.fromisoformat(value[:10])
+
+def validate_workout(data, keep_empty_date=False):
+    """Return ``(values, None)`` for a valid workout payload, else ``(None, error)``.
+
+    A workout without a date is dated today, except that with
+    ``keep_empty_date`` an explicitly empty or null date stays NULL: that is
+    how exports write workouts recorded before dates were tracked.
+    """
+    if not isinstance(data, dict):
+        return None, 'Expected a JSON object'
+    values = {}
+    for name in ('session_title', 'exercise'):
+        value = data.get(name)
+        if not isinstance(value, str) or not value.strip():
+            return None, f'Missing {name}'
+        if len(value) > 120:
+            return None, f'{name} is longer than 120 characters'
+        values[name] = value
+    for name in ('sets', 'reps', 'rest'):
+        # The form posts numbers as strings
+        try:
+            value = int(data.get(name))
+        except (TypeError, ValueError):
+            return None, f'{name} must be an integer'
+        if value < 0:
+            return None, f'{name} must not be negative'
+        values[name] = value
+    # Optional: the day it was done and the load lifted
+    try:
+        values['date'] = parse_date(data.get('date'))
+    except ValueError:
+        return None, 'date must be a YYYY-MM-DD date'
+    if values['date'] is None and not (keep_empty_date and 'date' in data):
+        values['date'] = utc_today()
+    weight = data.get('weight')
+    try:
+        values['weight'] = float(weight) if weight not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        return None, 'weight must be a number'
+    if not 0 <= values['weight'] < float('inf'):
+        return None, 'weight must be a finite, non-negative number'
+    return values, None
+
+def created_workout(user_id, workout_id, values):
+    # What an insert hands back and logs, built from the payload rather than reloading the row
+    return dict(values, id=workout_id, user_id=user_id, date=values['date'] and values['date'].isoformat())
+
+def removed_workout(row, session_title):
+    # A delete event carries what a client needs to take the workout out of its session summary
+    return {'id': row.id, 'session_title': session_title, 'sets': row.sets, 'reps': row.reps, 'rest': row.rest}
+
+def insert_workouts(user_id, items):
+    """Insert validated workout payloads and fold them into the user's derived data; the caller commits.
+
+    Everything is a delta against what's already stored, so the cost depends
+    only on ``items``: bulk writes and each batch of an import cost the same
+    however much history the user has.
+    """
+    rows = workout_rows(user_id, items)
+    # Still batched into multi-row INSERTs; RETURNING hands back the ids in payload order
+    ids = db.session.scalars(db.insert(Workout).returning(Workout.id, sort_by_parameter_order=True), rows).all()
+    for row, workout_id in zip(rows, ids):
+        row['id'] = workout_id
+    sessions_added(rows)
+    rollups_added_rows(rows)
+    update_search_terms(user_id, search_term_changes(rows))
+    record_changes(user_id, 'insert', [created_workout(user_id, row['id'], values) for row, values in zip(rows, items)])
+    bump_data_version(user_id)
+
+def read_bulk_payload():
+    """Yield ``(index, item)`` from a JSON array or an NDJSON request body."""
+    if request.mimetype == 'application/x-ndjson':
+        index = 0
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, INVALID_JSON
+            index += 1
+        return
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('workouts')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of workouts')
+    yield from enumerate(data)
+
+# Conditional GETs: every workout write bumps the user's data_version, so
+# (user, data_version, request) identifies a response body exactly. A matching
+# If-None-Match gets a 304 after a single primary-key lookup, and bodies are
+# kept in an LRU cache keyed the same way. A view whose ?<today_param>= defaults
+# to today also depends on the date when that parameter is left out, so then
+# the date goes into the key too and the body and ETag roll over at midnight UTC.
+not_modified_count = 0
+
+def cached_by_data_version(view=None, today_param=None):
+    if view is None:
+        return lambda view: cached_by_data_version(view, today_param)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        global not_modified_count
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        user_id = jwt_user_id()
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        today = utc_today() if today_param and not request.args.get(today_param) else None
+        key = (user_id, current_data_version(user_id), request.path, query, wants_ndjson(), today)
+        etag = hashlib.blake2s(repr(key).encode(), digest_size=12).hexdigest()
+
+        # Weak match: compressed responses carry the same ETag marked weak (see compression.py)
+        if request.if_none_match.contains_weak(etag):
+            not_modified_count += 1
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        cached = response_cache.get(key)
+        if cached is not None:
+            body, mimetype = cached
+            response = Response(body, status=200, mimetype=mimetype)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            max_body = current_app.config['RESPONSE_CACHE_MAX_BODY']
+            if not response.is_streamed and response.content_length <= max_body:
+                response_cache.set(key, (response.get_data(), response.mimetype))
+        response.set_etag(etag)
+        return response
+    return wrapper
+
+# Columns a client may ask for with ?fields=, in the order to_dict() emits them
+WORKOUT_FIELDS = ('id', 'user_id', 'session_title', 'exercise', 'sets', 'reps', 'rest', 'date', 'weight')
+WORKOUT_PAGE_MAX = 1000
+WORKOUT_STREAM_BATCH = 500
+
+def parse_workout_fields(raw):
+    if not raw:
+        return list(WORKOUT_FIELDS)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in WORKOUT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or raw}")
+    return fields
+
+def workout_column(name):
+    if name == 'session_title':
+        return WorkoutSession.title.label(name)
+    if name == 'exercise':
+        return Exercise.name.label(name)
+    return getattr(Workout, name)
+
+def user_workouts_query(user_id, fields=WORKOUT_FIELDS, after_id=None, limit=None):
+    columns = [workout_column(name) for name in fields]
+    if 'id' not in fields:
+        columns.append(Workout.id)  # keyset pagination always needs the id
+    query = db.select(*columns).where(Workout.user_id == user_id)
+    # Only join the lookup tables whose names were asked for
+    if 'session_title' in fields:
+        query = query.join(WorkoutSession, Workout.session_id == WorkoutSession.id)
+    if 'exercise' in fields:
+        query = query.join(Exercise, Workout.exercise_id == Exercise.id)
+    if after_id is not None:
+        query = query.where(Workout.id > after_id)
+    query = query.order_by(Workout.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def session_workouts_query(user_id, session_title):
+    # A single SELECT of plain columns: the session is the join that filters, the exercise is joined for its name
+    return (db.select(*[workout_column(name) for name in WORKOUT_FIELDS])
+            .join(WorkoutSession, Workout.session_id == WorkoutSession.id)
+            .join(Exercise, Workout.exercise_id == Exercise.id)
+            .where(WorkoutSession.user_id == user_id, WorkoutSession.title == session_title)
+            .order_by(Workout.id))
+
+def session_id_subquery(user_id, session_title):
+    return (db.select(WorkoutSession.id)
+            .where(WorkoutSession.user_id == user_id, WorkoutSession.title == session_title)
+            .scalar_subquery())
+
+def delete_session_stmt(user_id, session_title):
+    # The session lookup is already scoped to the user
+    return (db.delete(Workout)
+            .where(Workout.session_id == session_id_subquery(user_id, session_title))
+            .returning(Workout.id, Workout.session_id, Workout.exercise_id, Workout.date,
+                       Workout.sets, Workout.reps, Workout.rest))
+
+def delete_workouts_stmt(user_id, workout_ids):
+    # RETURNING hands back what the session summaries need without loading the rows first
+    return (db.delete(Workout)
+            .where(Workout.user_id == user_id, Workout.id.in_(workout_ids))
+            .returning(Workout.id, Workout.user_id, Workout.session_id, Workout.exercise_id, Workout.date,
+                       Workout.sets, Workout.reps, Workout.rest))
+
+def iter_workout_rows(user_id, fields, after_id=None, limit=None, columns=False):
+    """Yield ``(id, row)`` for a user's workouts in id order.
+
+    Rows are dicts, or with ``columns`` tuples in ``fields`` order that go to
+    the encoder as they are. Only the requested columns are selected, so no
+    ORM entities are built, and rows are fetched in batches of
+    WORKOUT_STREAM_BATCH so memory stays flat regardless of how many workouts
+    the user has.
+    """
+    use_user_shard(user_id)  # a streamed body reads from a new session, after the view has returned
+    query = user_workouts_query(user_id, fields, after_id, limit)
+    result = db.session.execute(query, execution_options={'yield_per': WORKOUT_STREAM_BATCH})
+    width = len(fields)
+    id_index = fields.index('id') if 'id' in fields else width
+    for row in result:
+        values = tuple(row)
+        yield values[id_index], values[:width] if columns else dict(zip(fields, values))
+
+def parse_shape():
+    # ?shape=columns sends {"columns": [...], "rows": [[...], ...]} instead of an object per row
+    shape = request.args.get('shape', 'objects')
+    if shape not in ('objects', 'columns'):
+        raise ValueError('shape must be objects or columns')
+    return shape == 'columns'
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_ndjson(rows):
+    dumps = current_app.json.dumps_bytes
+    batch = []
+    for _, row in rows:
+        batch.append(dumps(row))
+        if len(batch) >= WORKOUT_STREAM_BATCH:
+            yield b'\n'.join(batch) + b'\n'
+            batch = []
+    if batch:
+        yield b'\n'.join(batch) + b'\n'
+
+def stream_json_array(rows, prefix=b'[', suffix=b']'):
+    # Each batch is encoded as one list in a single encoder call, minus its brackets
+    dumps = current_app.json.dumps_bytes
+    yield prefix
+    batch = []
+    first = True
+    for _, row in rows:
+        batch.append(row)
+        if len(batch) >= WORKOUT_STREAM_BATCH:
+            yield (b'' if first else b',') + dumps(batch)[1:-1]
+            first = False
+            batch = []
+    if batch:
+        yield (b'' if first else b',') + dumps(batch)[1:-1]
+    yield suffix
+
+def stream_json_columns(fields, rows):
+    return stream_json_array(rows, b'{"columns":' + current_app.json.dumps_bytes(fields) + b',"rows":[', b']}')
+
+@workouts.app_errorhandler(sqlalchemy.exc.OperationalError)
+def database_busy(error):
+    # Raised once busy_timeout has run out while another worker holds the write lock
+    db.session.rollback()
+    if is_locked_error(error):
+        response = jsonify({'error': 'Database is busy, please retry'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    raise error
+
+@workouts.route('/api/workouts', methods=['GET', 'POST'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES', methods={'POST'})
+@cached_by_data_version
+def manage_workouts():
+    current_user_id = jwt_user_id()
+    if request.method == 'POST':
+        values, error = validate_workout(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        new_workout = Workout(**workout_rows(current_user_id, [values])[0])  # Assign current user's ID to the workout
+        db.session.add(new_workout)
+        db.session.flush()
+        session_added(new_workout)
+        rollups_added(new_workout)
+        update_search_terms(current_user_id, search_term_changes([new_workout]))
+        created = created_workout(current_user_id, new_workout.id, values)
+        record_changes(current_user_id, 'insert', [created])
+        bump_data_version(current_user_id)
+        db.session.commit()
+        return jsonify(created), 201
+
+    # GET: ?fields=a,b projects columns, ?cursor=<last id>&limit=N pages by id,
+    # ?format=ndjson (or Accept: application/x-ndjson) streams one row per line,
+    # ?shape=columns sends rows as arrays in fields order.
+    try:
+        fields = parse_workout_fields(request.args.get('fields'))
+        columns = parse_shape()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    after_id = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, WORKOUT_PAGE_MAX))
+
+    if wants_ndjson():
+        rows = iter_workout_rows(current_user_id, fields, after_id, limit, columns)
+        return Response(stream_with_context(stream_ndjson(rows)), mimetype='application/x-ndjson'), 200
+
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        page = list(iter_workout_rows(current_user_id, fields, after_id, limit + 1, columns))
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        rows = [row for _, row in page[:limit]]
+        if columns:
+            return jsonify({'columns': fields, 'rows': rows, 'next_cursor': next_cursor}), 200
+        return jsonify({'workouts': rows, 'next_cursor': next_cursor}), 200
+
+    rows = iter_workout_rows(current_user_id, fields, after_id, columns=columns)
+    body = stream_json_columns(fields, rows) if columns else stream_json_array(rows)
+    return Response(stream_with_context(body), mimetype='application/json'), 200
+
+@workouts.route('/api/workouts/bulk', methods=['POST'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES')
+def bulk_create_workouts():
+    # Accepts a JSON array (or {"workouts": [...]}) or an application/x-ndjson body.
+    # Every row is validated first; valid rows go in with one executemany INSERT
+    # and one commit, invalid rows are reported back by index. Larger histories
+    # go through /api/import instead.
+    current_user_id = jwt_user_id()
+    rows, errors = [], []
+    try:
+        for index, item in read_bulk_payload():
+            if index >= WORKOUT_BULK_MAX:
+                return jsonify({'error': f'At most {WORKOUT_BULK_MAX} workouts per request'}), 413
+            values, error = (None, 'Invalid JSON') if item is INVALID_JSON else validate_workout(item)
+            if error:
+                errors.append({'index': index, 'error': error})
+            else:
+                rows.append(values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not rows:
+        return jsonify({'inserted': 0, 'errors': errors, 'error': 'No valid workouts'}), 400
+
+    insert_workouts(current_user_id, rows)
+    db.session.commit()
+    return jsonify({'inserted': len(rows), 'errors': errors}), 201
+
+@workouts.route('/api/workouts/session/<string:session_title>', methods=['DELETE'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES')
+def delete_session(session_title):
+    current_user_id = jwt_user_id()
+    deleted = db.session.execute(delete_session_stmt(current_user_id, session_title)).all()
+    if not deleted:
+        return jsonify({'error': 'Session not found'}), 404
+
+    db.session.execute(db.delete(WorkoutSession).filter_by(user_id=current_user_id, title=session_title))
+    refresh_rollups(current_user_id, {(row.exercise_id, row.date) for row in deleted})
+    update_search_terms(current_user_id, search_term_changes(deleted, sign=-1))
+    record_changes(current_user_id, 'delete', [removed_workout(row, session_title) for row in deleted])
+    bump_data_version(current_user_id)
+    db.session.commit()
+    return jsonify({'message': 'Session deleted successfully', 'deleted': len(deleted)}), 200
+
+@workouts.route('/api/workouts/<int:workout_id>', methods=['DELETE'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES')
+def delete_workout(workout_id):
+    current_user_id = jwt_user_id()
+    workout = db.session.execute(delete_workouts_stmt(current_user_id, [workout_id])).first()
+    if workout is None:
+        return jsonify({'error': 'Workout not found'}), 404
+
+    summary = db.session.get(WorkoutSession, workout.session_id)  # its title, before session_removed may delete it
+    session_title = summary.title if summary else None
+    session_removed(workout)
+    refresh_rollups(current_user_id, [(workout.exercise_id, workout.date)])
+    update_search_terms(current_user_id, search_term_changes([workout], sign=-1))
+    record_changes(current_user_id, 'delete', [removed_workout(workout, session_title)])
+    bump_data_version(current_user_id)
+    db.session.commit()
+    return jsonify({'message': 'Workout deleted successfully', 'deleted': 1}), 200
+
+@workouts.route('/api/workouts', methods=['DELETE'])
+@jwt_required()
+@write_endpoint('RATE_LIMIT_WRITES')
+def delete_workouts():
+    # Body: {"ids": [1, 2, 3]}. Ids that don't exist or belong to someone else are skipped.
+    current_user_id = jwt_user_id()
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        return jsonify({'error': 'Expected a non-empty list of workout ids'}), 400
+    if len(ids) > WORKOUT_BULK_MAX:
+        return jsonify({'error': f'At most {WORKOUT_BULK_MAX} workouts per request'}), 413
+
+    deleted = db.session.execute(delete_workouts_stmt(current_user_id, ids)).all()
+    if not deleted:
+        return jsonify({'error': 'Workouts not found'}), 404
+
+    session_ids = {row.session_id for row in deleted}
+    # Titles for the change log, read before refreshing deletes the emptied sessions
+    titles = dict(db.session.execute(
+        db.select(WorkoutSession.id, WorkoutSession.title).where(WorkoutSession.id.in_(session_ids))).all())
+    refresh_session_summaries(session_ids)
+    refresh_rollups(current_user_id, {(row.exercise_id, row.date) for row in deleted})
+    update_search_terms(current_user_id, search_term_changes(deleted, sign=-1))
+    record_changes(current_user_id, 'delete', [removed_workout(row, titles.get(row.session_id)) for row in deleted])
+    bump_data_version(current_user_id)
+    db.session.commit()
+    return jsonify({'message': 'Workouts deleted successfully', 'deleted': len(deleted)}), 200
+
+@workouts.route('/api/workouts/<string:sessionTitle>', methods=['GET'])
+@jwt_required()
+@cached_by_data_version
+def get_session_workouts(sessionTitle):
+    current_user_id = jwt_user_id()
+    try:
+        columns = parse_shape()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = db.session.execute(session_workouts_query(current_user_id, sessionTitle)).all()
+    if not rows:
+        return jsonify({'error': 'Session not found'}), 404
+    if columns:
+        return jsonify({'columns': WORKOUT_FIELDS, 'rows': [tuple(row) for row in rows]})
+    return jsonify([dict(zip(WORKOUT_FIELDS, row)) for row in rows])
+
+@workouts.route('/api/sessions', methods=['GET'])
+@jwt_required()
+@cached_by_data_version
+def list_sessions():
+    # One row per session from the summary table: ?cursor=<latest_id>&limit=N pages newest first.
+    # Both reads share a snapshot, so /api/changes?since=<change_seq> picks up exactly the writes
+    # this response doesn't include. Where the database gives each statement its own snapshot
+    # (READ COMMITTED), change_seq is still read first, so a write in between is replayed, never lost.
+    current_user_id = jwt_user_id()
+    before_id = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', SESSION_PAGE_DEFAULT, type=int)
+    limit = max(1, min(limit, SESSION_PAGE_MAX))
+    begin_read_snapshot(db.session.connection())
+    change_seq = latest_change_seq(current_user_id)
+    sessions = db.session.scalars(user_sessions_query(current_user_id, before_id, limit + 1)).all()
+    next_cursor = sessions[limit - 1].latest_workout_id if len(sessions) > limit else None
+    return jsonify({'sessions': [session.to_dict() for session in sessions[:limit]], 'next_cursor': next_cursor,
+                    'change_seq': change_seq}), 200
+
+@workouts.route('/api/search', methods=['GET'])
+@jwt_required()
+@cached_by_data_version
+def search():
+    # ?q=squ&kind=session|exercise&limit=N: the user's sessions and exercises
+    # whose words start with the words typed, best matches first
+    current_user_id = jwt_user_id()
+    kind = request.args.get('kind')
+    if kind not in (None, 'session', 'exercise'):
+        return jsonify({'error': 'kind must be session or exercise'}), 400
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT_DEFAULT, type=int), SEARCH_LIMIT_MAX))
+    words = query_words(request.args.get('q', ''))
+    if not words:
+        return jsonify({'results': []}), 200
+
+    terms = db.session.scalars(search_terms_query(current_user_id, words, kind, limit)).all()
+    # Session hits carry their summary so the list can show them directly
+    session_ids = [term.ref_id for term in terms if term.kind == 'session']
+    summaries = {session.id: session for session in db.session.scalars(
+        db.select(WorkoutSession).where(WorkoutSession.id.in_(session_ids)))} if session_ids else {}
+    results = []
+    for term in terms:
+        result = term.to_dict()
+        if term.ref_id in summaries and term.kind == 'session':
+            result['session'] = summaries[term.ref_id].to_dict()
+        results.append(result)
+    return jsonify({'results': results}), 200
+
+ANALYTICS_PERIODS = {'day': DailyExerciseRollup, 'week': WeeklyExerciseRollup}
+ANALYTICS_DEFAULT_DAYS = 365
+
+def find_exercise_id(name):
+    # Read-only counterpart of exercise_ids(): unknown names are not added
+    key = (db.session.info.get('shard'), name)
+    exercise_id = exercise_cache.get(key)
+    if exercise_id is None:
+        exercise_id = db.session.scalar(db.select(Exercise.id).where(Exercise.name == name))
+        if exercise_id is not None:
+            exercise_cache.set(key, exercise_id)
+    return exercise_id
+
+def analytics_query(user_id, model, start, end, exercise_id=None):
+    in_range = (model.user_id == user_id, model.period_start.between(start, end))
+    if exercise_id is not None:
+        columns = [getattr(model, name) for name in ('period_start',) + ROLLUP_TOTALS + ROLLUP_MAXIMA]
+        return (db.select(*columns).where(model.exercise_id == exercise_id, *in_range)
+                .order_by(model.period_start))
+    # Every exercise combined, summed per period
+    columns = ([model.period_start] + [db.func.sum(getattr(model, name)).label(name) for name in ROLLUP_TOTALS]
+               + [db.func.max(getattr(model, name)).label(name) for name in ROLLUP_MAXIMA])
+    return db.select(*columns).where(*in_range).group_by(model.period_start).order_by(model.period_start)
+
+@workouts.route('/api/analytics', methods=['GET'])
+@jwt_required()
+@cached_by_data_version(today_param='to')
+def analytics():
+    # ?exercise=Squat&period=week|day&from=YYYY-MM-DD&to=YYYY-MM-DD, read from
+    # the rollup tables; without ?exercise= all exercises are combined
+    current_user_id = jwt_user_id()
+    period = request.args.get('period', 'week')
+    if period not in ANALYTICS_PERIODS:
+        return jsonify({'error': f"period must be one of {', '.join(ANALYTICS_PERIODS)}"}), 400
+    try:
+        end = parse_date(request.args.get('to')) or utc_today()
+        start = parse_date(request.args.get('from')) or end - datetime.timedelta(days=ANALYTICS_DEFAULT_DAYS)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD dates'}), 400
+    if period == 'week':
+        start = week_start(start)
+
+    name = request.args.get('exercise')
+    exercise_id = find_exercise_id(name) if name else None
+    points = []
+    if not name or exercise_id is not None:
+        query = analytics_query(current_user_id, ANALYTICS_PERIODS[period], start, end, exercise_id)
+        for row in db.session.execute(query):
+            points.append({
+                'start': row.period_start.isoformat(),
+                'workouts': row.workouts,
+                'sets': row.sets,
+                'reps': row.reps,
+                'volume': round(row.volume, 2),
+                'max_weight': row.max_weight,
+                'estimated_1rm': round(row.best_1rm, 2)
+            })
+    return jsonify({'exercise': name, 'period': period, 'from': start.isoformat(), 'to': end.isoformat(),
+                    'points': points}), 200
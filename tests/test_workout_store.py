@@ -0,0 +1,141 @@
+import pytest
+from sqlalchemy import create_engine
+
+import app_v1
+import workout_store
+from workout_store import RedisWorkoutStore, SQLiteWorkoutStore, WorkoutStore
+
+SQUAT = {'exercise': 'Squat', 'sets': 3, 'reps': 5, 'rest': 60}
+ROW = {'exercise': 'Row', 'sets': 4, 'reps': 8, 'rest': 90}
+
+
+class FakeRedis:
+    """The few hash and TTL commands RedisWorkoutStore uses, in memory."""
+
+    def __init__(self):
+        self.hashes, self.ttls = {}, {}
+
+    def hincrby(self, key, field, amount):
+        value = int(self.hashes.setdefault(key, {}).get(field.encode(), 0)) + amount
+        self.hashes[key][field.encode()] = str(value).encode()
+        return value
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field.encode()] = value.encode()
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field.encode())
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        found = [field for field in fields if self.hashes.get(key, {}).pop(field.encode(), None) is not None]
+        return len(found)
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'store.db'}")
+    yield SQLiteWorkoutStore(engine, anon_ttl=100, max_anon=2)
+    engine.dispose()
+
+
+@pytest.fixture
+def client(tmp_path):
+    # The store is opened on first use, so a URL set here keeps the tests off the app's own database
+    app_v1.app.config.update(WORKOUT_STORE_URL=f"sqlite:///{tmp_path / 'store.db'}", TESTING=True)
+    app_v1.app.extensions.pop('workout_store', None)
+    yield app_v1.app.test_client()
+    app_v1.app.extensions.pop('workout_store').engine.dispose()
+
+
+def add(client, title, exercise):
+    return client.post('/', data=dict(exercise, session_title=title))
+
+
+def test_a_backend_missing_methods_fails_when_created():
+    class Incomplete(WorkoutStore):
+        def touch(self, owner):
+            pass
+
+    with pytest.raises(TypeError, match='abstract'):
+        Incomplete()
+
+
+def test_visitors_each_get_their_own_anonymous_workouts(client):
+    assert b'Squat' in add(client, 'Legs', SQUAT).data
+    with client.session_transaction() as session:
+        owner = f"anon:{session['anon_id']}"
+    assert list(app_v1.workout_store().sessions(owner)) == ['Legs']
+    assert b'Squat' in client.get('/').data
+
+    stranger = app_v1.app.test_client()
+    assert b'Squat' not in stranger.get('/').data
+
+
+def test_exercises_are_deleted_by_id(client):
+    add(client, 'Legs', SQUAT)
+    add(client, 'Legs', ROW)
+    with client.session_transaction() as session:
+        owner = f"anon:{session['anon_id']}"
+    squat, row = app_v1.workout_store().session(owner, 'Legs')
+
+    stranger = app_v1.app.test_client()
+    stranger.post(f"/delete-exercise/Legs/{squat['id']}")
+    client.post(f"/delete-exercise/Back/{squat['id']}")  # the id isn't in that session
+    assert len(app_v1.workout_store().session(owner, 'Legs')) == 2
+
+    response = client.post(f"/delete-exercise/Legs/{squat['id']}")
+    assert response.status_code == 302 and response.location.endswith('/workout-session/Legs')
+    assert app_v1.workout_store().session(owner, 'Legs') == [row]
+
+
+def test_old_delete_workout_link_redirects_without_deleting(client):
+    add(client, 'Legs', SQUAT)
+    response = client.get('/delete-workout/Legs/0')
+    assert response.status_code == 302 and response.location.endswith('/workout-session/Legs')
+    assert b'Squat' in client.get(response.location).data
+
+
+def test_sweep_expires_idle_owners_and_drops_the_least_recently_seen(sqlite_store, monkeypatch):
+    for now, owner in enumerate(['anon:a', 'anon:b', 'anon:c', 'user:1']):
+        monkeypatch.setattr(workout_store.time, 'time', lambda now=now * 10: now)
+        sqlite_store.touch(owner)
+        sqlite_store.add_exercise(owner, 'Legs', SQUAT)
+
+    assert sqlite_store.sweep(now=30) == 1  # three anonymous owners, two allowed
+    assert sqlite_store.sessions('anon:a') == {}
+    assert list(sqlite_store.sessions('anon:b')) == ['Legs']
+
+    assert sqlite_store.sweep(now=200) == 2  # b and c were last seen more than anon_ttl ago
+    assert sqlite_store.sessions('anon:c') == {}
+    assert list(sqlite_store.sessions('user:1')) == ['Legs']  # only anonymous owners expire
+
+
+def test_redis_store_keeps_sessions_per_owner_and_expires_anonymous_ones():
+    client = FakeRedis()
+    store = RedisWorkoutStore(client, anon_ttl=100)
+    squat = store.add_exercise('anon:a', 'Legs', SQUAT)
+    row = store.add_exercise('anon:a', 'Back', ROW)
+    store.add_exercise('user:1', 'Legs', SQUAT)
+    store.touch('user:1')
+
+    assert store.sessions('anon:a') == {'Legs': [dict(SQUAT, id=squat)], 'Back': [dict(ROW, id=row)]}
+    assert client.ttls == {'workouts:anon:a': 100}
+
+    assert not store.delete_exercise('anon:a', 'Back', squat)
+    assert store.delete_exercise('anon:a', 'Legs', squat)
+    assert not store.delete_exercise('anon:a', 'Legs', squat)
+    assert store.delete_session('anon:a', 'Back') and not store.delete_session('anon:a', 'Back')
+    assert store.sessions('anon:a') == {}
+    assert list(store.sessions('user:1')) == ['Legs']
@@ -142,7 +142,8 @@ function App() {
     axios.get(`${API_URL}/api/check-session`)
       .then(response => {
         setIsAuthenticated(response.data.isAuthenticated);
-        if (response.data.isAuthenticated) {
+        // The server only sends a token when the current one is close to expiring
+        if (response.data.isAuthenticated && response.data.token) {
           localStorage.setItem('token', response.data.token);
         }
       })
@@ -1,6 +1,29 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 
+// Local calendar date as YYYY-MM-DD, the format the API expects
+const today = () => {
+    const now = new Date();
+    return new Date(now.getTime() - now.getTimezoneOffset() * 60000).toISOString().slice(0, 10);
+};
+
+// Fills a datalist with matching names, debounced; returns the effect cleanup
+function suggest(apiUrl, kind, text, setSuggestions) {
+    const token = localStorage.getItem('token');
+    if (!token || !text.trim()) {
+        setSuggestions([]);
+        return undefined;
+    }
+    const timer = setTimeout(() => {
+        axios.get(`${apiUrl}/api/search`, {
+            headers: { Authorization: `Bearer ${token}` },
+            params: { q: text, kind, limit: 8 }
+        })
+        .then(response => setSuggestions(response.data.results.map(result => result.name)))
+        .catch(() => setSuggestions([]));
+    }, 150);
+    return () => clearTimeout(timer);
+}
 
 function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful addition
     const API_URL = 'https://workout-backend-tma6.onrender.com';
@@ -9,6 +32,14 @@ function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful a
     const [sets, setSets] = useState('');
     const [reps, setReps] = useState('');
     const [rest, setRest] = useState('');
+    const [weight, setWeight] = useState('');
+    const [date, setDate] = useState(today());
+    const [exerciseSuggestions, setExerciseSuggestions] = useState([]);
+    const [sessionSuggestions, setSessionSuggestions] = useState([]);
+
+    // Autocomplete from the user's own sessions and exercises, once typing pauses
+    useEffect(() => suggest(API_URL, 'exercise', exercise, setExerciseSuggestions), [exercise]);
+    useEffect(() => suggest(API_URL, 'session', sessionTitle, setSessionSuggestions), [sessionTitle]);
 
     const handleSubmit = (event) => {
         event.preventDefault();
@@ -17,7 +48,9 @@ function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful a
             exercise,
             sets,
             reps,
-            rest
+            rest,
+            weight,
+            date
         };
 
         // Fetch token from local storage
@@ -39,6 +72,8 @@ function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful a
             setSets('');
             setReps('');
             setRest('');
+            setWeight('');
+            setDate(today());
             window.location.reload();
             // Optionally, use state update instead of reloading the page
         })
@@ -56,11 +91,17 @@ function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful a
             <form onSubmit={handleSubmit} className="workout-form">
                 <div className="form-group">
                     <label>Session Title:</label>
-                    <input type="text" value={sessionTitle} onChange={e => setSessionTitle(e.target.value)} required />
+                    <input type="text" list="session-suggestions" value={sessionTitle} onChange={e => setSessionTitle(e.target.value)} required />
+                    <datalist id="session-suggestions">
+                        {sessionSuggestions.map(name => <option key={name} value={name} />)}
+                    </datalist>
                 </div>
                 <div className="form-group">
                     <label>Exercise:</label>
-                    <input type="text" value={exercise} onChange={e => setExercise(e.target.value)} required />
+                    <input type="text" list="exercise-suggestions" value={exercise} onChange={e => setExercise(e.target.value)} required />
+                    <datalist id="exercise-suggestions">
+                        {exerciseSuggestions.map(name => <option key={name} value={name} />)}
+                    </datalist>
                 </div>
                 <div className="form-group">
                     <label>Sets:</label>
@@ -74,6 +115,14 @@ function WorkoutForm({ onAddSuccess }) {  // Added a prop to handle successful a
                     <label>Rest Time (s):</label>
                     <input type="number" value={rest} onChange={e => setRest(e.target.value)} required />
                 </div>
+                <div className="form-group">
+                    <label>Weight (kg):</label>
+                    <input type="number" min="0" step="0.5" value={weight} onChange={e => setWeight(e.target.value)} />
+                </div>
+                <div className="form-group">
+                    <label>Date:</label>
+                    <input type="date" value={date} onChange={e => setDate(e.target.value)} required />
+                </div>
                 <button type="submit" className="btn">Add Workout</button>
             </form>
         </div>
@@ -1,46 +1,166 @@
-import React, { useEffect, useState, useCallback } from 'react';
+import React, { useEffect, useState, useCallback, useRef } from 'react';
 import axios from 'axios';
 import { useNavigate } from 'react-router-dom';
 
 function WorkoutSessions() {
-    const [sessionGroups, setSessionGroups] = useState({});
+    const [sessions, setSessions] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [sessionWorkouts, setSessionWorkouts] = useState({});
+    const [query, setQuery] = useState('');
+    const [matches, setMatches] = useState(null);  // search results, or null when not searching
+    const [streamFrom, setStreamFrom] = useState(null);  // change seq the first page reflects
+    const changeStream = useRef(null);
     const navigate = useNavigate();
-    
-    const fetchWorkouts = useCallback(() => {
+
+    // Session summaries are aggregated on the server; exercises are only
+    // fetched when a session is expanded.
+    const fetchSessions = useCallback((cursor = null) => {
         const token = localStorage.getItem('token'); // Assuming you store the token in local storage
-        axios.get('/api/workouts', {
+        axios.get('/api/sessions', {
           headers: {
             'Authorization': `Bearer ${token}`
+          },
+          params: cursor ? { cursor } : {}
+        })
+        .then(response => {
+          if (cursor) {
+            // Skip sessions a change event already moved onto an earlier page
+            setSessions(prev => [...prev, ...response.data.sessions.filter(
+              session => !prev.some(existing => existing.session_title === session.session_title))]);
+          } else {
+            setSessions(response.data.sessions);
+            setStreamFrom(response.data.change_seq);
           }
+          setNextCursor(response.data.next_cursor);
+        })
+        .catch(error => {
+          console.error('Error fetching sessions:', error);
+        });
+      }, []);
+
+    const fetchSessionWorkouts = useCallback((sessionTitle) => {
+        const token = localStorage.getItem('token');
+        axios.get(`/api/workouts/${encodeURIComponent(sessionTitle)}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
         })
         .then(response => {
-          const grouped = groupWorkoutsBySession(response.data);
-          setSessionGroups(grouped);
+            setSessionWorkouts(prev => ({ ...prev, [sessionTitle]: response.data }));
         })
         .catch(error => {
-          console.error('Error fetching workouts:', error);
+            if (error.response && error.response.status === 404) {
+                // The last exercise was deleted, so the session is gone
+                setSessionWorkouts(prev => {
+                    const { [sessionTitle]: _, ...rest } = prev;
+                    return rest;
+                });
+                return;
+            }
+            console.error('Error fetching session workouts:', error);
         });
-      }, []); // No dependencies, this function doesn't depend on any external values
+    }, []);
 
     useEffect(() => {
-        fetchWorkouts();
-    }, [fetchWorkouts]); // Now fetchWorkouts is stable across renders
-    
-    useEffect(() => {
-        console.log('Session Groups updated:', sessionGroups);
-    }, [sessionGroups]);
+        fetchSessions();
+    }, [fetchSessions]);
 
-    const groupWorkoutsBySession = (workouts) => {
-        const newGroups = {};
-        workouts.forEach((workout) => {
-            if (!newGroups[workout.session_title]) {
-                newGroups[workout.session_title] = [];
-            }
-            newGroups[workout.session_title].push(workout);
+    // Inserts and deletes from this tab or any other device arrive as change
+    // events and are applied in place, so nothing is refetched after a write.
+    const applyChange = useCallback(({ op, workout }) => {
+        const title = workout.session_title;
+        const volume = workout.sets * workout.reps;
+        if (op === 'insert') {
+            setSessions(prev => {
+                const existing = prev.find(session => session.session_title === title);
+                const updated = existing
+                    ? { ...existing, exercise_count: existing.exercise_count + 1,
+                        total_volume: existing.total_volume + volume,
+                        total_rest: existing.total_rest + workout.rest, latest_id: workout.id }
+                    : { session_title: title, exercise_count: 1, total_volume: volume,
+                        total_rest: workout.rest, latest_id: workout.id };
+                // Newest session first, as the server orders them
+                return [updated, ...prev.filter(session => session !== existing)];
+            });
+            setSessionWorkouts(prev => prev[title] && !prev[title].some(w => w.id === workout.id)
+                ? { ...prev, [title]: [...prev[title], workout] }
+                : prev);
+        } else if (op === 'delete') {
+            setSessions(prev => prev
+                .map(session => session.session_title === title
+                    ? { ...session, exercise_count: session.exercise_count - 1,
+                        total_volume: session.total_volume - volume, total_rest: session.total_rest - workout.rest }
+                    : session)
+                .filter(session => session.exercise_count > 0));
+            setSessionWorkouts(prev => {
+                if (!prev[title]) {
+                    return prev;
+                }
+                const remaining = prev[title].filter(w => w.id !== workout.id);
+                if (remaining.length) {
+                    return { ...prev, [title]: remaining };
+                }
+                // The last exercise was deleted, so the session is gone
+                const { [title]: _, ...rest } = prev;
+                return rest;
+            });
+        }
+    }, []);
+
+    useEffect(() => {
+        if (streamFrom === null) {
+            return undefined;
+        }
+        // EventSource can't send an Authorization header, so the token goes in the query string.
+        // On reconnect the browser resumes from the last event id it saw.
+        const token = localStorage.getItem('token');
+        const source = new EventSource(
+            `/api/changes/stream?since=${streamFrom}&jwt=${encodeURIComponent(token)}`);
+        changeStream.current = source;
+        source.onmessage = event => applyChange(JSON.parse(event.data));
+        source.addEventListener('resync', () => {
+            // Too far behind to catch up from the change log; start over
+            source.close();
+            fetchSessions();
         });
-        return newGroups;
+        return () => {
+            source.close();
+            changeStream.current = null;
+        };
+    }, [streamFrom, applyChange, fetchSessions]);
+
+    // A delete normally reaches the list as a change event; while the stream
+    // is down (connecting, or closed for good) refetch instead.
+    const streamIsOpen = () => changeStream.current !== null && changeStream.current.readyState === EventSource.OPEN;
+
+    // Ranked server-side search over session titles instead of paging through them all
+    useEffect(() => {
+        if (!query.trim()) {
+            setMatches(null);
+            return undefined;
+        }
+        const timer = setTimeout(() => {
+            const token = localStorage.getItem('token');
+            axios.get('/api/search', {
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: { q: query, kind: 'session', limit: 20 }
+            })
+            .then(response => setMatches(response.data.results.map(result => result.session).filter(Boolean)))
+            .catch(error => console.error('Error searching sessions:', error));
+        }, 150);
+        return () => clearTimeout(timer);
+    }, [query]);
+
+    const toggleSession = (sessionTitle) => {
+        if (sessionWorkouts[sessionTitle]) {
+            setSessionWorkouts(prev => {
+                const { [sessionTitle]: _, ...rest } = prev;
+                return rest;
+            });
+        } else {
+            fetchSessionWorkouts(sessionTitle);
+        }
     };
-    
 
     const handleStartWorkout = (sessionTitle) => {
         navigate(`/session/${encodeURIComponent(sessionTitle)}`);
@@ -58,7 +178,14 @@ function WorkoutSessions() {
         })
         .then(() => {
             alert('Session deleted successfully');
-            fetchWorkouts();  // Refetch to update the list after deletion
+            setQuery('');
+            if (!streamIsOpen()) {
+                fetchSessions();
+                setSessionWorkouts(prev => {
+                    const { [sessionTitle]: _, ...rest } = prev;
+                    return rest;
+                });
+            }
         })
         .catch(error => {
             console.error('Error deleting session:', error);
@@ -75,7 +202,14 @@ function WorkoutSessions() {
         })
         .then(() => {
             alert('Workout deleted successfully');
-            fetchWorkouts();  // Refetch to update the list after deletion
+            if (!streamIsOpen()) {
+                fetchSessions();
+                const sessionTitle = Object.keys(sessionWorkouts).find(
+                    title => sessionWorkouts[title].some(workout => workout.id === workoutId));
+                if (sessionTitle) {
+                    fetchSessionWorkouts(sessionTitle);
+                }
+            }
         })
         .catch(error => {
             console.error('Error deleting workout:', error);
@@ -86,28 +220,35 @@ function WorkoutSessions() {
     return (
         <section className="sessions">
             <h2><u>WORKOUT SESSIONS</u></h2>
-            {Object.keys(sessionGroups).map((sessionTitle, index) => (
-                <div key={sessionTitle}>
-                <article key={index}>
-                    <h3>{sessionTitle}
-                        <button className="start-session-btn" onClick={() => handleStartWorkout(sessionTitle)}>
+            <input type="search" placeholder="Search sessions" value={query} onChange={e => setQuery(e.target.value)} />
+            {(matches || sessions).map((session) => (
+                <div key={session.session_title}>
+                <article>
+                    <h3 onClick={() => toggleSession(session.session_title)}>{session.session_title}
+                        <button className="start-session-btn" onClick={(e) => { e.stopPropagation(); handleStartWorkout(session.session_title); }}>
                             Start This Workout
                         </button>
-                        <button className="delete-btn" onClick={() => handleDeleteSession(sessionTitle)}>
+                        <button className="delete-btn" onClick={(e) => { e.stopPropagation(); handleDeleteSession(session.session_title); }}>
                             Delete Session
                         </button>
                     </h3>
-                    <ul>
-                        {sessionGroups[sessionTitle].map((workout) => (
-                            <div className="workout_home" key={workout.id}>
-                                <p>{workout.exercise}: Sets: {workout.sets} | Reps: {workout.reps} | Rest: {workout.rest}s</p>
-                                <button className="delete-btn" onClick={() => handleDeleteWorkout(workout.id)}>X</button>
-                            </div>
-                        ))}
-                    </ul>
+                    <p>{session.exercise_count} exercises | Volume: {session.total_volume} reps | Rest: {session.total_rest}s</p>
+                    {sessionWorkouts[session.session_title] && (
+                        <ul>
+                            {sessionWorkouts[session.session_title].map((workout) => (
+                                <div className="workout_home" key={workout.id}>
+                                    <p>{workout.exercise}: Sets: {workout.sets} | Reps: {workout.reps} | Rest: {workout.rest}s</p>
+                                    <button className="delete-btn" onClick={() => handleDeleteWorkout(workout.id)}>X</button>
+                                </div>
+                            ))}
+                        </ul>
+                    )}
                 </article>
                 </div>
             ))}
+            {!matches && nextCursor && (
+                <button className="btn" onClick={() => fetchSessions(nextCursor)}>Load more sessions</button>
+            )}
         </section>
     );
 }
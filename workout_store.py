@@ -0,0 +1,254 @@
+"""Storage for the server-rendered workout flow in app_v1.py.
+
+Workouts are kept per owner, an opaque key. app_v1.py uses ``anon:<token>``
+for a visitor identified only by their session cookie; keys without the
+``anon:`` prefix (e.g. ``user:<id>``, should app_v1 get working logins) are
+kept until deleted.
+Every exercise gets an id when it is added, so deleting one is a single
+keyed delete instead of a list splice, and any gunicorn worker can serve any
+request because nothing lives in process memory.
+
+WORKOUT_STORE_URL picks the backend:
+
+* unset or ``sqlite:...``: tables next to the app's own (``store_owner`` and
+  ``store_exercise``), in the app's database unless the URL names another.
+* ``redis://host:port/db``: one hash per owner in Redis or anything speaking
+  its protocol (KeyDB, Valkey, Dragonfly). Needs the ``redis`` package.
+
+Anonymous owners expire WORKOUT_STORE_ANON_TTL seconds after their last
+visit. The SQLite store also caps them at WORKOUT_STORE_MAX_ANON, dropping
+the least recently seen first; with Redis, per-key TTLs do the expiry and a
+``volatile-lru`` maxmemory policy does the capping.
+"""
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from sqlalchemy import (Column, Float, Index, Integer, MetaData, String, Table, create_engine, delete, func,
+                        insert, select, update)
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// store URLs
+    redis = None
+
+DEFAULT_ANON_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ANON = 10000
+TOUCH_INTERVAL = 60  # seconds between last-seen updates for the same owner
+SWEEP_INTERVAL = 60  # seconds between expiry sweeps in one process
+
+EXERCISE_FIELDS = ('exercise', 'sets', 'reps', 'rest')
+
+
+def is_anonymous(owner):
+    return owner.startswith('anon:')
+
+
+def group_sessions(rows):
+    """[(id, session_title, exercise dict)] in id order -> {title: [exercise, ...]} in first-use order."""
+    sessions = {}
+    for exercise_id, title, exercise in rows:
+        sessions.setdefault(title, []).append(dict(exercise, id=exercise_id))
+    return sessions
+
+
+class WorkoutStore(ABC):
+    """Per-owner workout sessions: ``{session title: [exercise, ...]}``.
+
+    Exercises are dicts with ``id`` plus EXERCISE_FIELDS. ``touch`` is called
+    once per request so anonymous owners stay alive while they are active.
+    A backend missing any of the abstract methods fails when it is created.
+    """
+
+    @abstractmethod
+    def touch(self, owner):
+        """Note that ``owner`` is active, keeping an anonymous owner from expiring."""
+
+    @abstractmethod
+    def sessions(self, owner):
+        """``{session title: [exercise, ...]}`` for ``owner``, sessions in first-use order."""
+
+    def session(self, owner, title):
+        return self.sessions(owner).get(title, [])
+
+    @abstractmethod
+    def add_exercise(self, owner, title, exercise):
+        """Append ``exercise`` to ``title``'s session; returns its id."""
+
+    @abstractmethod
+    def delete_exercise(self, owner, title, exercise_id):
+        """Returns False when there was no such exercise."""
+
+    @abstractmethod
+    def delete_session(self, owner, title):
+        """Returns False when there was no such session."""
+
+
+metadata = MetaData()
+
+store_owner = Table(
+    'store_owner', metadata,
+    Column('key', String(80), primary_key=True),
+    Column('last_seen', Float, nullable=False),
+    Column('expires', Float),  # NULL for owners that aren't anonymous
+    Index('ix_store_owner_expires', 'expires'),
+)
+
+store_exercise = Table(
+    'store_exercise', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('owner', String(80), nullable=False),
+    Column('session_title', String(120), nullable=False),
+    Column('exercise', String(120), nullable=False),
+    Column('sets', Integer, nullable=False),
+    Column('reps', Integer, nullable=False),
+    Column('rest', Integer, nullable=False),
+    Index('ix_store_exercise_owner', 'owner', 'session_title', 'id'),
+)
+
+
+class SQLiteWorkoutStore(WorkoutStore):
+    def __init__(self, engine, anon_ttl=DEFAULT_ANON_TTL, max_anon=DEFAULT_MAX_ANON):
+        self.engine = engine
+        self.anon_ttl = anon_ttl
+        self.max_anon = max_anon
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        metadata.create_all(engine)
+
+    def touch(self, owner):
+        now = time.time()
+        with self.engine.connect() as conn:
+            last_seen = conn.execute(select(store_owner.c.last_seen).where(store_owner.c.key == owner)).scalar()
+        if last_seen is not None and now - last_seen < TOUCH_INTERVAL:
+            return  # reads stay reads; the owner was seen recently enough
+        expires = now + self.anon_ttl if is_anonymous(owner) else None
+        with self.engine.begin() as conn:
+            if last_seen is None:
+                conn.execute(insert(store_owner).prefix_with('OR REPLACE', dialect='sqlite'),
+                             {'key': owner, 'last_seen': now, 'expires': expires})
+            else:
+                conn.execute(update(store_owner).where(store_owner.c.key == owner)
+                             .values(last_seen=now, expires=expires))
+        self._maybe_sweep(now)
+
+    def sessions(self, owner):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(store_exercise).where(store_exercise.c.owner == owner)
+                                .order_by(store_exercise.c.id)).mappings().all()
+        return group_sessions((row['id'], row['session_title'], {name: row[name] for name in EXERCISE_FIELDS})
+                              for row in rows)
+
+    def session(self, owner, title):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(store_exercise).where(store_exercise.c.owner == owner,
+                                                             store_exercise.c.session_title == title)
+                                .order_by(store_exercise.c.id)).mappings().all()
+        return [dict({name: row[name] for name in EXERCISE_FIELDS}, id=row['id']) for row in rows]
+
+    def add_exercise(self, owner, title, exercise):
+        with self.engine.begin() as conn:
+            result = conn.execute(insert(store_exercise).values(
+                owner=owner, session_title=title, **{name: exercise[name] for name in EXERCISE_FIELDS}))
+        return result.inserted_primary_key[0]
+
+    def delete_exercise(self, owner, title, exercise_id):
+        # A primary-key delete; owner and title only guard against other people's ids
+        with self.engine.begin() as conn:
+            result = conn.execute(delete(store_exercise).where(store_exercise.c.id == exercise_id,
+                                                               store_exercise.c.owner == owner,
+                                                               store_exercise.c.session_title == title))
+        return result.rowcount > 0
+
+    def delete_session(self, owner, title):
+        with self.engine.begin() as conn:
+            result = conn.execute(delete(store_exercise).where(store_exercise.c.owner == owner,
+                                                               store_exercise.c.session_title == title))
+        return result.rowcount > 0
+
+    def _maybe_sweep(self, now):
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + SWEEP_INTERVAL
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """Drop expired anonymous owners, then the least recently seen ones beyond max_anon."""
+        now = time.time() if now is None else now
+        with self.engine.begin() as conn:
+            anonymous = store_owner.c.expires.is_not(None)
+            keys = conn.execute(select(store_owner.c.key).where(anonymous, store_owner.c.expires < now)).scalars().all()
+            overflow = conn.execute(select(func.count()).select_from(store_owner).where(anonymous)).scalar() \
+                - len(keys) - self.max_anon
+            if overflow > 0:
+                # expires is last_seen + anon_ttl, so the earliest expiries are the least recently used
+                keys += conn.execute(select(store_owner.c.key).where(anonymous, store_owner.c.expires >= now)
+                                     .order_by(store_owner.c.expires).limit(overflow)).scalars().all()
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                conn.execute(delete(store_exercise).where(store_exercise.c.owner.in_(batch)))
+                conn.execute(delete(store_owner).where(store_owner.c.key.in_(batch)))
+        return len(keys)
+
+
+class RedisWorkoutStore(WorkoutStore):
+    """One hash per owner: field ``next`` is the id counter, ``<id>`` an exercise as JSON."""
+
+    def __init__(self, client, anon_ttl=DEFAULT_ANON_TTL, prefix='workouts:'):
+        self.client = client
+        self.anon_ttl = anon_ttl
+        self.prefix = prefix
+
+    def _key(self, owner):
+        return self.prefix + owner
+
+    def touch(self, owner):
+        if is_anonymous(owner):
+            self.client.expire(self._key(owner), self.anon_ttl)
+
+    def sessions(self, owner):
+        fields = self.client.hgetall(self._key(owner))
+        rows = []
+        for field, value in fields.items():
+            if field != b'next':
+                exercise = json.loads(value)
+                rows.append((int(field), exercise.pop('session_title'), exercise))
+        rows.sort(key=lambda row: row[0])
+        return group_sessions(rows)
+
+    def add_exercise(self, owner, title, exercise):
+        key = self._key(owner)
+        exercise_id = self.client.hincrby(key, 'next', 1)
+        value = dict({name: exercise[name] for name in EXERCISE_FIELDS}, session_title=title)
+        pipe = self.client.pipeline()
+        pipe.hset(key, str(exercise_id), json.dumps(value))
+        if is_anonymous(owner):
+            pipe.expire(key, self.anon_ttl)
+        pipe.execute()
+        return exercise_id
+
+    def delete_exercise(self, owner, title, exercise_id):
+        key = self._key(owner)
+        value = self.client.hget(key, str(exercise_id))
+        if value is None or json.loads(value)['session_title'] != title:
+            return False
+        return self.client.hdel(key, str(exercise_id)) > 0
+
+    def delete_session(self, owner, title):
+        ids = [exercise['id'] for exercise in self.sessions(owner).get(title, [])]
+        return bool(ids) and self.client.hdel(self._key(owner), *map(str, ids)) > 0
+
+
+def open_store(url=None, engine=None, anon_ttl=DEFAULT_ANON_TTL, max_anon=DEFAULT_MAX_ANON):
+    """The store for WORKOUT_STORE_URL; ``engine`` is used when no URL is given."""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError(f'WORKOUT_STORE_URL={url} needs the redis package (pip install redis)')
+        return RedisWorkoutStore(redis.Redis.from_url(url), anon_ttl=anon_ttl)
+    if url:
+        engine = create_engine(url)
+    if engine is None:
+        raise ValueError('open_store needs a WORKOUT_STORE_URL or an engine')
+    return SQLiteWorkoutStore(engine, anon_ttl=anon_ttl, max_anon=max_anon)